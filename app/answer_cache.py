@@ -0,0 +1,76 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from . import metrics
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class AnswerCache:
+    """
+    In-process LRU cache of per-document OCR results and per-field LLM answers.
+
+    Entries are keyed by document hash; answers within an entry are keyed by (model, field_name),
+    so a re-submitted document only needs the LLM for fields that were not answered before.
+    """
+    def __init__(self, max_documents=None, ttl=None):
+        self.max_documents = int(max_documents if max_documents is not None
+                                 else os.getenv('ANSWER_CACHE_MAX_DOCUMENTS', '1000'))
+        self.ttl = float(ttl if ttl is not None else os.getenv('ANSWER_CACHE_TTL', '86400'))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, doc_hash):
+        """Return the live entry for doc_hash (refreshing its LRU position), or None."""
+        entry = self._entries.get(doc_hash)
+        if entry is None:
+            return None
+        if self.ttl > 0 and time.time() - entry["created_at"] > self.ttl:
+            del self._entries[doc_hash]
+            return None
+        self._entries.move_to_end(doc_hash)
+        return entry
+
+    def get_document(self, doc_hash):
+        """Return the cached (extracted_text, confidence) of a document, or None."""
+        with self._lock:
+            entry = self._entry(doc_hash)
+        metrics.CACHE_REQUESTS.inc(cache='document', result='hit' if entry else 'miss')
+        return (entry["text"], entry["confidence"]) if entry else None
+
+    def store_document(self, doc_hash, extracted_text, confidence):
+        with self._lock:
+            entry = self._entry(doc_hash)
+            if entry is None:
+                entry = self._entries[doc_hash] = {"created_at": time.time(), "answers": {}}
+            entry["text"] = extracted_text
+            entry["confidence"] = confidence
+            while len(self._entries) > self.max_documents:
+                self._entries.popitem(last=False)
+
+    def get_answers(self, doc_hash, model, field_names):
+        """Return the cached answers of `model` for the given fields of a document."""
+        with self._lock:
+            entry = self._entry(doc_hash)
+            answers = entry["answers"] if entry else {}
+            found = {name: answers[(model, name)] for name in field_names if (model, name) in answers}
+        metrics.CACHE_REQUESTS.inc(len(found), cache='answers', result='hit')
+        metrics.CACHE_REQUESTS.inc(len(field_names) - len(found), cache='answers', result='miss')
+        return found
+
+    def store_answers(self, doc_hash, model, answers):
+        """Store per-field answers of `model`; ignored if the document is not cached."""
+        with self._lock:
+            entry = self._entry(doc_hash)
+            if entry is None:
+                return
+            for field_name, value in answers.items():
+                entry["answers"][(model, field_name)] = value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -2,8 +2,15 @@ import os
 import json
 import logging
 import importlib
-from flask import Flask, request, jsonify
+from contextlib import nullcontext
+from flask import Flask, Response, request, jsonify
 from flask_swagger_ui import get_swaggerui_blueprint
+from . import tracing, metrics
+from .answer_cache import AnswerCache
+from .pre_extractor import RuleExtractor
+from .uploads import SpooledUpload, check_pages, parse_pages
+from .scheduler import build_scheduler
+from .deadlines import DeadlineExceeded, request_deadline
 
 app = Flask(__name__)
 
@@ -42,8 +49,48 @@ else:
 # Create instances of the selected OCR class
 ocr_instance = OCR()  # Initialize the OCR service
 
+# OCR results and per-field answers of recently processed documents
+answer_cache = AnswerCache()
+
+# Answers fields with fixed label/value layouts (dates, certificate numbers) without the LLM
+pre_extractor = RuleExtractor() if os.getenv('PRE_EXTRACTOR', 'true').lower() == 'true' else None
+
+# Shares OCR and LLM capacity between interactive and bulk traffic, fairly across clients
+scheduler = build_scheduler()
+
+# Response keys that are not answers; a question may not use them as its field_name
+RESERVED_FIELD_NAMES = {"ocr_confidence_score", "field_sources", "timings"}
+
 @app.route('/process-pdf', methods=['POST'])
 def process_pdf():
+    metrics.REQUESTS_IN_PROGRESS.inc()
+    try:
+        with tracing.trace_request() as trace:
+            response, status_code = _process_pdf()
+            error_code = response.get_json(silent=True).get('error_code') if status_code >= 400 else None
+            response.headers['Server-Timing'] = trace.server_timing_header()
+            record = trace.to_log_record(status=status_code, ocr_type=ocr_type, llm_type=llm_type, error_code=error_code)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Request trace: %s", json.dumps(record))
+    finally:
+        metrics.REQUESTS_IN_PROGRESS.dec()
+
+    metrics.REQUESTS.inc(status=status_code)
+    metrics.REQUEST_DURATION.observe(record["total_ms"] / 1000)
+    if error_code is not None:
+        metrics.ERRORS.inc(error_code=error_code)
+    return response, status_code
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Expose throughput, latency, token and cost metrics in the Prometheus text format."""
+    return Response(metrics.REGISTRY.exposition(), content_type=metrics.CONTENT_TYPE)
+
+
+def _process_pdf():
+    # Optional end-to-end deadline; stages give up (error_code 108) once it has passed
+    deadline = request_deadline(request.headers)
     try:
         # **Check if the request contains a file**
         if 'file' not in request.files:
@@ -59,8 +106,8 @@ def process_pdf():
         if not file.filename.lower().endswith('.pdf'):
             return jsonify({"error": "File is not a PDF", "error_code": 101}), 400
 
-        # **Limit the file size (e.g., 5MB = 5 * 1024 * 1024 bytes)**
-        max_file_size = 3 * 1024 * 1024  # 5MB (especially for scanned pdf wich might be 3 to 10 page for 5mb)
+        # **Limit the file size (uploads are spooled to disk, so large scanned bundles are accepted)**
+        max_file_size = int(float(os.getenv('MAX_UPLOAD_SIZE_MB', '50')) * 1024 * 1024)
         file.seek(0, os.SEEK_END)  # Move to the end of the file
         file_size = file.tell()  # Get the current position (which is file size)
         file.seek(0)  # Reset file pointer to the beginning
@@ -72,9 +119,6 @@ def process_pdf():
         if len(request.files) > 1:
             return jsonify({"error": "Only one PDF file can be uploaded at a time", "error_code": 105}), 400
 
-        # **Read the file as raw bytes**
-        file_bytes = file.read()
-
         # Get questions data from request
         questions_data = request.form.get('questions')
         if not questions_data:
@@ -85,35 +129,103 @@ def process_pdf():
         except json.JSONDecodeError:
             return jsonify({"error": "Invalid JSON format in questions data", "error_code": 104}), 400
 
+        # Field names share the top level of the response with the metadata keys
+        reserved = sorted({q.get('field_name') for q in questions} & RESERVED_FIELD_NAMES)
+        if reserved:
+            return jsonify({"error": f"Reserved field_name: {', '.join(reserved)}", "error_code": 110}), 400
+
         # Prepend a predefined text to each question
         for question in questions:
             question['question'] = f"Who is the {question['question']}"
 
+        # Optional page selection, e.g. "1-3,5"
+        try:
+            pages = parse_pages(request.values.get('pages'))
+        except ValueError as e:
+            return jsonify({"error": str(e), "error_code": 109}), 400
+
+        # **Spool the upload to disk in chunks; the OCR engines read it from there**
+        upload = SpooledUpload(file.stream)
+        try:
+            try:
+                check_pages(pages, upload)
+            except ValueError as e:
+                return jsonify({"error": str(e), "error_code": 109}), 400
+            return _answer_questions(upload, questions, pages, deadline)
+        finally:
+            upload.close()
+
+    except DeadlineExceeded as e:
+        logger.warning("%s after %.1fs", e, deadline.timeout)
+        return jsonify({"error": str(e), "error_code": 108}), 504
+    except Exception as e:
+        logger.error(f"An error occurred: {e}")
+        return jsonify({"error": str(e), "error_code": 500}), 500
+
+
+def _answer_questions(upload, questions, pages, deadline=None):
+    """Run OCR (unless cached), the rule pre-extractor and the LLM for a spooled upload."""
+    priority, client = scheduler.classify(request.headers, request.values, request.remote_addr) if scheduler else (None, None)
+
+    def stage_slot(stage):
+        return scheduler.slot(stage, priority, client, deadline=deadline) if scheduler else nullcontext()
+
+    # Reuse the OCR result and the answers already given for this document (and page selection)
+    doc_hash = upload.sha256 if not pages else f"{upload.sha256}:pages={','.join(map(str, pages))}"
+    cached_answers = answer_cache.get_answers(doc_hash, llm_instance.model_id, [q['field_name'] for q in questions])
+    pending_questions = [q for q in questions if q['field_name'] not in cached_answers]
+
+    cached_document = answer_cache.get_document(doc_hash)
+    if cached_document:
+        extracted_text, average_confidence_score = cached_document
+    else:
         # Use the selected OCR service to extract text and confidence score from the PDF
-        extracted_text, average_confidence_score = ocr_instance.extract_text_from_pdf(file_bytes)
+        with stage_slot("ocr"), tracing.span("ocr"):
+            extracted_text, average_confidence_score = ocr_instance.extract_text_from_pdf(upload, pages=pages, deadline=deadline)
         if not extracted_text:
             return jsonify({"error": "No text extracted from the document", "error_code": 103}), 500
-
+        answer_cache.store_document(doc_hash, extracted_text, average_confidence_score)
+
+    # Resolve easy fields locally before falling back to the LLM
+    rule_answers = {}
+    if pre_extractor and pending_questions:
+        with tracing.span("pre_extract"):
+            rule_answers = pre_extractor.extract(extracted_text, pending_questions)
+        pending_questions = [q for q in pending_questions if q['field_name'] not in rule_answers]
+
+    # Only ask the LLM for the fields that are not answered yet
+    llm_response = {}
+    if pending_questions:
         # Dynamically call the appropriate method based on LLM_TYPE
-        if llm_type == 'claude':
-            llm_response = llm_instance.query_claude(extracted_text, questions)
-        elif llm_type == 'mistral':
-            llm_response = llm_instance.query_mistral(extracted_text, questions)
-        elif llm_type == 'gpt4':
-            llm_response = llm_instance.query_gpt4(extracted_text, questions)
-        else:
-            return jsonify({"error": f"Unsupported LLM_TYPE: {llm_type}", "error_code": 107}), 400
-
-        
-        llm_response.update({"ocr_confidence_score": average_confidence_score})
-        response_payload = llm_response
-
+        with stage_slot("llm"), tracing.span("llm"):
+            if llm_type == 'claude':
+                llm_response = llm_instance.query_claude(extracted_text, pending_questions, deadline=deadline)
+            elif llm_type == 'mistral':
+                llm_response = llm_instance.query_mistral(extracted_text, pending_questions, deadline=deadline)
+            elif llm_type == 'gpt4':
+                llm_response = llm_instance.query_gpt4(extracted_text, pending_questions, deadline=deadline)
+            else:
+                return jsonify({"error": f"Unsupported LLM_TYPE: {llm_type}", "error_code": 107}), 400
+        answer_cache.store_answers(doc_hash, llm_instance.model_id, {
+            q['field_name']: llm_response[q['field_name']] for q in pending_questions if q['field_name'] in llm_response
+        })
+
+    llm_response.update(cached_answers)
+    llm_response.update(rule_answers)
+    llm_response.update({"ocr_confidence_score": average_confidence_score})
+    response_payload = llm_response
+    # Fields the LLM (or the JSON repair) did not return are reported as missing, not as answered
+    response_payload["field_sources"] = {
+        q['field_name']: 'cache' if q['field_name'] in cached_answers else 'rules' if q['field_name'] in rule_answers
+        else 'llm' if q['field_name'] in llm_response else 'missing'
+        for q in questions
+    }
 
-        return jsonify(response_payload), 200
+    # Optionally include per-stage durations, token and retry counts in the response
+    if request.values.get('timings', '').lower() in ('1', 'true', 'yes'):
+        response_payload["timings"] = tracing.current_trace().timings()
 
-    except Exception as e:
-        logger.error(f"An error occurred: {e}")
-        return jsonify({"error": str(e), "error_code": 500}), 500
+    return jsonify(response_payload), 200
 
 
 # Swagger UI setup
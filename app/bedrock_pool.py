@@ -0,0 +1,178 @@
+import os
+import time
+import logging
+import threading
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+from .cassettes import boto3_client
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Error codes that mean "this region is saturated", worth retrying elsewhere
+THROTTLING_ERROR_CODES = {
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'ServiceUnavailableException',
+    'ModelNotReadyException',
+}
+
+# Connection failures and timeouts, retried by botocore with a single region and failed over otherwise
+TRANSIENT_ERRORS = (ConnectionError, HTTPClientError)
+
+
+class RegionStats:
+    """
+    Recent latency, error and throttling statistics for one region's client.
+    """
+    def __init__(self, region_name, client, smoothing=0.3):
+        self.region_name = region_name
+        self.client = client
+        self.smoothing = smoothing
+        self.latency = None  # Exponentially weighted moving average, in seconds
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.consecutive_throttles = 0
+        self.cooldown_until = 0.0
+        self.calls = 0
+        self.throttles = 0
+        self.errors = 0
+
+    def record_latency(self, seconds):
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency = self.smoothing * seconds + (1 - self.smoothing) * self.latency
+
+    def record_outcome(self, failed):
+        self.error_rate = self.smoothing * (1.0 if failed else 0.0) + (1 - self.smoothing) * self.error_rate
+
+    def score(self, default_latency):
+        """Lower is better: expected latency scaled by queued work and recent failures."""
+        latency = self.latency if self.latency is not None else default_latency
+        return latency * (1 + self.in_flight) * (1 + 4 * self.error_rate)
+
+    def snapshot(self):
+        return {
+            "region": self.region_name,
+            "latency": self.latency,
+            "error_rate": round(self.error_rate, 4),
+            "in_flight": self.in_flight,
+            "cooling_down": self.cooldown_until > time.monotonic(),
+            "calls": self.calls,
+            "throttles": self.throttles,
+            "errors": self.errors,
+        }
+
+
+class BedrockClientPool:
+    """
+    A pool of `bedrock-runtime` clients spread across several regions.
+
+    Each `invoke_model` call is routed to the region with the lowest recent latency,
+    in-flight load and error rate. Throttled regions are put on an exponential cooldown
+    and the call fails over to the next best region.
+    """
+    def __init__(self, regions=None, max_pool_connections=None, throttle_cooldown=None):
+        if regions is None:
+            configured = os.getenv('BEDROCK_REGIONS') or os.getenv('AWS_REGION', 'eu-west-3')
+            regions = [region.strip() for region in configured.split(',') if region.strip()]
+        if not regions:
+            raise ValueError("At least one Bedrock region must be configured")
+
+        if max_pool_connections is None:
+            max_pool_connections = int(os.getenv('BEDROCK_MAX_POOL_CONNECTIONS', '50'))
+        self.throttle_cooldown = float(throttle_cooldown if throttle_cooldown is not None
+                                       else os.getenv('BEDROCK_THROTTLE_COOLDOWN', '5'))
+        self.default_latency = 1.0
+
+        # Keep connections warm. With several regions the pool, not botocore, handles throttling and
+        # transient failures by failing over; a single region keeps botocore's retries with backoff
+        self.client_config = Config(
+            max_pool_connections=max_pool_connections,
+            tcp_keepalive=True,
+            connect_timeout=5,
+            read_timeout=300,
+            retries={'total_max_attempts': 1 if len(regions) > 1 else int(os.getenv('BEDROCK_MAX_ATTEMPTS', '3')),
+                     'mode': 'standard'},
+        )
+
+        self._lock = threading.Lock()
+        self.regions = [
+            RegionStats(region, boto3_client('bedrock-runtime', region_name=region, config=self.client_config))
+            for region in regions
+        ]
+
+    @property
+    def region_name(self):
+        return self.regions[0].region_name
+
+    def _ranked_regions(self):
+        """Regions ordered best first, with regions cooling down after a throttle last."""
+        now = time.monotonic()
+        with self._lock:
+            return sorted(
+                self.regions,
+                key=lambda stats: (stats.cooldown_until > now, stats.cooldown_until if stats.cooldown_until > now else 0,
+                                   stats.score(self.default_latency)),
+            )
+
+    def invoke_model(self, **kwargs):
+        """
+        Invoke a Bedrock model in the best available region, failing over on throttling and
+        connection failures.
+        """
+        last_error = None
+        for stats in self._ranked_regions():
+            with self._lock:
+                stats.in_flight += 1
+                stats.calls += 1
+            start = time.monotonic()
+            try:
+                response = stats.client.invoke_model(**kwargs)
+            except ClientError as e:
+                error_code = e.response.get('Error', {}).get('Code')
+                with self._lock:
+                    stats.in_flight -= 1
+                    stats.record_outcome(failed=True)
+                    if error_code in THROTTLING_ERROR_CODES:
+                        stats.throttles += 1
+                        stats.consecutive_throttles += 1
+                        cooldown = min(self.throttle_cooldown * 2 ** (stats.consecutive_throttles - 1), 60)
+                        stats.cooldown_until = time.monotonic() + cooldown
+                    else:
+                        stats.errors += 1
+                if error_code not in THROTTLING_ERROR_CODES:
+                    raise
+                logger.warning(f"Bedrock throttled in {stats.region_name} ({error_code}), trying next region.")
+                last_error = e
+                continue
+            except TRANSIENT_ERRORS as e:
+                with self._lock:
+                    stats.in_flight -= 1
+                    stats.errors += 1
+                    stats.record_outcome(failed=True)
+                logger.warning(f"Bedrock call failed in {stats.region_name} ({e}), trying next region.")
+                last_error = e
+                continue
+            except Exception:
+                with self._lock:
+                    stats.in_flight -= 1
+                    stats.errors += 1
+                    stats.record_outcome(failed=True)
+                raise
+
+            with self._lock:
+                stats.in_flight -= 1
+                stats.consecutive_throttles = 0
+                stats.record_latency(time.monotonic() - start)
+                stats.record_outcome(failed=False)
+            return response
+
+        raise last_error
+
+    def stats(self):
+        """Return a snapshot of per-region statistics."""
+        with self._lock:
+            return [stats.snapshot() for stats in self.regions]
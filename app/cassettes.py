@@ -0,0 +1,388 @@
+import io
+import os
+import glob
+import gzip
+import json
+import time
+import atexit
+import base64
+import hashlib
+import logging
+import datetime
+import threading
+from collections import OrderedDict
+import boto3
+import httpx
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+from . import tracing
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RECORD_MODES = ('off', 'record', 'replay')
+
+# Client operations that reach a provider; everything else is passed through to the real client
+BOTO3_OPERATIONS = {
+    's3': ('upload_file', 'put_object'),
+    'textract': ('analyze_document', 'detect_document_text'),
+    'bedrock-runtime': ('invoke_model',),
+}
+
+# Uploaded S3 objects remembered to fingerprint the OCR calls that read them; the oldest are forgotten
+MAX_TRACKED_OBJECTS = 1024
+
+# Response headers that no longer apply once the body has been read and decoded
+_STALE_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding'}
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode when no recorded response matches a provider call."""
+
+
+class ReplayedError(Exception):
+    """A recorded provider failure that has no more specific exception type to replay."""
+
+
+def _digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _canonical(value):
+    """JSON-serializable form of call arguments, with binary payloads replaced by their digest."""
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, (bytes, bytearray)):
+        return {"sha256": _digest(bytes(value))}
+    if hasattr(type(value), 'serialize') and hasattr(type(value), 'pb'):  # proto-plus messages
+        return {"sha256": _digest(type(value).serialize(value))}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def fingerprint(provider, operation, params):
+    """Stable hash identifying a provider call by its operation and (canonicalized) arguments."""
+    payload = json.dumps([provider, operation, _canonical(params)], sort_keys=True, separators=(',', ':'))
+    return _digest(payload.encode('utf-8'))
+
+
+def _encode(value):
+    """Make a provider response JSON-serializable; bodies are read and stored base64-encoded."""
+    if isinstance(value, dict):
+        return {key: _encode(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    if isinstance(value, StreamingBody):
+        value = value.read()
+    if isinstance(value, (bytes, bytearray)):
+        return {"__bytes__": base64.b64encode(bytes(value)).decode('ascii')}
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def _decode(value):
+    """Inverse of _encode; recorded bodies come back as fresh StreamingBody objects."""
+    if isinstance(value, dict):
+        if set(value) == {"__bytes__"}:
+            data = base64.b64decode(value["__bytes__"])
+            return StreamingBody(io.BytesIO(data), len(data))
+        return {key: _decode(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode(item) for item in value]
+    return value
+
+
+class Cassette:
+    """
+    Gzip JSON-lines file of provider calls: one record per call with the operation, a request
+    fingerprint, the measured latency and the response (or error).
+
+    In record mode records are appended as calls complete. In replay mode responses are served
+    by fingerprint, in recorded order for repeated identical calls (the last one is then reused),
+    after sleeping for the recorded latency multiplied by `latency_scale` (0 disables the delay).
+
+    Args:
+        path (str): Cassette file; `{pid}` is replaced by the process id when recording, and
+            matches any recording when replaying (e.g. one file per gunicorn worker).
+        mode (str): 'record' or 'replay'.
+        latency_scale (float): Multiplier applied to recorded latencies on replay.
+    """
+    def __init__(self, path, mode, latency_scale=1.0):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Cassette mode must be 'record' or 'replay', got {mode!r}")
+        self.mode = mode
+        self.latency_scale = float(latency_scale)
+        self._objects = OrderedDict()  # (bucket, key) -> digest of uploaded content, to fingerprint OCR calls
+        self._lock = threading.Lock()
+        self._file = None
+        self._records = {}
+        if mode == 'record':
+            self.path = path.replace('{pid}', str(os.getpid()))
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = gzip.open(self.path, 'at', encoding='utf-8')
+            atexit.register(self.close)
+            logger.info("Recording provider calls to %s", self.path)
+        else:
+            self.path = path
+            self._load(sorted(glob.glob(path.replace('{pid}', '*'))) or [path])
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    def _load(self, paths):
+        count = 0
+        for path in paths:
+            with gzip.open(path, 'rt', encoding='utf-8') as cassette_file:
+                for line in cassette_file:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    key = (record["provider"], record["operation"], record["fingerprint"])
+                    self._records.setdefault(key, {"served": 0, "records": []})["records"].append(record)
+                    count += 1
+        logger.info("Loaded %d recorded provider calls from %s", count, ", ".join(paths))
+
+    def record(self, provider, operation, key, latency, response=None, error=None):
+        record = {"provider": provider, "operation": operation, "fingerprint": key,
+                  "latency": round(latency, 6), "recorded_at": time.time()}
+        if error is not None:
+            record["error"] = error
+        else:
+            record["response"] = response
+        line = json.dumps(record, separators=(',', ':'), default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def remember_object(self, bucket, key, content):
+        """Note the digest of an uploaded S3 object, keeping only the most recent uploads."""
+        with self._lock:
+            self._objects[(bucket, key)] = content
+            self._objects.move_to_end((bucket, key))
+            while len(self._objects) > MAX_TRACKED_OBJECTS:
+                self._objects.popitem(last=False)
+
+    def object_content(self, bucket, key):
+        """Digest of the content uploaded under bucket/key, or None if unknown."""
+        with self._lock:
+            return self._objects.get((bucket, key))
+
+    def take(self, provider, operation, key):
+        """Return the next recorded call matching the fingerprint; raises CassetteMiss if none."""
+        with self._lock:
+            entry = self._records.get((provider, operation, key))
+            if entry is None:
+                tracing.add_count("replay.misses")
+                raise CassetteMiss(f"No recorded {provider}.{operation} call with fingerprint {key}")
+            record = entry["records"][min(entry["served"], len(entry["records"]) - 1)]
+            entry["served"] += 1
+        delay = record["latency"] * self.latency_scale
+        if delay > 0:
+            time.sleep(delay)
+        tracing.add_count("replay.calls")
+        return record
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class Boto3Codec:
+    """Fingerprints and (de)serializes boto3 client calls."""
+    def request_params(self, operation, kwargs, cassette):
+        params = dict(kwargs)
+        if operation == 'upload_file':
+            # Temp file names and keys (per-request prefixes) differ between runs; identify the upload by its content
+            with open(params.pop('Filename'), 'rb') as upload:
+                content = _digest(upload.read())
+            cassette.remember_object(params.get('Bucket'), params.pop('Key', None), content)
+            params['Content'] = content
+        elif operation == 'put_object' and isinstance(params.get('Body'), (bytes, bytearray)):
+            cassette.remember_object(params.get('Bucket'), params.pop('Key', None), _digest(bytes(params['Body'])))
+        s3_object = (params.get('Document') or {}).get('S3Object')
+        if s3_object:
+            # Keys are unique per request; what Textract reads is the uploaded content
+            content = cassette.object_content(s3_object.get('Bucket'), s3_object.get('Name'))
+            if content:
+                params['Document'] = dict(params['Document'], S3Object={"Content": content})
+        return params
+
+    def encode_response(self, response):
+        return _encode(response)
+
+    def decode_response(self, recorded):
+        return _decode(recorded)
+
+    def encode_error(self, error):
+        if isinstance(error, ClientError):
+            return {"type": "ClientError", "response": _encode(error.response), "operation": error.operation_name}
+        return {"type": type(error).__name__, "message": str(error)}
+
+    def decode_error(self, recorded):
+        if recorded["type"] == "ClientError":
+            return ClientError(_decode(recorded["response"]), recorded["operation"])
+        return ReplayedError(f"{recorded['type']}: {recorded['message']}")
+
+
+class ProtoCodec(Boto3Codec):
+    """Fingerprints and (de)serializes calls returning proto-plus messages (Document AI)."""
+    ignored_params = ('timeout', 'retry', 'metadata')
+
+    def __init__(self, response_type):
+        self.response_type = response_type
+
+    def request_params(self, operation, kwargs, cassette):
+        return {key: value for key, value in kwargs.items() if key not in self.ignored_params}
+
+    def encode_response(self, response):
+        return self.response_type.to_json(response)
+
+    def decode_response(self, recorded):
+        return self.response_type.from_json(recorded)
+
+
+class RecordedClient:
+    """
+    Wraps a provider client so that the listed operations are recorded to, or replayed from,
+    a cassette. In replay mode the real client is never created or called.
+    """
+    def __init__(self, provider, client, operations, codec, cassette):
+        self._provider = provider
+        self._client = client
+        self._operations = set(operations)
+        self._codec = codec
+        self._cassette = cassette
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name not in self._operations:
+            if self._client is None:
+                raise AttributeError(f"{name} is not available on a replayed {self._provider} client")
+            return getattr(self._client, name)
+
+        def call(*args, **kwargs):
+            return self._call(name, args, kwargs)
+        return call
+
+    def _call(self, operation, args, kwargs):
+        params = self._codec.request_params(operation, kwargs, self._cassette)
+        key = fingerprint(self._provider, operation, {"args": list(args), "kwargs": params})
+
+        if self._cassette.replaying:
+            record = self._cassette.take(self._provider, operation, key)
+            if "error" in record:
+                raise self._codec.decode_error(record["error"])
+            return self._codec.decode_response(record["response"])
+
+        started = time.perf_counter()
+        try:
+            response = getattr(self._client, operation)(*args, **kwargs)
+        except Exception as e:
+            self._cassette.record(self._provider, operation, key, time.perf_counter() - started,
+                                  error=self._codec.encode_error(e))
+            raise
+        latency = time.perf_counter() - started
+        recorded = self._codec.encode_response(response)
+        self._cassette.record(self._provider, operation, key, latency, response=recorded)
+        # Hand back the decoded copy: bodies have been consumed, and callers see what replay will return
+        return self._codec.decode_response(recorded)
+
+
+class RecordingTransport(httpx.BaseTransport):
+    """
+    httpx transport recording or replaying HTTP exchanges (used for the OpenAI API through
+    ChatOpenAI's http_client). Requests are fingerprinted by method, path and JSON body.
+    """
+    def __init__(self, cassette, provider='openai', transport=None):
+        self.cassette = cassette
+        self.provider = provider
+        self.transport = transport if transport is not None or cassette.replaying else httpx.HTTPTransport()
+
+    def _fingerprint(self, request):
+        body = request.read()
+        try:
+            body = json.loads(body) if body else None
+        except ValueError:
+            body = {"sha256": _digest(body)}
+        return fingerprint(self.provider, request.method, {"path": request.url.path, "body": body})
+
+    def handle_request(self, request):
+        key = self._fingerprint(request)
+        if self.cassette.replaying:
+            record = self.cassette.take(self.provider, request.method, key)["response"]
+            return httpx.Response(record["status"], headers=record["headers"],
+                                  content=base64.b64decode(record["content"]), request=request)
+
+        started = time.perf_counter()
+        response = self.transport.handle_request(request)
+        try:
+            content = response.read()
+        finally:
+            response.close()
+        headers = {name: value for name, value in response.headers.items() if name.lower() not in _STALE_HEADERS}
+        self.cassette.record(self.provider, request.method, key, time.perf_counter() - started, response={
+            "status": response.status_code,
+            "headers": headers,
+            "content": base64.b64encode(content).decode('ascii'),
+        })
+        return httpx.Response(response.status_code, headers=headers, content=content, request=request)
+
+    def close(self):
+        if self.transport is not None:
+            self.transport.close()
+
+
+def build_cassette():
+    """Return a Cassette configured from the environment, or None when PROVIDER_RECORD_MODE is off."""
+    mode = os.getenv('PROVIDER_RECORD_MODE', 'off').lower()
+    if mode not in RECORD_MODES:
+        raise ValueError(f"PROVIDER_RECORD_MODE must be one of {', '.join(RECORD_MODES)}, got {mode!r}")
+    if mode == 'off':
+        return None
+    # One file per process by default, so gunicorn workers never append to the same gzip stream
+    return Cassette(os.getenv('PROVIDER_CASSETTE', 'cassettes/providers_{pid}.jsonl.gz'), mode,
+                    latency_scale=os.getenv('PROVIDER_REPLAY_LATENCY_SCALE', '1.0'))
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def active_cassette():
+    """Return the process-wide cassette (built on first use), or None when recording is off."""
+    global _cassette
+    if os.getenv('PROVIDER_RECORD_MODE', 'off').lower() == 'off':
+        return None
+    with _cassette_lock:
+        if _cassette is None:
+            _cassette = build_cassette()
+        return _cassette
+
+
+def recorded_client(provider, factory, operations, codec=None, cassette=None):
+    """
+    Return factory() wrapped for record/replay, or the plain client when recording is off.
+    """
+    cassette = cassette if cassette is not None else active_cassette()
+    if cassette is None:
+        return factory()
+    client = None if cassette.replaying else factory()
+    return RecordedClient(provider, client, operations, codec or Boto3Codec(), cassette)
+
+
+def boto3_client(service_name, **kwargs):
+    """boto3.client() with provider calls recorded or replayed according to PROVIDER_RECORD_MODE."""
+    return recorded_client(service_name, lambda: boto3.client(service_name, **kwargs), BOTO3_OPERATIONS[service_name])
+
+
+def openai_http_client():
+    """httpx client for ChatOpenAI when recording or replaying, otherwise None (the default client)."""
+    cassette = active_cassette()
+    return httpx.Client(transport=RecordingTransport(cassette)) if cassette is not None else None
@@ -0,0 +1,59 @@
+import os
+import time
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(BaseException):
+    """
+    Raised when a request runs out of time in a pipeline stage.
+
+    Like asyncio.CancelledError it derives from BaseException, so the broad `except Exception`
+    handlers of the OCR and LLM stages let it through to the API, which answers with error_code 108.
+    """
+    def __init__(self, stage):
+        super().__init__(f"Request deadline exceeded during {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    """Point in time by which a request must be answered."""
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    def remaining(self):
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+    def allows(self, seconds):
+        """Whether work expected to take `seconds` can still finish in time."""
+        return self.remaining() > seconds
+
+    def check(self, stage):
+        if self.expired():
+            raise DeadlineExceeded(stage)
+
+
+def request_deadline(headers, default_timeout=None):
+    """
+    Build the deadline of a request from the X-Request-Timeout header (seconds), capped by
+    REQUEST_TIMEOUT. Returns None when neither is set (0 disables the default).
+    """
+    default_timeout = float(default_timeout if default_timeout is not None else os.getenv('REQUEST_TIMEOUT', '0'))
+    timeout = default_timeout or None
+    header = headers.get('X-Request-Timeout')
+    if header:
+        try:
+            requested = float(header)
+        except ValueError:
+            logger.warning("Ignoring invalid X-Request-Timeout header: %r", header)
+        else:
+            if requested > 0:
+                timeout = min(requested, timeout) if timeout else requested
+    return Deadline(timeout) if timeout else None
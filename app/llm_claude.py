@@ -2,9 +2,14 @@ import os
 import json
 import logging
 import time
-import boto3
 import re
 from botocore.exceptions import ClientError
+from .bedrock_pool import BedrockClientPool
+from . import tracing, metrics
+from .log_utils import log_payload
+from .structured_output import TOOL_NAME, build_claude_tool
+from .prompt_builder import PLACEHOLDER, PromptBuilder
+from .deadlines import DeadlineExceeded
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -13,13 +18,21 @@ logger = logging.getLogger(__name__)
 class ClaudeBedrockAPI:
     def __init__(self):
         self.model_id = 'anthropic.claude-3-sonnet-20240229-v1:0'
-        self.region_name = os.getenv('AWS_REGION', 'eu-west-3')
-        self.bedrock_client = boto3.client('bedrock-runtime', region_name=self.region_name)
+        # Calls are spread across the regions in BEDROCK_REGIONS (defaults to AWS_REGION)
+        self.bedrock_client = BedrockClientPool()
+        self.region_name = self.bedrock_client.region_name
 
         # Cost per token (Claude 3 Sonnet pricing)
         self.cost_per_input_token = 0.0025 / 1000  # $0.0025 per 1K input tokens
         self.cost_per_output_token = 0.015 / 1000  # $0.015 per 1K output tokens
 
+        # Ask Claude for schema-constrained output through tool use instead of free text
+        self.structured_output = os.getenv('STRUCTURED_OUTPUT', 'true').lower() == 'true'
+
+        # Prompt templates compiled per question set, with token counting and input budget
+        self.prompt_builder = PromptBuilder(self.model_id, self._render_prompt)
+        self.system_prompt = "You are given the extracted text from a document. Answer the questions in JSON format."
+
     def validate_json(self, response_text):
         """Validate and parse JSON response, removing markdown if necessary."""
         try:
@@ -32,11 +45,18 @@ class ClaudeBedrockAPI:
             logger.error(f"Invalid JSON response: {e}")
             return None
 
-    def query_claude(self, extracted_text, questions, prefilled_response=None, max_retries=3, retry_delay=2):
-        """Query Claude with extracted text and questions, logging the cost."""
-        question_instructions = ", ".join([f'"{q["field_name"]}": "{q["question"]}"' for q in questions])
+    def extract_answer(self, response_body):
+        """Extract the answer object from a Claude response, preferring tool_use input over text."""
+        content = response_body.get('content') or [{}]
+        for block in content:
+            if block.get('type') == 'tool_use' and block.get('name') == TOOL_NAME:
+                return block.get('input')
+        return self.validate_json(content[0].get('text', '').strip())
 
-        system_prompt = "You are given the extracted text from a document. Answer the questions in JSON format."
+    def _render_prompt(self, questions):
+        """Render the user message template for a question set, leaving a placeholder for the document."""
+        question_instructions = ", ".join([f'"{q["field_name"]}": "{q["question"]}"' for q in questions])
+        extracted_text = PLACEHOLDER
 
         json_prefill = """
         {
@@ -73,45 +93,75 @@ class ClaudeBedrockAPI:
         {json_prefill}
         ```
         """
+        return user_message_content
+
+    def query_claude(self, extracted_text, questions, prefilled_response=None, max_retries=3, retry_delay=2,
+                     deadline=None):
+        """Query Claude with extracted text and questions, logging the cost."""
+        system_prompt = self.system_prompt
+
+        # A forced tool call cannot be combined with an assistant prefill
+        tools = [build_claude_tool(questions)] if self.structured_output and not prefilled_response else None
+
+        # Reserve room for the system prompt and tool schema, then fit the document into the budget
+        reserved_tokens = self.prompt_builder.counter.count(system_prompt + (json.dumps(tools) if tools else ""))
+        user_message_content, estimated_input_tokens = self.prompt_builder.build(extracted_text, questions, reserved_tokens)
+        estimated_input_tokens += reserved_tokens
 
         messages = [{"role": "user", "content": user_message_content}]
 
         if prefilled_response:
             messages.append({"role": "assistant", "content": prefilled_response})
 
-        body = json.dumps({
+        request = {
             "anthropic_version": 'bedrock-2023-05-31',
             "system": system_prompt,
             "messages": messages,
             "max_tokens": 8000
-        })
+        }
+
+        if tools:
+            request["tools"] = tools
+            request["tool_choice"] = {"type": "tool", "name": TOOL_NAME}
+
+        body = json.dumps(request)
 
         attempt = 0
         while attempt < max_retries:
+            if deadline:
+                deadline.check("llm")
+            attempt_started = time.monotonic()
+            if attempt > 0:
+                tracing.add_count("llm.retries")
+                metrics.LLM_RETRIES.inc(provider='claude')
             try:
-                response = self.bedrock_client.invoke_model(
-                    modelId=self.model_id,
-                    body=body,
-                    contentType='application/json',
-                    accept='application/json'
-                )
-
-                response_body = json.loads(response.get('body').read())
-                logger.info(f"Claude Full Response: {response_body}")
+                with tracing.span("llm.claude"):
+                    response = self.bedrock_client.invoke_model(
+                        modelId=self.model_id,
+                        body=body,
+                        contentType='application/json',
+                        accept='application/json'
+                    )
+                    response_body = json.loads(response.get('body').read())
+                log_payload(logger, "Claude Full Response", response_body)
 
                 # Extract token usage safely
                 input_tokens = response_body.get("usage", {}).get("input_tokens", 0)
                 output_tokens = response_body.get("usage", {}).get("output_tokens", 0)
+                tracing.add_count("llm.input_tokens", input_tokens)
+                # Refine the local token estimate with the measured count
+                self.prompt_builder.counter.calibrate(estimated_input_tokens, input_tokens)
+                tracing.add_count("llm.output_tokens", output_tokens)
 
                 # Calculate cost based on Sonnet pricing
                 total_cost = (input_tokens * self.cost_per_input_token) + (output_tokens * self.cost_per_output_token)
+                metrics.record_llm_usage('claude', input_tokens, output_tokens, total_cost)
 
                 # Log token usage and cost
-                logger.info(f"Tokens Used: Input={input_tokens}, Output={output_tokens} | Estimated Cost: ${total_cost:.6f}")
+                logger.info("Tokens Used: Input=%d, Output=%d | Estimated Cost: $%.6f", input_tokens, output_tokens, total_cost)
 
                 # Extract and validate JSON response
-                result = response_body.get('content', [{}])[0].get('text', '').strip()
-                validated_json = self.validate_json(result)
+                validated_json = self.extract_answer(response_body)
                 if validated_json:
                     return validated_json
                 else:
@@ -122,6 +172,10 @@ class ClaudeBedrockAPI:
             
             attempt += 1
             if attempt < max_retries:
+                # Skip a retry that cannot finish before the request deadline
+                if deadline and not deadline.allows(retry_delay + time.monotonic() - attempt_started):
+                    logger.warning("Not retrying: %.1fs left before the request deadline", deadline.remaining())
+                    raise DeadlineExceeded("llm")
                 time.sleep(retry_delay)
 
         logger.error("Max retries reached. Failed to get a valid response.")
@@ -1,41 +1,24 @@
+import os
 import logging
+import threading
+from collections import OrderedDict
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain.output_parsers.json import SimpleJsonOutputParser
+from langchain_community.callbacks import get_openai_callback
+from .structured_output import build_openai_response_format
+from . import tracing, metrics
+from .log_utils import log_payload
+from .prompt_builder import PLACEHOLDER, PromptBuilder
+from .deadlines import DeadlineExceeded
+from .cassettes import openai_http_client
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class GPT4LLM:
-    def __init__(self, api_key):
-        """
-        Initialize the OpenAI GPT-4 LLM via LangChain with the provided API key.
-        """
-        self.model = ChatOpenAI(
-            api_key=api_key, 
-            model="gpt-4o",  # Using GPT-4 via LangChain
-            temperature=0.5,
-            model_kwargs={"response_format": {"type": "json_object"}}
-        )
-
-    def query_gpt4(self, extracted_text, questions):
-        """
-        Query GPT-4 using LangChain's pipeline, ensuring JSON structured output.
-        
-        Args:
-            extracted_text (str): The text extracted from the document.
-            questions (list): List of questions to ask based on the text.
-
-        Returns:
-            dict: A JSON object with structured answers.
-        """
-        # Format questions into a prompt
-        question_instructions = ", ".join([f'"{q["field_name"]}": "{q["question"]}"' for q in questions])
-
-        # Create a prompt template including an example
-        prompt_template = ChatPromptTemplate.from_template(
-            """
+# Prompt template including an example answer
+PROMPT_TEMPLATE = """
             You are given the extracted text from a document. 
             Please answer the following questions in a JSON format based on the provided text.
 
@@ -61,12 +44,86 @@ class GPT4LLM:
 
             Questions: {question_instructions}
             """
+
+class GPT4LLM:
+    def __init__(self, api_key):
+        """
+        Initialize the OpenAI GPT-4 LLM via LangChain with the provided API key.
+        """
+        self.model_id = "gpt-4o"
+        self.model = ChatOpenAI(
+            api_key=api_key, 
+            model=self.model_id,  # Using GPT-4 via LangChain
+            temperature=0.5,
+            model_kwargs={"response_format": {"type": "json_object"}},
+            http_client=openai_http_client()  # Records/replays API calls when PROVIDER_RECORD_MODE is set
         )
 
-        # Set up the chain with the model and parser
-        parser = SimpleJsonOutputParser()
-        chain = prompt_template | self.model | parser
+        # Constrain output to a json_schema built from the questions instead of free-form JSON
+        self.structured_output = os.getenv('STRUCTURED_OUTPUT', 'true').lower() == 'true'
+
+        # Prompt/model/parser chains are built once per question set
+        self.prompt_builder = PromptBuilder(self.model_id, self._render_prompt)
+        self._chains = OrderedDict()
+        self._chains_lock = threading.Lock()  # Requests are served from concurrent threads
+
+    @staticmethod
+    def _question_instructions(questions):
+        return ", ".join([f'"{q["field_name"]}": "{q["question"]}"' for q in questions])
+
+    def _render_prompt(self, questions):
+        """Render the prompt for a question set, leaving a placeholder for the document."""
+        return PROMPT_TEMPLATE.format(extracted_text=PLACEHOLDER,
+                                      question_instructions=self._question_instructions(questions))
+
+    def _chain(self, questions, timeout=None):
+        """
+        Return the chain for a question set; its prompt template, bound model and parser are
+        built on first use and cached. A `timeout` (seconds) is applied to this call's API request.
+        """
+        key = PromptBuilder.question_key(questions)
+        with self._chains_lock:
+            parts = self._chains.get(key)
+            if parts is not None:
+                self._chains.move_to_end(key)
+        if parts is None:
+            # Set up the chain with the model and parser
+            prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
+            parser = SimpleJsonOutputParser()
+            model = self.model
+            if self.structured_output:
+                model = model.bind(response_format=build_openai_response_format(questions))
+            parts = (prompt_template, model, parser)
+            with self._chains_lock:
+                self._chains[key] = parts
+                while len(self._chains) > self.prompt_builder.max_cached:
+                    self._chains.popitem(last=False)
+
+        prompt_template, model, parser = parts
+        if timeout is not None:
+            model = model.bind(timeout=timeout)
+        return prompt_template | model | parser
+
+    def query_gpt4(self, extracted_text, questions, deadline=None):
+        """
+        Query GPT-4 using LangChain's pipeline, ensuring JSON structured output.
+        
+        Args:
+            extracted_text (str): The text extracted from the document.
+            questions (list): List of questions to ask based on the text.
+            deadline (Deadline): Optional request deadline; DeadlineExceeded is raised once it has passed.
+
+        Returns:
+            dict: A JSON object with structured answers.
+        """
+        question_instructions = self._question_instructions(questions)
 
+        # Trim the document to the input budget and reuse the chain compiled for this question set
+        extracted_text, _, estimated_input_tokens = self.prompt_builder.fit(extracted_text, questions)
+        if deadline:
+            deadline.check("llm")
+        # The API request may not outlive the request deadline
+        chain = self._chain(questions, timeout=deadline.remaining() if deadline else None)
         try:
             # Prepare input for the chain
             input_data = {
@@ -75,10 +132,19 @@ class GPT4LLM:
             }
 
             # Run the chain and get the structured JSON output
-            result = chain.invoke(input_data)
-            logger.info(f"Response from GPT-4: {result}")
+            with tracing.span("llm.gpt4"), get_openai_callback() as usage:
+                result = chain.invoke(input_data)
+            if deadline:
+                deadline.check("llm")  # Client retries may have used up the remaining time
+            self.prompt_builder.counter.calibrate(estimated_input_tokens, usage.prompt_tokens)
+            tracing.add_count("llm.input_tokens", usage.prompt_tokens)
+            tracing.add_count("llm.output_tokens", usage.completion_tokens)
+            metrics.record_llm_usage('gpt4', usage.prompt_tokens, usage.completion_tokens, usage.total_cost)
+            log_payload(logger, "Response from GPT-4", result)
             return result
 
         except Exception as e:
+            if deadline and deadline.expired():
+                raise DeadlineExceeded("llm") from e
             logger.error(f"Error during query: {e}")
             return None
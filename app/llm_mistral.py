@@ -1,10 +1,14 @@
-import os
 import json
 import time
 import logging
-import boto3
 import re
 from botocore.exceptions import ClientError
+from .bedrock_pool import BedrockClientPool
+from .structured_output import repair_json
+from . import tracing, metrics
+from .log_utils import log_payload, Preview
+from .prompt_builder import PLACEHOLDER, PromptBuilder
+from .deadlines import DeadlineExceeded
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -13,15 +17,20 @@ logger = logging.getLogger(__name__)
 class MistralBedrockAPI:
     def __init__(self):
         self.model_id = 'mistral.mistral-7b-instruct-v0:2'
-        self.region_name = os.getenv('AWS_REGION', 'eu-west-3')
-        self.bedrock_client = boto3.client('bedrock-runtime', region_name=self.region_name)
+        # Calls are spread across the regions in BEDROCK_REGIONS (defaults to AWS_REGION)
+        self.bedrock_client = BedrockClientPool()
+        self.region_name = self.bedrock_client.region_name
 
         # Cost per token (Mistral pricing)
         self.cost_per_input_token = 0.00055 / 1000  # $0.00055 per 1K input tokens
         self.cost_per_output_token = 0.00165 / 1000  # $0.00165 per 1K output tokens
 
-    def query_mistral(self, extracted_text, questions, max_retries=3, retry_delay=2):
-        """Query Mistral model with extracted text and questions while logging token cost."""
+        # Prompt templates compiled per question set, with token counting and input budget
+        self.prompt_builder = PromptBuilder(self.model_id, self._render_prompt)
+
+    def _render_prompt(self, questions):
+        """Render the prompt template for a question set, leaving a placeholder for the document."""
+        extracted_text = PLACEHOLDER
 
         # Format questions
         question_instructions = ", ".join([f'"{q["field_name"]}": "{q["question"]}"' for q in questions])
@@ -50,9 +59,12 @@ class MistralBedrockAPI:
             "shipments": []
         }}
         """
+        return prompt
 
-        # Estimate input token count (1 token ≈ 4 characters)
-        estimated_input_tokens = len(prompt) // 4
+    def query_mistral(self, extracted_text, questions, max_retries=3, retry_delay=2, deadline=None):
+        """Query Mistral model with extracted text and questions while logging token cost."""
+        # Build the prompt from the cached template, trimming the document to the input budget
+        prompt, estimated_input_tokens = self.prompt_builder.build(extracted_text, questions)
 
         # Payload
         body = {
@@ -65,18 +77,25 @@ class MistralBedrockAPI:
 
         attempt = 0
         while attempt < max_retries:
+            if deadline:
+                deadline.check("llm")
+            attempt_started = time.monotonic()
+            if attempt > 0:
+                tracing.add_count("llm.retries")
+                metrics.LLM_RETRIES.inc(provider='mistral')
             try:
                 # Invoke model
-                response = self.bedrock_client.invoke_model(
-                    modelId=self.model_id,
-                    accept="application/json",
-                    contentType="application/json",
-                    body=json.dumps(body)
-                )
-
-                # Parse response
-                response_body = response['body'].read().decode('utf-8')
-                logger.info(f"Raw response from Mistral: {response_body}")
+                with tracing.span("llm.mistral"):
+                    response = self.bedrock_client.invoke_model(
+                        modelId=self.model_id,
+                        accept="application/json",
+                        contentType="application/json",
+                        body=json.dumps(body)
+                    )
+
+                    # Parse response
+                    response_body = response['body'].read().decode('utf-8')
+                log_payload(logger, "Raw response from Mistral", response_body)
 
                 try:
                     # Extract and clean JSON response
@@ -86,15 +105,28 @@ class MistralBedrockAPI:
                     if outputs:
                         raw_text = outputs[0].get('text', '')
 
-                        # Estimate output tokens
-                        estimated_output_tokens = len(raw_text) // 4
+                        # Prefer the token counts measured by Bedrock over local estimates
+                        headers = response.get('ResponseMetadata', {}).get('HTTPHeaders', {})
+                        input_token_header = headers.get('x-amzn-bedrock-input-token-count')
+                        output_token_header = headers.get('x-amzn-bedrock-output-token-count')
+                        if input_token_header:
+                            self.prompt_builder.counter.calibrate(estimated_input_tokens, int(input_token_header))
+                            estimated_input_tokens = int(input_token_header)
+                        if output_token_header:
+                            estimated_output_tokens = int(output_token_header)
+                        else:
+                            estimated_output_tokens = self.prompt_builder.counter.count(raw_text)
+                        tracing.add_count("llm.input_tokens", estimated_input_tokens)
+                        tracing.add_count("llm.output_tokens", estimated_output_tokens)
 
                         # Calculate cost
                         total_cost = (estimated_input_tokens * self.cost_per_input_token) + (
                                     estimated_output_tokens * self.cost_per_output_token)
+                        metrics.record_llm_usage('mistral', estimated_input_tokens, estimated_output_tokens, total_cost)
 
                         # Log cost
-                        logger.info(f"Mistral estimated {estimated_input_tokens} input tokens, {estimated_output_tokens} output tokens. Estimated cost: ${total_cost:.6f}")
+                        logger.info("Mistral estimated %d input tokens, %d output tokens. Estimated cost: $%.6f",
+                                    estimated_input_tokens, estimated_output_tokens, total_cost)
 
                         # Clean and validate JSON response
                         cleaned_json = self._clean_and_validate_json(raw_text)
@@ -116,7 +148,11 @@ class MistralBedrockAPI:
 
             attempt += 1
             if attempt < max_retries:
-                logger.info(f"Retrying... (attempt {attempt + 1})")
+                # Skip a retry that cannot finish before the request deadline
+                if deadline and not deadline.allows(retry_delay + time.monotonic() - attempt_started):
+                    logger.warning("Not retrying: %.1fs left before the request deadline", deadline.remaining())
+                    raise DeadlineExceeded("llm")
+                logger.info("Retrying... (attempt %d)", attempt + 1)
                 time.sleep(retry_delay)
 
         logger.error("Max retries reached. Failed to get a valid JSON response.")
@@ -142,11 +178,12 @@ class MistralBedrockAPI:
 
             # Parse and return JSON
             parsed_json = json.loads(cleaned_string)
-            logger.info(f"Validated JSON: {parsed_json}")
+            logger.info("Validated JSON: %s", Preview(parsed_json))
             return parsed_json
         except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON in response: {e}")
-            return None
+            # Salvage the output locally rather than paying for another query
+            logger.warning(f"Invalid JSON in response ({e}), attempting repair.")
+            return repair_json(response_text)
 
     def _remove_trailing_commas(self, json_string):
         """
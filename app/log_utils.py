@@ -0,0 +1,90 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Preview:
+    """
+    Lazily formatted, size-capped view of a large value (OCR text, provider payloads).
+
+    Nothing is converted to a string unless a handler actually emits the record.
+    """
+    __slots__ = ('value', 'limit')
+
+    def __init__(self, value, limit=None):
+        self.value = value
+        self.limit = limit if limit is not None else int(os.getenv('LOG_PREVIEW_CHARS', '500'))
+
+    def __str__(self):
+        text = self.value if isinstance(self.value, str) else str(self.value)
+        if self.limit <= 0 or len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}... [{len(text) - self.limit} more chars]"
+
+
+class PayloadSink:
+    """
+    Optional, rate-limited JSON-lines file receiving full debug payloads.
+
+    Writes are limited to `max_per_minute` through a token bucket; payloads over budget are
+    dropped and counted rather than slowing down the request path.
+    """
+    def __init__(self, path=None, max_per_minute=None):
+        self.path = path if path is not None else os.getenv('LOG_PAYLOAD_SINK')
+        self.max_per_minute = float(max_per_minute if max_per_minute is not None
+                                    else os.getenv('LOG_PAYLOAD_SINK_MAX_PER_MINUTE', '60'))
+        self._tokens = self.max_per_minute
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def _take_token(self):
+        now = time.monotonic()
+        self._tokens = min(self.max_per_minute, self._tokens + (now - self._last_refill) * self.max_per_minute / 60)
+        self._last_refill = now
+        if self._tokens < 1:
+            self.dropped += 1
+            return False
+        self._tokens -= 1
+        return True
+
+    def write(self, source, label, payload):
+        if not self.path:
+            return False
+        with self._lock:
+            if not self._take_token():
+                return False
+            record = {"time": time.time(), "source": source, "label": label,
+                      "payload": payload if isinstance(payload, (str, dict, list)) else str(payload)}
+            try:
+                with open(self.path, 'a') as sink_file:
+                    sink_file.write(json.dumps(record, default=str) + "\n")
+            except OSError as e:
+                logger.warning("Failed to write debug payload to %s: %s", self.path, e)
+                return False
+        return True
+
+
+payload_sink = PayloadSink()
+
+
+def log_payload(target_logger, label, payload, level=logging.INFO):
+    """
+    Log a size-capped preview of a large payload and sample the full payload into the debug sink.
+
+    LOG_PAYLOAD_SAMPLE_RATE (0.0-1.0, default 0) controls the share of payloads written in full
+    to LOG_PAYLOAD_SINK.
+    """
+    if target_logger.isEnabledFor(level):
+        target_logger.log(level, "%s: %s", label, Preview(payload))
+
+    sample_rate = float(os.getenv('LOG_PAYLOAD_SAMPLE_RATE', '0'))
+    if payload_sink.path and sample_rate > 0 and random.random() < sample_rate:
+        payload_sink.write(target_logger.name, label, payload)
@@ -0,0 +1,332 @@
+import os
+import re
+import json
+import glob
+import time
+import uuid
+import fcntl
+import logging
+import tempfile
+import threading
+from . import tracing
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, float('inf'))
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Worker snapshot files are named metrics_{pid}_{instance}.json
+_SNAPSHOT_NAME = re.compile(r'metrics_(\d+)(?:_\w+)?\.json$')
+TOMBSTONE_FILE = 'dead_metrics.json'
+
+
+class _Metric:
+    metric_type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._registry = registry or REGISTRY
+        self._registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def describe(self):
+        return {"type": self.metric_type, "help": self.documentation, "labelnames": list(self.labelnames)}
+
+    def samples(self):
+        return [[list(key), list(value) if isinstance(value, list) else value] for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    """A monotonically increasing value, summed across workers."""
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._registry.lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self._registry.maybe_flush()
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, summed across workers."""
+    metric_type = 'gauge'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._registry.lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self._registry.maybe_flush()
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._registry.lock:
+            self._values[key] = value
+        self._registry.maybe_flush()
+
+
+class Histogram(_Metric):
+    """Bucketed observations (e.g. latencies) with their sum and count."""
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._registry.lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+        self._registry.maybe_flush()
+
+    def describe(self):
+        description = super().describe()
+        description["buckets"] = [str(bound) for bound in self.buckets]
+        return description
+
+
+class MetricsRegistry:
+    """
+    In-process metrics registry with Prometheus text exposition.
+
+    When METRICS_MULTIPROC_DIR is set, every worker periodically writes its snapshot to
+    that directory and the exposition merges the snapshots of all workers, so any worker
+    can answer a scrape for the whole deployment. Snapshots of workers that have exited
+    (or whose PID was reused by a newer worker) have their counters and histograms folded
+    into a tombstone file and are removed; their gauges are dropped, as with
+    prometheus_client's mark_process_dead.
+    """
+    def __init__(self, multiproc_dir=None, flush_interval=1.0):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.multiproc_dir = multiproc_dir
+        self.flush_interval = flush_interval
+        self._last_flush = 0.0
+        self._pending_flush = None
+        self._instance = None  # (pid, id) naming this process's snapshot file
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Duplicate metric: {metric.name}")
+        self.metrics[metric.name] = metric
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: dict(metric.describe(), samples=metric.samples())
+                for name, metric in self.metrics.items()
+            }
+
+    def maybe_flush(self, force=False):
+        """Write this worker's snapshot to the multiprocess directory, at most once per interval."""
+        if not self.multiproc_dir:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            # Make sure the latest updates are written even if this worker goes idle
+            with self.lock:
+                if self._pending_flush is None:
+                    self._pending_flush = threading.Timer(self.flush_interval, self.maybe_flush, kwargs={"force": True})
+                    self._pending_flush.daemon = True
+                    self._pending_flush.start()
+            return
+        with self.lock:
+            self._pending_flush = None
+        self._last_flush = now
+        try:
+            os.makedirs(self.multiproc_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=self.multiproc_dir, suffix='.tmp', delete=False) as temp_file:
+                json.dump(self.snapshot(), temp_file)
+            os.replace(temp_file.name, self._snapshot_path())
+        except OSError as e:
+            logger.warning(f"Failed to write metrics snapshot: {e}")
+
+    def _snapshot_path(self):
+        """This process's snapshot file; a new id per process so a reused PID gets a fresh file."""
+        pid = os.getpid()
+        if self._instance is None or self._instance[0] != pid:
+            self._instance = (pid, uuid.uuid4().hex[:12])
+        return os.path.join(self.multiproc_dir, f"metrics_{pid}_{self._instance[1]}.json")
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path) as snapshot_file:
+                return json.load(snapshot_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping unreadable metrics snapshot {path}: {e}")
+            return None
+
+    def _live_snapshots(self):
+        """
+        Return the snapshots of live workers and the tombstone, after retiring the snapshots of
+        dead workers into the tombstone. Must be called with the directory lock held.
+        """
+        own_path = self._snapshot_path()
+        newest = {}
+        dead = []
+        for path in glob.glob(os.path.join(self.multiproc_dir, 'metrics_*.json')):
+            match = _SNAPSHOT_NAME.search(os.path.basename(path))
+            if not match:
+                continue
+            pid = int(match.group(1))
+            if path != own_path and not _pid_alive(pid):
+                dead.append(path)
+                continue
+            try:
+                mtime = float('inf') if path == own_path else os.path.getmtime(path)
+            except OSError:
+                continue
+            # Only the newest snapshot of a PID belongs to the live process, older ones to its predecessor
+            previous = newest.get(pid)
+            if previous is None or mtime > previous[0]:
+                if previous:
+                    dead.append(previous[1])
+                newest[pid] = (mtime, path)
+            else:
+                dead.append(path)
+
+        tombstone_path = os.path.join(self.multiproc_dir, TOMBSTONE_FILE)
+        tombstone = self._read(tombstone_path) or {}
+        if dead:
+            tombstone = _merge([tombstone] + [self._read(path) or {} for path in dead], include_gauges=False)
+            with tempfile.NamedTemporaryFile('w', dir=self.multiproc_dir, suffix='.tmp', delete=False) as temp_file:
+                json.dump(tombstone, temp_file)
+            os.replace(temp_file.name, tombstone_path)
+            for path in dead:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            logger.info("Retired %d metrics snapshots of exited workers", len(dead))
+        return [tombstone] + [self._read(path) or {} for _, path in newest.values()]
+
+    def collect(self):
+        """Return the merged snapshot of every worker (or just this one)."""
+        if not self.multiproc_dir:
+            return self.snapshot()
+
+        self.maybe_flush(force=True)
+        try:
+            with open(os.path.join(self.multiproc_dir, '.lock'), 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    snapshots = self._live_snapshots()
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        except OSError as e:
+            logger.warning(f"Failed to collect metrics snapshots: {e}")
+            return self.snapshot()
+        return _merge(snapshots)
+
+    def exposition(self):
+        """Render all metrics in the Prometheus text format."""
+        lines = []
+        for name, metric in sorted(self.collect().items()):
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            for labels, value in metric["samples"]:
+                pairs = list(zip(metric["labelnames"], labels))
+                if metric["type"] != 'histogram':
+                    lines.append(f"{name}{_format_labels(pairs)} {_format_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric["buckets"], value):
+                    cumulative += count
+                    le = '+Inf' if bound == 'inf' else bound
+                    lines.append(f"{name}_bucket{_format_labels(pairs + [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(pairs)} {_format_value(value[-2])}")
+                lines.append(f"{name}_count{_format_labels(pairs)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge(snapshots, include_gauges=True):
+    """Sum the samples of several snapshots, optionally leaving out gauges."""
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            if metric["type"] == 'gauge' and not include_gauges:
+                continue
+            target = merged.setdefault(name, dict(metric, samples={}))
+            for labels, value in metric["samples"]:
+                key = tuple(labels)
+                if key not in target["samples"]:
+                    target["samples"][key] = value
+                elif isinstance(value, list):
+                    target["samples"][key] = [a + b for a, b in zip(target["samples"][key], value)]
+                else:
+                    target["samples"][key] += value
+    for metric in merged.values():
+        metric["samples"] = [[list(key), value] for key, value in metric["samples"].items()]
+    return merged
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    escaped = [(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in pairs]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = MetricsRegistry(multiproc_dir=os.getenv('METRICS_MULTIPROC_DIR'))
+
+REQUESTS = Counter('pdf_requests_total', 'Processed /process-pdf requests.', ['status'])
+REQUEST_DURATION = Histogram('pdf_request_duration_seconds', 'End-to-end /process-pdf latency.')
+REQUESTS_IN_PROGRESS = Gauge('pdf_requests_in_progress', 'Requests currently being processed.')
+ERRORS = Counter('pdf_errors_total', 'Failed requests by error_code.', ['error_code'])
+STAGE_DURATION = Histogram('pipeline_stage_duration_seconds', 'Latency of each pipeline stage and provider call.', ['stage'])
+OCR_PAGES = Counter('ocr_pages_total', 'Pages sent through OCR.', ['engine'])
+CACHE_REQUESTS = Counter('cache_requests_total', 'Cache lookups by cache and result (hit/miss).', ['cache', 'result'])
+COMPACTION_SAVED = Counter('ocr_compaction_saved_total', 'Characters and estimated tokens removed from OCR text.', ['unit'])
+LLM_TOKENS = Counter('llm_tokens_total', 'LLM tokens by provider and direction (input/output).', ['provider', 'direction'])
+LLM_COST = Counter('llm_cost_dollars_total', 'Estimated LLM cost in dollars.', ['provider'])
+LLM_RETRIES = Counter('llm_retries_total', 'LLM call retries.', ['provider'])
+SCHEDULER_QUEUE_DEPTH = Gauge('scheduler_queue_depth', 'Requests waiting for a stage slot.', ['stage', 'priority'])
+SCHEDULER_WAIT = Histogram('scheduler_wait_seconds', 'Time spent waiting for a stage slot.', ['stage', 'priority'])
+
+
+def record_llm_usage(provider, input_tokens, output_tokens, cost):
+    """Record token usage and estimated cost of one LLM call."""
+    LLM_TOKENS.inc(input_tokens, provider=provider, direction='input')
+    LLM_TOKENS.inc(output_tokens, provider=provider, direction='output')
+    LLM_COST.inc(cost, provider=provider)
+
+
+# Every timing span also feeds the per-stage latency histogram
+tracing.add_span_listener(lambda name, duration: STAGE_DURATION.observe(duration, stage=name))
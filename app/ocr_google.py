@@ -1,8 +1,18 @@
+import io
 import os
 import json
 import logging
 import tempfile
+from PIL import Image
 from google.cloud import documentai_v1 as documentai
+from . import tracing, metrics
+from .log_utils import log_payload
+from .text_compaction import build_compactor
+from .uploads import read_pdf
+from .page_cache import build_page_cache, page_hash
+from .render_pool import build_render_pool, render_png_files
+from .deadlines import DeadlineExceeded
+from .cassettes import ProtoCodec, active_cassette, recorded_client
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -13,6 +23,10 @@ class GoogleOCR:
         # Load credentials from environment variable
         google_credentials_json = os.getenv('GOOGLE_APPLICATION_CREDENTIALS_JSON')
         
+        # Replayed Document AI responses come from the cassette, so no credentials are needed
+        cassette = active_cassette()
+        replaying = cassette is not None and cassette.replaying
+
         if google_credentials_json:
             # Write the JSON credentials to a temporary file
             with tempfile.NamedTemporaryFile(delete=False, mode='w') as temp_file:
@@ -21,60 +35,191 @@ class GoogleOCR:
             
             # Set the environment variable for Google Cloud credentials
             os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = self.temp_file_path
-        else:
+        elif not replaying:
             raise ValueError("GOOGLE_APPLICATION_CREDENTIALS_JSON environment variable not set")
         
-        # Initialize the Document AI client
-        self.documentai_client = documentai.DocumentProcessorServiceClient()
+        # Initialize the Document AI client (recorded to / replayed from a cassette when PROVIDER_RECORD_MODE is set)
+        self.documentai_client = recorded_client('documentai', documentai.DocumentProcessorServiceClient,
+                                                 ('process_document',), codec=ProtoCodec(documentai.ProcessResponse))
+        self.compactor = build_compactor()  # Strips repeated headers/footers and OCR noise
+        self.page_cache = build_page_cache()  # OCR results of previously seen pages
+        self.render_pool = build_render_pool() if self.page_cache else None  # Renders pages to hash them
+        # Partial cache hits send the changed pages as one TIFF, up to this size (inline request limit)
+        self.max_tiff_bytes = int(float(os.getenv('OCR_PAGE_CACHE_MAX_TIFF_MB', '15')) * 1024 * 1024)
 
-    def extract_text_from_pdf(self, image_file):
+    def _page_lines(self, document, pages=None):
         """
-        Extract text and calculate confidence scores from a PDF using Google Document AI.
+        Return each page's lines as (text, confidence) tuples, with confidence on Textract's 0-100 scale.
         """
-        try:
-            # Replace placeholders with actual values
-            processor_id = '78e04735f550c004'
-            project_id = 'analyse-pdf-423009'  # Replace with your Google Cloud project ID
-            location = 'us'
-
-            # Construct the full processor resource name
-            processor_name = f'projects/{project_id}/locations/{location}/processors/{processor_id}'
-
-            # Construct the request
-            request = documentai.ProcessRequest(
-                name=processor_name,
-                raw_document=documentai.RawDocument(
-                    content=image_file,  # Pass raw file data
-                    mime_type='application/pdf'
-                )
+        lines_by_page = []
+        for page in (document.pages if pages is None else pages):
+            lines = []
+            for line in page.lines:
+                segments = line.layout.text_anchor.text_segments
+                text = "".join(document.text[int(segment.start_index):int(segment.end_index)] for segment in segments)
+                lines.append((text, line.layout.confidence * 100))
+            lines_by_page.append(lines)
+        return lines_by_page
+
+    @staticmethod
+    def _document_confidences(document):
+        """
+        Confidence scores of a whole document: its entities when the processor returns entities,
+        its block confidences otherwise.
+        """
+        if document.entities:
+            return [entity.confidence for entity in document.entities]
+        return [block.layout.confidence for page in document.pages for block in page.blocks]
+
+    @staticmethod
+    def _page_confidences(document, index):
+        """
+        Confidence scores of one page (0-based index in the document): the entities anchored on the
+        page (an entity spanning pages counts on its first one), its block confidences when none are.
+        """
+        scores = [entity.confidence for entity in document.entities
+                  if entity.page_anchor.page_refs
+                  and min(int(ref.page) for ref in entity.page_anchor.page_refs) == index]
+        return scores or [block.layout.confidence for block in document.pages[index].blocks]
+
+    def _process(self, content, mime_type, deadline=None):
+        """
+        Send a document to the Document AI processor and return the processed document.
+        """
+        if deadline:
+            deadline.check("ocr.documentai")
+        # Replace placeholders with actual values
+        processor_id = '78e04735f550c004'
+        project_id = 'analyse-pdf-423009'  # Replace with your Google Cloud project ID
+        location = 'us'
+
+        # Construct the full processor resource name
+        processor_name = f'projects/{project_id}/locations/{location}/processors/{processor_id}'
+
+        # Construct the request
+        request = documentai.ProcessRequest(
+            name=processor_name,
+            raw_document=documentai.RawDocument(
+                content=content,  # Pass raw file data
+                mime_type=mime_type
             )
+        )
+
+        # Process the document
+        with tracing.span("ocr.documentai"):
+            options = {"timeout": deadline.remaining()} if deadline else {}
+            result = self.documentai_client.process_document(request=request, **options)
+        document = result.document
+        tracing.add_count("ocr.pages", len(document.pages))
+        metrics.OCR_PAGES.inc(len(document.pages), engine='google')
 
-            # Process the document
-            result = self.documentai_client.process_document(request=request)
-            document = result.document
-            document_text = document.text
+        # Log the full response for debugging
+        log_payload(logger, "Full Document AI response", document, level=logging.DEBUG)
+        return document
 
-            # Log the full response for debugging
-            logger.debug(f"Full Document AI response: {document}")
+    def _changed_pages_tiff(self, page_files, changed):
+        """Multi-page TIFF of the changed pages, or None when it would exceed max_tiff_bytes."""
+        buffer = io.BytesIO()
+        frames = [Image.open(page_files[i]) for i in changed]
+        try:
+            frames[0].save(buffer, 'TIFF', save_all=True, append_images=frames[1:], compression='tiff_lzw')
+        finally:
+            for frame in frames:
+                frame.close()
+        if buffer.tell() > self.max_tiff_bytes:
+            logger.info("Changed pages exceed %d bytes as TIFF, sending the whole PDF", self.max_tiff_bytes)
+            return None
+        return buffer.getvalue()
+
+    def _extract_pages(self, image_file, pages=None, deadline=None):
+        """
+        OCR a PDF page by page through the page cache. Pages are rendered (in the render pool when
+        enabled) only to be hashed. When some pages are cached, the changed pages are sent to
+        Document AI as one multi-page TIFF; on a cold cache, when every page changed or when the
+        TIFF would be too large, the original PDF is sent instead.
+
+        Returns the (lines, confidences) of each page in order, or None when the PDF cannot be
+        rendered locally.
+        """
+        with tempfile.TemporaryDirectory(prefix='render_', dir=os.getenv('UPLOAD_SPOOL_DIR') or None) as render_dir:
+            try:
+                with tracing.span("ocr.render"):
+                    page_files = render_png_files(image_file, render_dir, pages, self.render_pool, deadline)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                logger.warning("Cannot render the PDF locally, sending the whole document: %s", e)
+                return None
+            if not page_files:
+                return None
+
+            keys = [page_hash(path) for path in page_files]
+            cached_pages, changed = self.page_cache.lookup(keys)
+            if not changed:
+                return cached_pages
+            tiff = self._changed_pages_tiff(page_files, changed) if len(changed) < len(keys) else None
+
+        if tiff is not None:
+            document = self._process(tiff, 'image/tiff', deadline)
+            if len(document.pages) != len(changed):
+                raise ValueError(f"Document AI returned {len(document.pages)} pages for {len(changed)} images")
+            indexes = list(range(len(changed)))
+        else:
+            document = self._process(read_pdf(image_file), 'application/pdf', deadline)
+            selected = [index for index in range(len(document.pages)) if not pages or index + 1 in pages]
+            if len(selected) != len(keys):
+                raise ValueError(f"Document AI returned {len(selected)} pages for {len(keys)} rendered pages")
+            indexes = [selected[i] for i in changed]
+
+        page_lines = self._page_lines(document, [document.pages[index] for index in indexes])
+        for i, index, lines in zip(changed, indexes, page_lines):
+            cached_pages[i] = (lines, self._page_confidences(document, index))
+            self.page_cache.put(keys[i], *cached_pages[i])
+        return cached_pages
+
+    def extract_text_from_pdf(self, image_file, pages=None, deadline=None):
+        """
+        Extract text and calculate confidence scores from a PDF using Google Document AI.
+
+        `image_file` may be bytes or a path-like spooled upload, and `pages` an optional list of
+        1-based pages to keep. With the page cache enabled, only changed pages are sent to
+        Document AI. Otherwise the whole PDF is processed (the pinned client has no page
+        selector) and only the selected pages' text is kept.
+        """
+        try:
+            cached_pages = self._extract_pages(image_file, pages, deadline) if self.page_cache else None
+            if cached_pages is not None:
+                page_lines = [lines for lines, _ in cached_pages]
+                document_text = " ".join(text for lines in page_lines for text, _ in lines)
+                confidence_scores = [confidence for _, confidences in cached_pages for confidence in confidences]
+            else:
+                document = self._process(read_pdf(image_file), 'application/pdf', deadline)
+                selected_pages = [page for number, page in enumerate(document.pages, 1) if not pages or number in pages]
+                page_lines = self._page_lines(document, selected_pages)
+                document_text = document.text if not pages else " ".join(
+                    text for lines in page_lines for text, _ in lines)
 
-            # Extract confidence scores from entities
-            confidence_scores = []
-            if hasattr(document, 'entities') and document.entities:
-                confidence_scores.extend(entity.confidence for entity in document.entities)
+                # Entity confidences when the processor returns entities, block confidences otherwise
+                confidence_scores = self._document_confidences(document) if not pages else [
+                    confidence for number in pages if number <= len(document.pages)
+                    for confidence in self._page_confidences(document, number - 1)]
 
-            # Fallback: Extract confidence from blocks if entities are not present
-            if not confidence_scores and hasattr(document, 'pages'):
-                for page in document.pages:
-                    for block in page.blocks:
-                        confidence_scores.append(block.layout.confidence)
+            if self.compactor:
+                with tracing.span("ocr.compact"):
+                    if any(page_lines):
+                        document_text, _ = self.compactor.compact(page_lines)
+                    else:
+                        document_text, _ = self.compactor.compact_text(document_text)
 
             # Calculate the average confidence score
             average_confidence = sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0.0
 
-            logger.info(f"Extracted text with Google Document AI: {document_text}")
-            logger.info(f"Average confidence score: {average_confidence:.2f}")
+            log_payload(logger, "Extracted text with Google Document AI", document_text)
+            logger.info("Average confidence score: %.2f", average_confidence)
 
             return document_text, average_confidence
         except Exception as e:
+            if deadline and deadline.expired():
+                raise DeadlineExceeded("ocr.documentai") from e
             logger.error(f"Failed to extract text with Google Document AI: {e}")
             return "", 0.0
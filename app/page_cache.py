@@ -0,0 +1,84 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from . import tracing, metrics
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def page_hash(image):
+    """
+    Content hash of a rendered page.
+
+    Encoded pages (PNG bytes) are hashed as they are; pages rendered to disk (PNG paths or lazily
+    loaded images) are hashed from their file in chunks, without loading the pixels; in-memory
+    images are hashed from their raw pixel data.
+    """
+    if isinstance(image, (bytes, bytearray)):
+        return hashlib.sha256(image).hexdigest()
+    digest = hashlib.sha256()
+    filename = os.fspath(image) if isinstance(image, (str, os.PathLike)) else getattr(image, 'filename', None)
+    if filename:
+        with open(filename, 'rb') as page_file:
+            for chunk in iter(lambda: page_file.read(1024 * 1024), b''):
+                digest.update(chunk)
+    else:
+        digest.update(f"{image.mode}:{image.size}".encode())
+        digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class PageCache:
+    """
+    In-process LRU cache of OCR results per rendered page.
+
+    Each entry holds a page's lines as (text, confidence) tuples and the confidence scores the
+    engine averages over, so a revised document only needs OCR for the pages that changed.
+    """
+    def __init__(self, max_pages=None, ttl=None):
+        self.max_pages = int(max_pages if max_pages is not None else os.getenv('OCR_PAGE_CACHE_MAX_PAGES', '5000'))
+        self.ttl = float(ttl if ttl is not None else os.getenv('OCR_PAGE_CACHE_TTL', '86400'))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached (lines, confidences) of a page, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl > 0 and time.time() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        metrics.CACHE_REQUESTS.inc(cache='page', result='hit' if entry else 'miss')
+        return entry[1:] if entry else None
+
+    def put(self, key, lines, confidences):
+        with self._lock:
+            self._entries[key] = (time.time(), lines, confidences)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_pages:
+                self._entries.popitem(last=False)
+
+    def lookup(self, keys):
+        """Return the cached entry (or None) of each page, and the indices of the pages to OCR."""
+        entries = [self.get(key) for key in keys]
+        changed = [i for i, entry in enumerate(entries) if entry is None]
+        tracing.add_count("ocr.cached_pages", len(keys) - len(changed))
+        if len(changed) < len(keys):
+            logger.info("Reusing OCR of %d of %d pages", len(keys) - len(changed), len(keys))
+        return entries, changed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def build_page_cache():
+    """Return a PageCache, or None when OCR_PAGE_CACHE is disabled."""
+    return PageCache() if os.getenv('OCR_PAGE_CACHE', 'true').lower() == 'true' else None
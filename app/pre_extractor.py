@@ -0,0 +1,142 @@
+import os
+import re
+import json
+import logging
+from datetime import date
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Label patterns for fields that appear in fixed label/value layouts. The value follows the label,
+# separated by optional punctuation. OCR lines are joined with spaces, so generic labels must not
+# directly follow another word: "Invoice Issue Date" is not the certificate's issue date.
+_NOT_QUALIFIED = r"(?<![A-Za-z]\s)(?<![A-Za-z])"
+DEFAULT_RULES = {
+    "CertificateIssueDate": {
+        "labels": [r"certificate\s+(?:date\s+of\s+issue|issue\s+date)",
+                   _NOT_QUALIFIED + r"(?:date\s+of\s+issue|issue\s+date|issued\s+on)"],
+        "type": "date",
+    },
+    "CertificateValidityStartDate": {
+        "labels": [r"certificate\s+validity\s+start\s+date", _NOT_QUALIFIED + r"(?:validity\s+start\s+date|valid\s+from)"],
+        "type": "date",
+    },
+    "CertificateValidityEndDate": {
+        "labels": [r"certificate\s+validity\s+end\s+date",
+                   _NOT_QUALIFIED + r"(?:validity\s+end\s+date|valid\s+(?:until|to|through)|expiry\s+date)"],
+        "type": "date",
+    },
+    "CertificateNumber": {
+        "labels": [_NOT_QUALIFIED + r"(?:transaction\s+certificate|certificate|tc)\s+(?:number|no\.?|nr\.?)"],
+        "type": "identifier",
+    },
+}
+
+MONTHS = {name: i for i, names in enumerate([
+    (), ("jan", "january"), ("feb", "february"), ("mar", "march"), ("apr", "april"), ("may",),
+    ("jun", "june"), ("jul", "july"), ("aug", "august"), ("sep", "sept", "september"),
+    ("oct", "october"), ("nov", "november"), ("dec", "december"),
+]) for name in names}
+
+_SEPARATOR = r"\s*[:\-–]?\s*"
+_DATE_VALUE = (
+    r"(\d{4}-\d{1,2}-\d{1,2}"  # 2024-03-12
+    r"|\d{1,2}[./-]\d{1,2}[./-]\d{2,4}"  # 12.03.2024, 12/03/24
+    r"|\d{1,2}(?:st|nd|rd|th)?\s+[A-Za-z]{3,9}\.?,?\s+\d{4}"  # 12 March 2024
+    r"|[A-Za-z]{3,9}\.?\s+\d{1,2}(?:st|nd|rd|th)?,?\s+\d{4})"  # March 12, 2024
+)
+_IDENTIFIER_VALUE = r"((?=[A-Z\-/.]*\d)[A-Z0-9][A-Z0-9\-/.]{3,40}[A-Z0-9])"  # must contain a digit
+
+
+def normalize_date(value):
+    """
+    Normalize a date string to YYYY-MM-DD. Returns None if it is not a valid date.
+
+    Numeric dates are only read when the day and month cannot be confused (one part is greater
+    than 12, or both are equal); 03.04.2024 is ambiguous and returns None, leaving it to the LLM.
+    """
+    value = value.strip().rstrip('.,')
+    try:
+        match = re.fullmatch(r"(\d{4})-(\d{1,2})-(\d{1,2})", value)
+        if match:
+            year, month, day = (int(part) for part in match.groups())
+            return date(year, month, day).isoformat()
+
+        match = re.fullmatch(r"(\d{1,2})[./-](\d{1,2})[./-](\d{2,4})", value)
+        if match:
+            first, second, year = (int(part) for part in match.groups())
+            if year < 100:
+                year += 2000
+            if first <= 12 and second <= 12 and first != second:
+                return None
+            day, month = (first, second) if first > 12 or first == second else (second, first)
+            return date(year, month, day).isoformat()
+
+        match = re.fullmatch(r"(\d{1,2})(?:st|nd|rd|th)?\s+([A-Za-z]{3,9})\.?,?\s+(\d{4})", value)
+        if match:
+            day, month_name, year = match.groups()
+            return date(int(year), MONTHS[month_name.lower()], int(day)).isoformat()
+
+        match = re.fullmatch(r"([A-Za-z]{3,9})\.?\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})", value)
+        if match:
+            month_name, day, year = match.groups()
+            return date(int(year), MONTHS[month_name.lower()], int(day)).isoformat()
+    except (KeyError, ValueError):
+        return None
+    return None
+
+
+class RuleExtractor:
+    """
+    Deterministic label/value extraction for fields with predictable layouts.
+
+    A field is answered only when all of its matches in the OCR text agree on a single value,
+    so ambiguous documents (and dates whose day and month order is unclear) are left to the LLM. Rules can be replaced or extended with a JSON
+    file (PRE_EXTRACTOR_RULES) of the form {"FieldName": {"labels": [regex, ...], "type": "date"}}.
+    """
+    def __init__(self, rules=None):
+        if rules is None:
+            rules = dict(DEFAULT_RULES)
+            rules_path = os.getenv('PRE_EXTRACTOR_RULES')
+            if rules_path:
+                with open(rules_path) as rules_file:
+                    rules.update(json.load(rules_file))
+        self.patterns = {field: self._compile(rule) for field, rule in rules.items()}
+
+    @staticmethod
+    def _compile(rule):
+        value_pattern = {"date": _DATE_VALUE, "identifier": _IDENTIFIER_VALUE}.get(rule.get("type"), rule.get("value"))
+        if value_pattern is None:
+            raise ValueError(f"Rule needs a known 'type' (date, identifier) or a 'value' pattern: {rule}")
+        labels = "|".join(f"(?:{label})" for label in rule["labels"])
+        pattern = re.compile(rf"(?:{labels}){_SEPARATOR}{value_pattern}", re.IGNORECASE)
+        if pattern.groups < 1:
+            raise ValueError(f"Rule 'value' pattern needs a capture group for the value: {rule}")
+        return pattern, rule.get("type")
+
+    def extract_field(self, field_name, text):
+        """Return the single value found for field_name, or None if absent or ambiguous."""
+        if field_name not in self.patterns:
+            return None
+        pattern, value_type = self.patterns[field_name]
+        values = set()
+        for match in pattern.finditer(text):
+            value = match.group(1)
+            if value_type == "date":
+                value = normalize_date(value)
+                if value is None:
+                    return None
+            values.add(value.strip())
+        return values.pop() if len(values) == 1 else None
+
+    def extract(self, text, questions):
+        """Answer the questions that can be resolved confidently; returns {field_name: value}."""
+        answers = {}
+        for question in questions:
+            value = self.extract_field(question['field_name'], text)
+            if value is not None:
+                answers[question['field_name']] = value
+        if answers:
+            logger.info("Pre-extracted %d of %d fields without the LLM: %s", len(answers), len(questions), sorted(answers))
+        return answers
@@ -0,0 +1,163 @@
+import os
+import re
+import math
+import logging
+import threading
+from collections import OrderedDict
+from . import tracing
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Marker substituted for the document text when a prompt template is compiled
+PLACEHOLDER = "\x00EXTRACTED_TEXT\x00"
+TRUNCATION_NOTICE = "\n[... document truncated to fit the model input budget ...]"
+
+# Per-model calibration of the local token estimate, and default input budgets (tokens).
+# Budgets leave room for the 8000 output tokens requested from each model.
+MODEL_PROFILES = {
+    'anthropic.claude': {"calibration": 1.15, "max_input_tokens": 150000, "env": 'CLAUDE_MAX_INPUT_TOKENS'},
+    'mistral.': {"calibration": 1.25, "max_input_tokens": 24000, "env": 'MISTRAL_MAX_INPUT_TOKENS'},
+    'gpt-4o': {"calibration": 1.0, "max_input_tokens": 100000, "env": 'GPT4_MAX_INPUT_TOKENS'},
+}
+DEFAULT_PROFILE = {"calibration": 1.1, "max_input_tokens": 24000, "env": 'LLM_MAX_INPUT_TOKENS'}
+
+# Small prompts are dominated by per-message framing tokens and are not used for calibration
+MIN_CALIBRATION_TOKENS = 2000
+
+# BPE-like pre-tokenization: words (with their leading space), numbers in groups of up to
+# three digits, and every other non-space character on its own.
+_PIECES = re.compile(r" ?[A-Za-z]+| ?\d{1,3}|\n|[^\sA-Za-z\d]")
+
+
+def model_profile(model_id):
+    for prefix, profile in MODEL_PROFILES.items():
+        if model_id.startswith(prefix):
+            return profile
+    return DEFAULT_PROFILE
+
+
+class TokenCounter:
+    """
+    Local approximation of a model's tokenizer.
+
+    Words count one token per six letters, digits one token per group of three and symbols one
+    token each; the total is scaled by a per-model calibration factor that is refined with the
+    token counts reported by the provider.
+    """
+    def __init__(self, model_id):
+        self.model_id = model_id
+        self.calibration = model_profile(model_id)["calibration"]
+        self._lock = threading.Lock()
+
+    def count_raw(self, text):
+        tokens = 0
+        for piece in _PIECES.findall(text or ""):
+            stripped = piece.lstrip(" ")
+            tokens += math.ceil(len(stripped) / 6) if stripped.isalpha() else 1
+        return tokens
+
+    def count(self, text):
+        return math.ceil(self.count_raw(text) * self.calibration)
+
+    def calibrate(self, estimated_tokens, actual_tokens, smoothing=0.2):
+        """Move the calibration factor towards the ratio observed on a real request."""
+        if estimated_tokens < MIN_CALIBRATION_TOKENS or actual_tokens <= 0:
+            return
+        with self._lock:
+            ratio = actual_tokens / estimated_tokens
+            self.calibration = min(max(self.calibration * (1 + smoothing * (ratio - 1)), 0.5), 3.0)
+
+    def trim(self, text, max_tokens):
+        """Cut text (keeping its beginning) to at most max_tokens. Returns (text, tokens)."""
+        tokens = self.count(text)
+        if tokens <= max_tokens:
+            return text, tokens
+        if max_tokens <= 0:
+            return "", 0
+        trimmed = text
+        for _ in range(5):
+            cut = int(len(trimmed) * max_tokens / tokens * 0.98)
+            space = trimmed.rfind(" ", 0, cut)
+            trimmed = trimmed[:space if space > cut * 0.9 else cut]
+            tokens = self.count(trimmed)
+            if tokens <= max_tokens:
+                break
+        return trimmed, tokens
+
+
+class CompiledPrompt:
+    """A prompt template rendered for one question set, split around the document text."""
+    __slots__ = ('prefix', 'suffix', 'overhead_tokens')
+
+    def __init__(self, prefix, suffix, overhead_tokens):
+        self.prefix = prefix
+        self.suffix = suffix
+        self.overhead_tokens = overhead_tokens
+
+
+class PromptBuilder:
+    """
+    Builds provider prompts from templates compiled once per question set.
+
+    `render(questions)` returns the full prompt with PLACEHOLDER in place of the document text;
+    its output is cached (LRU) so later requests with the same questions only splice in the
+    document. The document is trimmed so the prompt fits the model's input budget.
+
+    Args:
+        model_id (str): Model identifier, used for tokenizer calibration and the default budget.
+        render (callable): Renders the prompt template for a list of questions.
+        max_input_tokens (int): Input budget; defaults to the model profile or its env override.
+        max_cached (int): Number of compiled question sets to keep.
+    """
+    def __init__(self, model_id, render, max_input_tokens=None, max_cached=128):
+        profile = model_profile(model_id)
+        self.counter = TokenCounter(model_id)
+        self.render = render
+        self.max_input_tokens = int(max_input_tokens if max_input_tokens is not None
+                                    else os.getenv(profile["env"], profile["max_input_tokens"]))
+        self.max_cached = max_cached
+        self._compiled = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def question_key(questions):
+        return tuple((q["field_name"], q["question"], q.get("type")) for q in questions)
+
+    def compile(self, questions):
+        key = self.question_key(questions)
+        with self._lock:
+            compiled = self._compiled.get(key)
+            if compiled is not None:
+                self._compiled.move_to_end(key)
+                return compiled
+
+        prefix, _, suffix = self.render(questions).partition(PLACEHOLDER)
+        compiled = CompiledPrompt(prefix, suffix, self.counter.count(prefix) + self.counter.count(suffix))
+        with self._lock:
+            self._compiled[key] = compiled
+            while len(self._compiled) > self.max_cached:
+                self._compiled.popitem(last=False)
+        return compiled
+
+    def fit(self, extracted_text, questions, reserved_tokens=0):
+        """
+        Trim the document to the budget left by the compiled prompt and reserved_tokens
+        (e.g. a system prompt or tool schema). Returns (text, compiled prompt, input tokens).
+        """
+        compiled = self.compile(questions)
+        available = self.max_input_tokens - compiled.overhead_tokens - reserved_tokens
+        text, text_tokens = self.counter.trim(extracted_text, available)
+        if text is not extracted_text:
+            removed = self.counter.count(extracted_text) - text_tokens
+            tracing.add_count("prompt.trimmed_tokens", removed)
+            logger.warning("Document trimmed by ~%d tokens to fit the %d token input budget of %s",
+                           removed, self.max_input_tokens, self.counter.model_id)
+            text += TRUNCATION_NOTICE
+        return text, compiled, compiled.overhead_tokens + text_tokens
+
+    def build(self, extracted_text, questions, reserved_tokens=0):
+        """Return the full prompt for the document and its estimated input tokens."""
+        text, compiled, input_tokens = self.fit(extracted_text, questions, reserved_tokens)
+        return compiled.prefix + text + compiled.suffix, input_tokens
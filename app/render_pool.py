@@ -0,0 +1,137 @@
+import os
+import sys
+import atexit
+import logging
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from .uploads import page_count, page_runs, render_pages
+from .deadlines import DeadlineExceeded
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def save_png(image, path):
+    """PNG-encode a page image to `path` and release its pixels. Returns the path."""
+    image.save(path, 'PNG')
+    image.close()
+    return path
+
+
+def _render_png(pdf_file, first_page, last_page, output_dir):
+    """Worker task: rasterize a run of pages to PNG files in output_dir and return their paths."""
+    pages = list(range(first_page, last_page + 1))
+    with tempfile.TemporaryDirectory(prefix='raster_', dir=output_dir) as raster_dir:
+        images = render_pages(pdf_file, pages=pages, output_folder=raster_dir)
+        return [save_png(image, os.path.join(output_dir, f"page_{page:05d}.png")) for page, image in zip(pages, images)]
+
+
+def _warm_up():
+    return os.getpid()
+
+
+class RenderPool:
+    """
+    Process pool for CPU-bound PDF rasterization and PNG encoding.
+
+    Rendering in worker processes keeps it off the GIL of the web worker, so render throughput
+    scales with cores while request threads stay responsive. Workers write each page as a PNG file
+    into the request's scratch directory and only return the paths, so page images are never held
+    in memory all at once. Workers are started with the spawn method and replaced after
+    `max_tasks_per_child` tasks to contain memory growth in poppler and PIL.
+
+    Args:
+        workers (int): Number of worker processes (RENDER_POOL_WORKERS, default min(4, cores)).
+        max_tasks_per_child (int): Tasks before a worker is recycled; 0 keeps workers forever.
+        pages_per_task (int): Pages rendered per task; lower values spread a document over more cores.
+        prewarm (bool): Start all workers immediately instead of on the first render.
+    """
+    def __init__(self, workers=None, max_tasks_per_child=None, pages_per_task=None, prewarm=None):
+        self.workers = int(workers if workers is not None
+                           else os.getenv('RENDER_POOL_WORKERS', min(4, os.cpu_count() or 1)))
+        self.max_tasks_per_child = int(max_tasks_per_child if max_tasks_per_child is not None
+                                       else os.getenv('RENDER_POOL_MAX_TASKS_PER_CHILD', '50'))
+        self.pages_per_task = max(int(pages_per_task if pages_per_task is not None
+                                      else os.getenv('RENDER_POOL_PAGES_PER_TASK', '1')), 1)
+        self._executor = None
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown)
+        if prewarm if prewarm is not None else os.getenv('RENDER_POOL_PREWARM', 'false').lower() == 'true':
+            self.prewarm()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                options = {"max_workers": self.workers, "mp_context": multiprocessing.get_context('spawn')}
+                if self.max_tasks_per_child > 0 and sys.version_info >= (3, 11):
+                    options["max_tasks_per_child"] = self.max_tasks_per_child
+                self._executor = ProcessPoolExecutor(**options)
+            return self._executor
+
+    def prewarm(self):
+        """Start every worker process now, so the first requests do not pay the spawn cost."""
+        executor = self._get_executor()
+        pids = {future.result() for future in [executor.submit(_warm_up) for _ in range(self.workers)]}
+        logger.info("Render pool started %d worker processes", len(pids))
+
+    def _tasks(self, pdf_file, pages):
+        """Split the pages to render into (first_page, last_page) tasks of at most pages_per_task pages."""
+        pages = pages or list(range(1, page_count(pdf_file) + 1))
+        tasks = []
+        for first_page, last_page in page_runs(pages):
+            for start in range(first_page, last_page + 1, self.pages_per_task):
+                tasks.append((start, min(start + self.pages_per_task - 1, last_page)))
+        return tasks
+
+    def render(self, pdf_file, output_dir, pages=None, deadline=None):
+        """
+        Render the selected 1-based pages (all pages by default) to PNG files in output_dir and
+        return their paths, in page order. Spooled uploads are passed to the workers by path,
+        not by content.
+
+        Pending page tasks are cancelled when the request deadline passes.
+        """
+        source = pdf_file if isinstance(pdf_file, (bytes, bytearray)) else os.fspath(pdf_file)
+        tasks = self._tasks(source, pages)
+        futures = []
+        try:
+            futures = [self._get_executor().submit(_render_png, source, first, last, output_dir) for first, last in tasks]
+            return [page for future in futures
+                    for page in future.result(timeout=deadline.remaining() if deadline else None)]
+        except FuturesTimeoutError:
+            for future in futures:
+                future.cancel()
+            raise DeadlineExceeded("ocr.render")
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool for the next request
+            logger.error("Render pool is broken, restarting it")
+            with self._lock:
+                self._executor = None
+            raise
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def render_png_files(pdf_file, output_dir, pages=None, pool=None, deadline=None):
+    """
+    Render the selected pages to PNG files in output_dir and return their paths in page order,
+    in the render pool when one is given and in the calling thread otherwise.
+    """
+    if pool:
+        return pool.render(pdf_file, output_dir, pages, deadline=deadline)
+    with tempfile.TemporaryDirectory(prefix='raster_', dir=output_dir) as raster_dir:
+        images = render_pages(pdf_file, pages=pages, output_folder=raster_dir)
+        return [save_png(image, os.path.join(output_dir, f"page_{i + 1:05d}.png")) for i, image in enumerate(images)]
+
+
+def build_render_pool():
+    """Return a RenderPool, or None when RENDER_POOL is disabled (render in the request thread)."""
+    return RenderPool() if os.getenv('RENDER_POOL', 'true').lower() == 'true' else None
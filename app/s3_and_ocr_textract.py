@@ -1,6 +1,14 @@
-import boto3
+import os
+import uuid
 import logging
-from pdf2image import convert_from_bytes
+import tempfile
+from . import tracing, metrics
+from .log_utils import log_payload
+from .text_compaction import build_compactor
+from .uploads import render_pages
+from .page_cache import build_page_cache, page_hash
+from .render_pool import build_render_pool, render_png_files
+from .cassettes import boto3_client
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -8,84 +16,165 @@ logger = logging.getLogger(__name__)
 
 class TextractOCR:
     def __init__(self, region_name='eu-west-1'):
-        self.textract_client = boto3.client('textract', region_name=region_name)
-        self.s3_client = boto3.client('s3', region_name=region_name)
+        # Recorded to / replayed from a cassette when PROVIDER_RECORD_MODE is set
+        self.textract_client = boto3_client('textract', region_name=region_name)
+        self.s3_client = boto3_client('s3', region_name=region_name)
         self.s3_bucket = 'ai-bucket'  # Set your S3 bucket name here
+        self.compactor = build_compactor()  # Strips repeated headers/footers and OCR noise
+        self.page_cache = build_page_cache()  # OCR results of previously seen pages
+        self.render_pool = build_render_pool()  # Renders and PNG-encodes pages outside the request thread
 
-    def convert_pdf_to_images(self, pdf_file):
+    def convert_pdf_to_images(self, pdf_file, pages=None, output_folder=None):
         """
-        Convert each page of a PDF (in-memory) into an image using pdf2image.
+        Convert the pages of a PDF (bytes or a path-like spooled upload) into images using pdf2image.
+
+        Only the selected 1-based `pages` are rendered when given. With an `output_folder`, pages are
+        rendered to disk and the returned images are loaded lazily.
         """
         try:
-            images = convert_from_bytes(pdf_file)
+            with tracing.span("ocr.render"):
+                images = render_pages(pdf_file, pages=pages, output_folder=output_folder)
+            tracing.add_count("ocr.pages", len(images))
+            metrics.OCR_PAGES.inc(len(images), engine='textract')
             return images
         except Exception as e:
             logger.error(f"Failed to convert PDF to images: {e}")
             return []
 
-    def upload_images_to_s3(self, images):
+    def render_pages_png(self, pdf_file, output_dir, pages=None, deadline=None):
+        """
+        Render the PDF to one PNG file per page in output_dir and return their paths, in the
+        render pool when it is enabled.
+        """
+        try:
+            with tracing.span("ocr.render"):
+                page_images = render_png_files(pdf_file, output_dir, pages, self.render_pool, deadline)
+            tracing.add_count("ocr.pages", len(page_images))
+            metrics.OCR_PAGES.inc(len(page_images), engine='textract')
+            return page_images
+        except Exception as e:
+            logger.error(f"Failed to convert PDF to images: {e}")
+            return []
+
+    def upload_images_to_s3(self, images, deadline=None):
         """
-        Uploads images to S3 and returns the list of file paths in S3.
+        Uploads page images (PNG file paths, PNG bytes or PIL images) to S3 and returns the list of
+        file paths in S3. Keys are prefixed with a per-call id so concurrent requests never share them.
         """
         image_paths = []
+        prefix = uuid.uuid4().hex
         try:
-            for i, image in enumerate(images):
-                image_path = f"pdf_image_{i+1}.png"
-                image.save(f"/tmp/{image_path}", 'PNG')  # Save image temporarily
-                self.s3_client.upload_file(Filename=f"/tmp/{image_path}", Bucket=self.s3_bucket, Key=image_path)
-                image_paths.append(image_path)
-                logger.info(f"Uploaded {image_path} to S3 bucket {self.s3_bucket}")
+            with tempfile.TemporaryDirectory(prefix='upload_', dir=os.getenv('UPLOAD_SPOOL_DIR') or None) as upload_dir:
+                for i, image in enumerate(images):
+                    if deadline:
+                        deadline.check("ocr.upload")
+                    image_path = f"{prefix}/pdf_image_{i+1}.png"
+                    local_path = os.path.join(upload_dir, f"pdf_image_{i+1}.png")  # Save image temporarily
+                    if isinstance(image, (str, os.PathLike)):
+                        local_path = os.fspath(image)
+                    elif isinstance(image, (bytes, bytearray)):
+                        with open(local_path, 'wb') as image_file:
+                            image_file.write(image)
+                    else:
+                        image.save(local_path, 'PNG')
+                        image.close()  # Release the page's pixels before rendering the next upload
+                    self.s3_client.upload_file(Filename=local_path, Bucket=self.s3_bucket, Key=image_path)
+                    image_paths.append(image_path)
+                    logger.debug("Uploaded %s to S3 bucket %s", image_path, self.s3_bucket)
         except Exception as e:
             logger.error(f"Failed to upload images to S3: {e}")
         return image_paths
 
+    def analyze_pages(self, image_paths, deadline=None):
+        """
+        Run Textract on page images stored in S3. Returns each page's lines as (text, confidence) tuples.
+
+        Remaining pages are abandoned once the request deadline has passed.
+        """
+        all_pages = []
+        for image_path in image_paths:
+            if deadline:
+                deadline.check("ocr.textract")
+            response = self.textract_client.analyze_document(
+                Document={'S3Object': {'Bucket': self.s3_bucket, 'Name': image_path}},
+                FeatureTypes=["TABLES", "FORMS"])
+
+            page_lines = []
+            for item in response["Blocks"]:
+                if item["BlockType"] == "LINE":
+                    page_lines.append((item["Text"], item["Confidence"]))
+
+            all_pages.append(page_lines)
+            logger.debug("Extracted text from %s with confidence.", image_path)
+        return all_pages
+
+    def combine_pages(self, all_pages):
+        """
+        Join (and compact) the lines of all pages and average their confidence scores.
+        """
+        all_confidence_scores = [confidence for page in all_pages for _, confidence in page]
+        average_confidence = sum(all_confidence_scores) / len(all_confidence_scores) if all_confidence_scores else 0
+        if self.compactor:
+            with tracing.span("ocr.compact"):
+                extracted_text, _ = self.compactor.compact(all_pages)
+        else:
+            extracted_text = " ".join(" ".join(text for text, _ in page) for page in all_pages)
+        return extracted_text, average_confidence
+
     def extract_text_and_confidence(self, image_paths):
         """
         Extract text from images stored in S3 using Textract and calculate confidence scores.
         """
-        all_text = []
-        all_confidence_scores = []
         try:
-            for image_path in image_paths:
-                response = self.textract_client.analyze_document(
-                    Document={'S3Object': {'Bucket': self.s3_bucket, 'Name': image_path}},
-                    FeatureTypes=["TABLES", "FORMS"])
-
-                page_text = []
-                page_confidence_scores = []
-                for item in response["Blocks"]:
-                    if item["BlockType"] == "LINE":
-                        page_text.append(item["Text"])
-                        page_confidence_scores.append(item["Confidence"])
-            
-                all_text.append(" ".join(page_text))  # Combine text of one page into one string
-                all_confidence_scores.extend(page_confidence_scores)  # Collect all confidence scores
-                logger.info(f"Extracted text from {image_path} with confidence.")
-
+            all_pages = self.analyze_pages(image_paths)
         except Exception as e:
             logger.error(f"Failed to extract text from images: {e}")
-            return [], []
-
-        average_confidence = sum(all_confidence_scores) / len(all_confidence_scores) if all_confidence_scores else 0
-        return " ".join(all_text), average_confidence
+            return None, 0
+        return self.combine_pages(all_pages)
 
-    def extract_text_from_pdf(self, pdf_file):
+    def extract_text_from_pdf(self, pdf_file, pages=None, deadline=None):
         """
         Convert the PDF file to images, upload these images to S3, and extract text from them using Textract.
+
+        Only the selected 1-based `pages` are rendered when given, and only pages missing from the
+        page cache are uploaded and OCR'd; cached pages are stitched back in order. Pages are
+        rendered to PNG files in a per-request scratch directory and uploaded from disk.
         """
-        images = self.convert_pdf_to_images(pdf_file)
-        if not images:
-            logger.error("No images created from PDF.")
-            return None, 0
+        with tempfile.TemporaryDirectory(prefix='render_', dir=os.getenv('UPLOAD_SPOOL_DIR') or None) as render_dir:
+            images = self.render_pages_png(pdf_file, render_dir, pages=pages, deadline=deadline)
+            if not images:
+                logger.error("No images created from PDF.")
+                return None, 0
 
-        image_paths = self.upload_images_to_s3(images)
-        if not image_paths:
-            logger.error("No images uploaded to S3.")
-            return None, 0
+            if self.page_cache:
+                keys = [page_hash(image) for image in images]
+                cached_pages, changed = self.page_cache.lookup(keys)
+            else:
+                cached_pages, changed = [None] * len(images), list(range(len(images)))
+
+            image_paths = []
+            if changed:
+                with tracing.span("ocr.upload"):
+                    image_paths = self.upload_images_to_s3([images[i] for i in changed], deadline=deadline)
+                if len(image_paths) < len(changed):
+                    logger.error("Not all page images were uploaded to S3.")
+                    return None, 0
+
+        if image_paths:
+            with tracing.span("ocr.textract"):
+                try:
+                    new_pages = self.analyze_pages(image_paths, deadline=deadline)
+                except Exception as e:
+                    logger.error(f"Failed to extract text from images: {e}")
+                    return None, 0
+            for i, page_lines in zip(changed, new_pages):
+                cached_pages[i] = (page_lines, [confidence for _, confidence in page_lines])
+                if self.page_cache:
+                    self.page_cache.put(keys[i], *cached_pages[i])
 
-        extracted_text, average_confidence = self.extract_text_and_confidence(image_paths)
+        extracted_text, average_confidence = self.combine_pages([page_lines for page_lines, _ in cached_pages])
         # Print the extracted text and average confidence score
-        logger.info(f"Extracted Text: {extracted_text}")
-        logger.info(f"Average Confidence Score: {average_confidence:.2f}")
+        log_payload(logger, "Extracted Text", extracted_text)
+        logger.info("Average Confidence Score: %.2f", average_confidence)
 
         return extracted_text, average_confidence
@@ -0,0 +1,195 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from . import tracing, metrics
+from .deadlines import DeadlineExceeded
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PRIORITY_CLASSES = ('interactive', 'bulk')
+DEFAULT_WEIGHTS = "interactive=4,bulk=1"
+DEFAULT_MAX_SHARES = "interactive=1.0,bulk=0.75"
+
+
+def parse_shares(spec):
+    """Parse "interactive=4,bulk=1" into {class: float}; unknown classes are rejected."""
+    shares = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, value = part.partition("=")
+        name = name.strip().lower()
+        if name not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown priority class {name!r}, expected one of {PRIORITY_CLASSES}")
+        shares[name] = float(value)
+    return shares
+
+
+class _Waiter:
+    __slots__ = ('event', 'enqueued_at')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.enqueued_at = time.monotonic()
+
+
+class FairScheduler:
+    """
+    Admission control for one pipeline stage with a fixed number of concurrent slots.
+
+    Free slots are shared between priority classes by weight (stride scheduling), and between
+    clients of a class round-robin, so one client's batch cannot starve the others. The scheduler
+    is work-conserving: a class can use any idle slot, up to `max_shares` of the capacity, which
+    keeps headroom for interactive requests while bulk jobs are running.
+
+    Args:
+        stage (str): Stage name used in statistics and metrics ('ocr', 'llm').
+        capacity (int): Number of requests allowed in the stage at once.
+        weights (dict): Relative share of contended slots per priority class.
+        max_shares (dict): Largest fraction of the capacity a class may hold.
+    """
+    def __init__(self, stage, capacity, weights=None, max_shares=None):
+        self.stage = stage
+        self.capacity = max(int(capacity), 1)
+        weights = weights or parse_shares(DEFAULT_WEIGHTS)
+        max_shares = max_shares or parse_shares(DEFAULT_MAX_SHARES)
+        self.weights = {cls: max(weights.get(cls, 1.0), 0.01) for cls in PRIORITY_CLASSES}
+        self.limits = {cls: max(int(self.capacity * max_shares.get(cls, 1.0)), 1) for cls in PRIORITY_CLASSES}
+        self._lock = threading.Lock()
+        self._in_flight = {cls: 0 for cls in PRIORITY_CLASSES}
+        self._queues = {cls: OrderedDict() for cls in PRIORITY_CLASSES}  # client -> deque of waiters
+        self._pass = {cls: 0.0 for cls in PRIORITY_CLASSES}
+        self._virtual_time = 0.0
+        self._stats = {cls: {"admitted": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0} for cls in PRIORITY_CLASSES}
+
+    def _queued(self, priority):
+        return sum(len(waiters) for waiters in self._queues[priority].values())
+
+    def _dispatch(self):
+        """Admit waiters while slots are free. Must be called with the lock held."""
+        while sum(self._in_flight.values()) < self.capacity:
+            candidates = [cls for cls in PRIORITY_CLASSES
+                          if self._queues[cls] and self._in_flight[cls] < self.limits[cls]]
+            if not candidates:
+                return
+            priority = min(candidates, key=lambda cls: self._pass[cls])
+            self._virtual_time = self._pass[priority]
+            self._pass[priority] += 1 / self.weights[priority]
+
+            # Serve the client at the head of the rotation, then move it to the back
+            clients = self._queues[priority]
+            client, waiters = next(iter(clients.items()))
+            waiter = waiters.popleft()
+            if waiters:
+                clients.move_to_end(client)
+            else:
+                del clients[client]
+
+            self._in_flight[priority] += 1
+            metrics.SCHEDULER_QUEUE_DEPTH.dec(stage=self.stage, priority=priority)
+            waiter.event.set()
+
+    def acquire(self, priority, client, deadline=None):
+        """
+        Block until the stage admits this request. Returns the time spent waiting, in seconds.
+
+        Raises DeadlineExceeded, leaving the queue, if the request's deadline passes first.
+        """
+        waiter = _Waiter()
+        with self._lock:
+            if not self._queues[priority]:
+                # A class that was idle resumes at the current virtual time instead of its old pass,
+                # so it cannot claim a burst of slots for the time it was not competing
+                self._pass[priority] = max(self._pass[priority], self._virtual_time)
+            self._queues[priority].setdefault(client, deque()).append(waiter)
+            metrics.SCHEDULER_QUEUE_DEPTH.inc(stage=self.stage, priority=priority)
+            self._dispatch()
+        if not waiter.event.wait(deadline.remaining() if deadline else None):
+            with self._lock:
+                if not waiter.event.is_set():
+                    waiters = self._queues[priority][client]
+                    waiters.remove(waiter)
+                    if not waiters:
+                        del self._queues[priority][client]
+                    metrics.SCHEDULER_QUEUE_DEPTH.dec(stage=self.stage, priority=priority)
+                    raise DeadlineExceeded(f"{self.stage} queue")
+
+        wait = time.monotonic() - waiter.enqueued_at
+        with self._lock:
+            stats = self._stats[priority]
+            stats["admitted"] += 1
+            stats["wait_seconds"] += wait
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], wait)
+        metrics.SCHEDULER_WAIT.observe(wait, stage=self.stage, priority=priority)
+        return wait
+
+    def release(self, priority):
+        with self._lock:
+            self._in_flight[priority] -= 1
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, priority, client, deadline=None):
+        """Hold one of the stage's slots for the duration of the block."""
+        wait = self.acquire(priority, client, deadline)
+        tracing.add_count(f"scheduler.{self.stage}.wait_ms", round(wait * 1000, 2))
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def stats(self):
+        """Per-class queue depth, in-flight requests and wait-time statistics."""
+        with self._lock:
+            return {cls: {
+                "queued": self._queued(cls),
+                "in_flight": self._in_flight[cls],
+                "admitted": self._stats[cls]["admitted"],
+                "avg_wait_ms": round(self._stats[cls]["wait_seconds"] * 1000 / self._stats[cls]["admitted"], 2)
+                if self._stats[cls]["admitted"] else 0.0,
+                "max_wait_ms": round(self._stats[cls]["max_wait_seconds"] * 1000, 2),
+            } for cls in PRIORITY_CLASSES}
+
+
+class PipelineScheduler:
+    """
+    Fair schedulers for the OCR and LLM stages, and the request classification they rely on.
+
+    The priority class comes from the `X-Priority` header (or `priority` form field) and the
+    client from the `X-API-Key` or `X-Client-Id` header, falling back to the remote address.
+    """
+    def __init__(self, ocr_concurrency=None, llm_concurrency=None, weights=None, max_shares=None,
+                 default_priority=None):
+        weights = weights or parse_shares(os.getenv('SCHEDULER_WEIGHTS', DEFAULT_WEIGHTS))
+        max_shares = max_shares or parse_shares(os.getenv('SCHEDULER_MAX_SHARES', DEFAULT_MAX_SHARES))
+        self.stages = {
+            'ocr': FairScheduler('ocr', ocr_concurrency if ocr_concurrency is not None
+                                 else int(os.getenv('SCHEDULER_OCR_CONCURRENCY', '8')), weights, max_shares),
+            'llm': FairScheduler('llm', llm_concurrency if llm_concurrency is not None
+                                 else int(os.getenv('SCHEDULER_LLM_CONCURRENCY', '16')), weights, max_shares),
+        }
+        self.default_priority = (default_priority or os.getenv('SCHEDULER_DEFAULT_PRIORITY', 'interactive')).lower()
+
+    def classify(self, headers, values, remote_addr=None):
+        """Return the (priority class, client id) of a request."""
+        priority = (headers.get('X-Priority') or values.get('priority') or self.default_priority).lower()
+        if priority not in PRIORITY_CLASSES:
+            priority = self.default_priority
+        client = headers.get('X-API-Key') or headers.get('X-Client-Id') or remote_addr or 'anonymous'
+        return priority, client
+
+    def slot(self, stage, priority, client, deadline=None):
+        return self.stages[stage].slot(priority, client, deadline)
+
+    def stats(self):
+        return {stage: scheduler.stats() for stage, scheduler in self.stages.items()}
+
+
+def build_scheduler():
+    """Return a PipelineScheduler, or None when SCHEDULER is disabled."""
+    return PipelineScheduler() if os.getenv('SCHEDULER', 'true').lower() == 'true' else None
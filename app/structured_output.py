@@ -0,0 +1,195 @@
+import re
+import json
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TOOL_NAME = "record_answers"
+
+
+def build_answer_schema(questions):
+    """
+    Build a JSON schema describing the expected answer object from the submitted questions.
+
+    Each question becomes a required property keyed by its field_name. A question may carry
+    an optional "type" (e.g. "string", "array") to constrain its answer; otherwise any JSON
+    value (including null for missing information) is accepted.
+    """
+    properties = {}
+    for q in questions:
+        field_schema = {"description": q["question"]}
+        if q.get("type"):
+            field_schema["type"] = [q["type"], "null"]
+        properties[q["field_name"]] = field_schema
+
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": [q["field_name"] for q in questions],
+    }
+
+
+def build_claude_tool(questions):
+    """
+    Build the Claude tool definition that forces answers into the question schema.
+    """
+    return {
+        "name": TOOL_NAME,
+        "description": "Record the answers extracted from the document. Dates must be YYYY-MM-DD, use null for missing values.",
+        "input_schema": build_answer_schema(questions),
+    }
+
+
+def build_openai_response_format(questions):
+    """
+    Build the OpenAI `json_schema` response_format for the question schema.
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": TOOL_NAME,
+            "schema": build_answer_schema(questions),
+        },
+    }
+
+
+def repair_json(response_text):
+    """
+    Tolerantly parse a JSON object out of free-form model output.
+
+    Handles markdown fences, leading/trailing prose, comments, single-quoted strings, unquoted
+    keys, Python/SQL literals (None, True, False, NULL), trailing commas and output truncated
+    before the closing brackets. A value cut off by truncation is dropped with its key rather
+    than returned partially, so the field is treated as unanswered. Returns the parsed dict,
+    or None if nothing usable is found.
+    """
+    if not response_text:
+        return None
+
+    start_index = response_text.find('{')
+    if start_index == -1:
+        logger.error("No JSON-like structure found in the response text.")
+        return None
+
+    candidate = _balance(_normalize(response_text[start_index:]))
+    try:
+        parsed = json.loads(candidate)
+    except json.JSONDecodeError as e:
+        logger.error(f"Unable to repair JSON response: {e}")
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+_COMPLETE_MEMBER = re.compile(r'\s*"(?:[^"\\]|\\.)*"\s*:\s*(?:"(?:[^"\\]|\\.)*"|[\[{].*[\]}])\s*', re.DOTALL)
+_LITERALS = {"None": "null", "NULL": "null", "Null": "null", "True": "true", "False": "false"}
+
+
+def _normalize(text):
+    """
+    Rewrite a JSON-ish string token by token: quote style, unquoted keys, literals and comments.
+    Stops at the end of the first top-level object; when the text ends before it, the last
+    top-level member is dropped unless its value (a string or a closed container) is complete.
+    """
+    out = []
+    depth = 0
+    member_start = 0  # Index in out where the current top-level member begins
+    i = 0
+    length = len(text)
+    while i < length:
+        char = text[i]
+        if char in '"\'':
+            # Copy a string, converting single-quoted strings to double-quoted ones
+            quote = char
+            j = i + 1
+            buf = []
+            while j < length and text[j] != quote:
+                if text[j] == '\\' and j + 1 < length:
+                    buf.append(text[j:j + 2])
+                    j += 2
+                    continue
+                if text[j] == '"' and quote == "'":
+                    buf.append('\\"')
+                elif text[j] == '\n':
+                    buf.append('\\n')
+                else:
+                    buf.append(text[j])
+                j += 1
+            if j >= length:
+                break  # Unterminated string: truncated output
+            out.append('"' + "".join(buf).replace("\\'", "'") + '"')
+            i = j + 1
+            continue
+        if text.startswith('//', i):
+            newline = text.find('\n', i)
+            i = length if newline == -1 else newline
+            continue
+        if text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            i = length if end == -1 else end + 2
+            continue
+        if char.isalpha():
+            word = re.match(r'\w+', text[i:]).group(0)  # isalpha() also holds for non-ASCII letters
+            i += len(word)
+            if text[i:].lstrip().startswith(':'):
+                out.append(json.dumps(word))  # Unquoted key
+            else:
+                out.append(_LITERALS.get(word, word))
+            continue
+        if char in '{[':
+            depth += 1
+        elif char in '}]':
+            depth -= 1
+            if depth == 0:
+                out.append(char)
+                return "".join(out)
+        out.append(char)
+        i += 1
+        if depth == 1 and char in '{,':
+            member_start = len(out)
+    # Truncated before the object closed: a value still open (or a number or literal that may be
+    # cut short) would be returned partially, so the whole member goes
+    member = "".join(out[member_start:])
+    if depth != 1 or not _COMPLETE_MEMBER.fullmatch(member):
+        del out[member_start:]
+    return "".join(out)
+
+
+def _balance(text):
+    """
+    Remove trailing commas and close any brackets left open by truncated output.
+    """
+    text = re.sub(r',\s*([\]}])', r'\1', text).rstrip()
+    # Drop a dangling separator left by truncation
+    text = re.sub(r'[,:]\s*$', '', text)
+
+    stack = _open_brackets(text)
+    if stack and stack[-1] == '}':
+        # A dangling key without a value inside an object
+        text = re.sub(r'([{,])\s*"[^"]*"\s*$', lambda m: '' if m.group(1) == ',' else '{', text)
+    return text + "".join(reversed(_open_brackets(text)))
+
+
+def _open_brackets(text):
+    """
+    Return the closing brackets still expected at the end of text, innermost last.
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]' and stack:
+            stack.pop()
+    return stack
@@ -0,0 +1,133 @@
+import os
+import re
+import logging
+from . import tracing, metrics
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Lines that never carry answerable content
+DEFAULT_BOILERPLATE_PATTERNS = [
+    r"page\s*\d+\s*(?:of|/)\s*\d+",
+    r"page\s*\d+",
+]
+
+_WHITESPACE = re.compile(r"\s+")
+_ALPHANUMERIC = re.compile(r"[^\W_]")
+
+
+class TextCompactor:
+    """
+    Shrink OCR output before it is sent to the LLM.
+
+    - collapses whitespace and drops empty or punctuation-only lines,
+    - drops lines whose OCR confidence is below `min_confidence` (0-100 scale),
+    - drops page numbers and configured boilerplate patterns,
+    - keeps only the first occurrence of header/footer lines (the first or last
+      `edge_lines` lines of a page) that repeat on at least `repeat_ratio` of the pages.
+
+    Args:
+        min_confidence (float): Lines below this confidence are treated as OCR garbage.
+        repeat_ratio (float): Share of pages a header/footer line must appear on to be stripped.
+        edge_lines (int): How many lines at the top and bottom of a page count as header/footer.
+        boilerplate_patterns (list): Regexes matching whole lines to drop.
+    """
+    def __init__(self, min_confidence=None, repeat_ratio=None, edge_lines=None, boilerplate_patterns=None):
+        self.min_confidence = float(min_confidence if min_confidence is not None
+                                    else os.getenv('OCR_COMPACTION_MIN_CONFIDENCE', '40'))
+        self.repeat_ratio = float(repeat_ratio if repeat_ratio is not None
+                                  else os.getenv('OCR_COMPACTION_REPEAT_RATIO', '0.6'))
+        self.edge_lines = int(edge_lines if edge_lines is not None else os.getenv('OCR_COMPACTION_EDGE_LINES', '3'))
+        if boilerplate_patterns is None:
+            boilerplate_patterns = list(DEFAULT_BOILERPLATE_PATTERNS)
+            patterns_path = os.getenv('OCR_BOILERPLATE_PATTERNS')
+            if patterns_path:
+                with open(patterns_path) as patterns_file:
+                    boilerplate_patterns += [line.strip() for line in patterns_file if line.strip()]
+        self.boilerplate = re.compile("|".join(f"(?:{pattern})" for pattern in boilerplate_patterns), re.IGNORECASE) \
+            if boilerplate_patterns else None
+
+    def _is_edge(self, index, page_length):
+        """Whether the line at index is among the first or last `edge_lines` lines of its page."""
+        return index < self.edge_lines or index >= page_length - self.edge_lines
+
+    def _repeated_edge_lines(self, pages):
+        """Return the normalized header/footer lines repeated across enough pages."""
+        if len(pages) < 2:
+            return set()
+        seen_on = {}
+        for page in pages:
+            edges = page[:self.edge_lines] + page[-self.edge_lines:] if self.edge_lines else []
+            for line in {text.lower() for text, _ in edges}:
+                seen_on[line] = seen_on.get(line, 0) + 1
+        threshold = max(2, self.repeat_ratio * len(pages))
+        return {line for line, count in seen_on.items() if count >= threshold}
+
+    def compact(self, pages):
+        """
+        Compact OCR output given as pages of (line_text, confidence) tuples.
+
+        Confidence may be None when the engine does not report one. Returns the compacted text
+        (lines joined by spaces, as before) and a dict of statistics.
+        """
+        original_chars = sum(len(text) for page in pages for text, _ in page) + max(
+            sum(len(page) for page in pages) - 1, 0)
+        stats = {"lines_in": 0, "low_confidence": 0, "noise": 0, "boilerplate": 0, "repeated": 0}
+
+        cleaned_pages = []
+        for page in pages:
+            cleaned = []
+            for text, confidence in page:
+                stats["lines_in"] += 1
+                text = _WHITESPACE.sub(" ", text or "").strip()
+                if not _ALPHANUMERIC.search(text):
+                    stats["noise"] += 1
+                elif confidence is not None and confidence < self.min_confidence:
+                    stats["low_confidence"] += 1
+                elif self.boilerplate and self.boilerplate.fullmatch(text):
+                    stats["boilerplate"] += 1
+                else:
+                    cleaned.append((text, confidence))
+            cleaned_pages.append(cleaned)
+
+        repeated = self._repeated_edge_lines(cleaned_pages)
+        kept_once = set()
+        lines = []
+        for page in cleaned_pages:
+            for index, (text, _) in enumerate(page):
+                key = text.lower()
+                # The same text in the body of a page (e.g. a party name) is content, not a header/footer
+                if key in repeated and self._is_edge(index, len(page)):
+                    if key in kept_once:
+                        stats["repeated"] += 1
+                        continue
+                    kept_once.add(key)
+                lines.append(text)
+
+        compacted = " ".join(lines)
+        stats["chars_saved"] = max(original_chars - len(compacted), 0)
+        stats["tokens_saved"] = stats["chars_saved"] // 4  # Rough estimate, 1 token ≈ 4 characters
+        self._report(stats)
+        return compacted, stats
+
+    def compact_text(self, text):
+        """Whitespace-only compaction for engines that do not expose lines."""
+        compacted = _WHITESPACE.sub(" ", text or "").strip()
+        stats = {"chars_saved": len(text or "") - len(compacted)}
+        stats["tokens_saved"] = stats["chars_saved"] // 4
+        self._report(stats)
+        return compacted, stats
+
+    @staticmethod
+    def _report(stats):
+        tracing.add_count("compaction.chars_saved", stats["chars_saved"])
+        tracing.add_count("compaction.tokens_saved", stats["tokens_saved"])
+        metrics.COMPACTION_SAVED.inc(stats["chars_saved"], unit='chars')
+        metrics.COMPACTION_SAVED.inc(stats["tokens_saved"], unit='tokens')
+        logger.info("OCR compaction saved %d chars (~%d tokens): %s", stats["chars_saved"], stats["tokens_saved"], stats)
+
+
+def build_compactor():
+    """Return a TextCompactor, or None when OCR_COMPACTION is disabled."""
+    return TextCompactor() if os.getenv('OCR_COMPACTION', 'true').lower() == 'true' else None
@@ -0,0 +1,102 @@
+import time
+import uuid
+import logging
+import contextvars
+from contextlib import contextmanager
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The trace of the request currently being processed, if any
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+
+# Callbacks notified of every finished span, e.g. to feed latency histograms
+_span_listeners = []
+
+
+class RequestTrace:
+    """
+    Timing spans and counters (tokens, retries, pages...) collected while processing one request.
+    """
+    def __init__(self, request_id=None):
+        self.request_id = request_id or uuid.uuid4().hex
+        self.started_at = time.perf_counter()
+        self.spans = []  # (name, duration in seconds)
+        self.counters = {}
+
+    def add_span(self, name, duration):
+        self.spans.append((name, duration))
+
+    def add_count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def stage_durations(self):
+        """Total milliseconds per stage name; repeated spans (e.g. retries) are summed."""
+        durations = {}
+        for name, duration in self.spans:
+            durations[name] = durations.get(name, 0.0) + duration * 1000
+        return {name: round(ms, 2) for name, ms in durations.items()}
+
+    def timings(self):
+        """Return the stage durations and counters as a JSON-serializable dict."""
+        return {
+            "total_ms": round((time.perf_counter() - self.started_at) * 1000, 2),
+            "stages_ms": self.stage_durations(),
+            "counters": dict(self.counters),
+        }
+
+    def server_timing_header(self):
+        """Format the stage durations as a `Server-Timing` header value."""
+        metrics = [f"{name};dur={ms}" for name, ms in self.stage_durations().items()]
+        metrics.append(f"total;dur={round((time.perf_counter() - self.started_at) * 1000, 2)}")
+        return ", ".join(metrics)
+
+    def to_log_record(self, **fields):
+        """Build the structured per-request log record."""
+        record = {"request_id": self.request_id}
+        record.update(fields)
+        record.update(self.timings())
+        return record
+
+
+@contextmanager
+def trace_request(request_id=None):
+    """Start a new trace for the current request and make it the active one."""
+    trace = RequestTrace(request_id)
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def add_span_listener(listener):
+    """Register a callable(name, duration) invoked whenever a span finishes."""
+    _span_listeners.append(listener)
+
+
+@contextmanager
+def span(name):
+    """Time a pipeline stage or provider call and record it on the active trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(name, duration)
+        for listener in _span_listeners:
+            listener(name, duration)
+
+
+def add_count(name, value=1):
+    """Add to a counter on the active trace (no-op outside a request)."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_count(name, value)
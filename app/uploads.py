@@ -0,0 +1,144 @@
+import os
+import re
+import hashlib
+import logging
+import tempfile
+from pdf2image import convert_from_bytes, convert_from_path, pdfinfo_from_bytes, pdfinfo_from_path
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_PAGE_RANGE = re.compile(r"(\d+)(?:\s*-\s*(\d+))?")
+
+
+def parse_pages(spec, max_pages=None):
+    """
+    Parse a page selection such as "1-3,5" into a sorted list of 1-based page numbers.
+
+    Returns None for an empty selection (all pages). Raises ValueError on malformed ranges.
+    """
+    if spec is None or not str(spec).strip():
+        return None
+    max_pages = int(max_pages if max_pages is not None else os.getenv('MAX_SELECTED_PAGES', '500'))
+    pages = set()
+    for part in str(spec).split(","):
+        match = _PAGE_RANGE.fullmatch(part.strip())
+        if not match:
+            raise ValueError(f"Invalid page range: {part.strip()!r}")
+        first = int(match.group(1))
+        last = int(match.group(2) or first)
+        if first < 1 or last < first:
+            raise ValueError(f"Invalid page range: {part.strip()!r}")
+        if last - first + 1 + len(pages) > max_pages:
+            raise ValueError(f"At most {max_pages} pages can be selected")
+        pages.update(range(first, last + 1))
+    return sorted(pages)
+
+
+def page_count(pdf_file):
+    """Number of pages of a PDF given as bytes or as a path-like object."""
+    if isinstance(pdf_file, (bytes, bytearray)):
+        return pdfinfo_from_bytes(pdf_file)["Pages"]
+    return pdfinfo_from_path(os.fspath(pdf_file))["Pages"]
+
+
+def check_pages(pages, pdf_file):
+    """
+    Raise ValueError when a page selection goes past the end of the document. The check is
+    skipped (with a warning) when the page count cannot be read.
+    """
+    if not pages:
+        return
+    try:
+        total = page_count(pdf_file)
+    except Exception as e:
+        logger.warning("Cannot read the page count to check the page selection: %s", e)
+        return
+    if pages[-1] > total:
+        raise ValueError(f"Page {pages[-1]} is out of range, the document has {total} pages")
+
+
+def page_runs(pages):
+    """Group sorted page numbers into contiguous (first_page, last_page) runs."""
+    runs = []
+    for page in pages:
+        if runs and page == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], page)
+        else:
+            runs.append((page, page))
+    return runs
+
+
+class SpooledUpload:
+    """
+    An uploaded PDF copied to disk in fixed-size chunks and hashed on the way.
+
+    The OCR engines receive this object (it is path-like) instead of a bytes copy of the upload,
+    so per-request memory does not grow with the size of the document.
+
+    Args:
+        stream: Readable binary stream of the upload.
+        spool_dir (str): Directory for the spooled file; defaults to UPLOAD_SPOOL_DIR or the system temp dir.
+        chunk_size (int): Bytes copied per read; defaults to UPLOAD_CHUNK_SIZE (1 MB).
+    """
+    def __init__(self, stream, spool_dir=None, chunk_size=None):
+        spool_dir = spool_dir if spool_dir is not None else os.getenv('UPLOAD_SPOOL_DIR') or None
+        chunk_size = int(chunk_size if chunk_size is not None else os.getenv('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))
+        fd, self.path = tempfile.mkstemp(prefix='upload_', suffix='.pdf', dir=spool_dir)
+        digest = hashlib.sha256()
+        self.size = 0
+        try:
+            with os.fdopen(fd, 'wb') as spool_file:
+                while True:
+                    chunk = stream.read(chunk_size)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    spool_file.write(chunk)
+                    self.size += len(chunk)
+        except BaseException:
+            self.close()
+            raise
+        self.sha256 = digest.hexdigest()
+
+    def __fspath__(self):
+        return self.path
+
+    def close(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_pdf(pdf_file):
+    """Return the content of a PDF given as bytes or as a path-like object, for inline-only providers."""
+    if isinstance(pdf_file, (bytes, bytearray)):
+        return pdf_file
+    with open(os.fspath(pdf_file), 'rb') as pdf:
+        return pdf.read()
+
+
+def render_pages(pdf_file, pages=None, output_folder=None):
+    """
+    Render the pages of a PDF (bytes or path-like) into images with pdf2image.
+
+    Only the selected 1-based `pages` are rendered when given, one call per contiguous run. With an
+    `output_folder`, pages are rendered to disk and the returned images are loaded lazily.
+    """
+    options = {"output_folder": output_folder} if output_folder else {}
+    images = []
+    for run in (page_runs(pages) if pages else [None]):
+        run_options = dict(options, first_page=run[0], last_page=run[1]) if run else options
+        if isinstance(pdf_file, (bytes, bytearray)):
+            images += convert_from_bytes(pdf_file, **run_options)
+        else:
+            images += convert_from_path(os.fspath(pdf_file), **run_options)
+    return images
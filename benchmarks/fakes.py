@@ -0,0 +1,158 @@
+"""
+Local stand-ins for the cloud backends used by the pipeline (S3, Textract, Bedrock, Document AI).
+
+Each fake mimics the subset of the client API the app calls, and simulates latency,
+throttling and server errors so throughput and retry behaviour can be measured offline.
+"""
+import io
+import json
+import time
+import random
+import threading
+from types import SimpleNamespace
+from botocore.exceptions import ClientError
+
+# Text returned by the fake OCR engines for each page, shaped like a transaction certificate
+PAGE_TEMPLATE = [
+    "Transaction Certificate (TC) for Products certified to Global Organic Textile Standard",
+    "Certification Body: Control Union Certifications B.V.",
+    "TC Number: CU-{page:04d}-{seed}",
+    "Certificate Issue Date: 12.03.2024",
+    "Certificate Validity Start Date: 01.03.2024",
+    "Certificate Validity End Date: 28.02.2025",
+    "Shipment No. {page}  Shipment Date: 0{month}.02.2024  Gross Shipping Weight: {weight} kg",
+    "Invoice References: INV-{seed}-{page}",
+    "Page {page} of {pages}",
+]
+
+
+class FakeBackend:
+    """
+    Base class simulating per-call latency, throttling and server errors.
+
+    Args:
+        latency (float): Mean latency per call in seconds.
+        jitter (float): Relative latency jitter (0.2 = +/-20%).
+        throttle_rate (float): Probability a call raises a ThrottlingException.
+        error_rate (float): Probability a call raises an InternalServerException.
+        seed (int): Seed for the random generator, for reproducible runs.
+    """
+    operation_name = "Call"
+
+    def __init__(self, latency=0.0, jitter=0.2, throttle_rate=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.throttled = 0
+        self.failed = 0
+
+    def _simulate(self):
+        with self._lock:
+            self.calls += 1
+            roll = self._random.random()
+            delay = self.latency * (1 + self._random.uniform(-self.jitter, self.jitter))
+        time.sleep(max(delay, 0))
+        if roll < self.throttle_rate:
+            with self._lock:
+                self.throttled += 1
+            raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, self.operation_name)
+        if roll < self.throttle_rate + self.error_rate:
+            with self._lock:
+                self.failed += 1
+            raise ClientError({"Error": {"Code": "InternalServerException", "Message": "Injected failure"}}, self.operation_name)
+
+    def stats(self):
+        return {"calls": self.calls, "throttled": self.throttled, "failed": self.failed}
+
+
+def page_lines(page, pages, seed=0):
+    """Return the OCR lines of a fake certificate page."""
+    values = {"page": page, "pages": pages, "seed": seed, "month": page % 9 + 1, "weight": 100 + page * 10}
+    return [line.format(**values) for line in PAGE_TEMPLATE]
+
+
+class FakeS3(FakeBackend):
+    operation_name = "PutObject"
+
+    def upload_file(self, Filename, Bucket, Key, **kwargs):
+        self._simulate()
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, **kwargs):
+        self._simulate()
+
+    def put_object(self, Bucket, Key, Body=None, **kwargs):
+        self._simulate()
+        return {"ETag": '"fake"'}
+
+
+class FakeTextract(FakeBackend):
+    operation_name = "AnalyzeDocument"
+
+    def analyze_document(self, Document, FeatureTypes=None, **kwargs):
+        self._simulate()
+        name = Document.get("S3Object", {}).get("Name", "")
+        digits = "".join(char for char in name if char.isdigit())
+        page = int(digits) if digits else 1
+        blocks = [{"BlockType": "PAGE", "Id": "page"}]
+        for i, line in enumerate(page_lines(page, page)):
+            blocks.append({"BlockType": "LINE", "Text": line, "Confidence": 99.0 - (i % 3)})
+        return {"Blocks": blocks, "DocumentMetadata": {"Pages": 1}}
+
+
+class FakeBedrock(FakeBackend):
+    """
+    Answers Claude (messages API, optionally with a forced tool call) and Mistral (prompt API) requests
+    with a JSON object covering the requested fields.
+    """
+    operation_name = "InvokeModel"
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self._simulate()
+        request = json.loads(body)
+        if "messages" in request:
+            prompt = json.dumps(request["messages"])
+            answer = self._answer(request.get("tools", [{}])[0].get("input_schema", {}).get("properties"))
+            if request.get("tools"):
+                content = [{"type": "tool_use", "id": "fake", "name": request["tools"][0]["name"], "input": answer}]
+            else:
+                content = [{"type": "text", "text": json.dumps(answer)}]
+            payload = {
+                "content": content,
+                "usage": {"input_tokens": len(prompt) // 4, "output_tokens": len(json.dumps(answer)) // 4},
+            }
+        else:
+            payload = {"outputs": [{"text": json.dumps(self._answer(None)), "stop_reason": "stop"}]}
+        return {"body": io.BytesIO(json.dumps(payload).encode("utf-8"))}
+
+    @staticmethod
+    def _answer(properties):
+        fields = properties or {"CertificateName": {}, "CertificateIssueDate": {}, "shipments": {}}
+        return {name: ([] if name in ("shipments", "products") else "fake answer") for name in fields}
+
+
+class FakeDocumentAI(FakeBackend):
+    """Mimics DocumentProcessorServiceClient.process_document for GoogleOCR."""
+    operation_name = "ProcessDocument"
+
+    def __init__(self, pages=1, **kwargs):
+        super().__init__(**kwargs)
+        self.pages = pages
+
+    def process_document(self, request=None, **kwargs):
+        self._simulate()
+        content = request.raw_document.content if request is not None else b""
+        pages = max(bytes(content).count(b"/Type /Page") - bytes(content).count(b"/Type /Pages"), self.pages)
+        text = "\n".join("\n".join(page_lines(page, pages)) for page in range(1, pages + 1))
+        document = SimpleNamespace(
+            text=text,
+            entities=[],
+            pages=[
+                SimpleNamespace(blocks=[SimpleNamespace(layout=SimpleNamespace(confidence=0.97))], lines=[])
+                for _ in range(pages)
+            ],
+        )
+        return SimpleNamespace(document=document)
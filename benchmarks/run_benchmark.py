@@ -0,0 +1,321 @@
+"""
+Offline benchmark and load test for /process-pdf.
+
+Drives the real Flask app and pipeline code with the fake backends from benchmarks.fakes,
+using the bundled PDFs and synthetic N-page PDFs at controlled concurrency, and reports
+latency percentiles, throughput and peak RSS per stage as JSON.
+
+Example:
+    python -m benchmarks.run_benchmark --pages 1 10 --concurrency 1 8 --requests 40 \\
+        --latency textract=0.4 --latency bedrock=2.0 --throttle-rate 0.05 --output bench.json
+    python -m benchmarks.run_benchmark --baseline bench.json --output bench_new.json
+
+With --cassette, provider calls are replayed from a recording made with PROVIDER_RECORD_MODE=record
+instead of the fakes (send the recorded PDFs with --pdf and no synthetic --pages):
+    python -m benchmarks.run_benchmark --cassette 'cassettes/providers_{pid}.jsonl.gz' --pdf TC.pdf --pages
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import resource
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from .fakes import FakeS3, FakeTextract, FakeBedrock, FakeDocumentAI
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_LATENCY = {"s3": 0.05, "textract": 0.4, "bedrock": 2.0, "documentai": 1.5}
+
+QUESTIONS = [
+    {"field_name": "CertificateAuditor", "question": "CertificateAuditor"},
+    {"field_name": "CertificateIssueDate", "question": "CertificateIssueDate"},
+    {"field_name": "CertificateValidityStartDate", "question": "CertificateValidityStartDate"},
+    {"field_name": "CertificateValidityEndDate", "question": "CertificateValidityEndDate"},
+    {"field_name": "shipments", "question": "shipments"},
+]
+
+
+def synthetic_pdf(pages, seed=0):
+    """Build an N-page scanned-looking PDF (one raster image per page) in memory."""
+    from PIL import Image, ImageDraw
+    from .fakes import page_lines
+
+    images = []
+    for page in range(1, pages + 1):
+        image = Image.new("L", (1240, 1754), color=255)  # A4 at 150 dpi
+        draw = ImageDraw.Draw(image)
+        for i, line in enumerate(page_lines(page, pages, seed)):
+            draw.text((80, 120 + i * 60), line, fill=0)
+        images.append(image)
+    buffer = io.BytesIO()
+    images[0].save(buffer, "PDF", save_all=True, append_images=images[1:], resolution=150)
+    return buffer.getvalue()
+
+
+def count_pdf_pages(pdf_bytes):
+    return max(pdf_bytes.count(b"/Type /Page") - pdf_bytes.count(b"/Type /Pages"), 1)
+
+
+def fake_convert_from_bytes(pdf_file, first_page=None, last_page=None, **kwargs):
+    """Stand-in for pdf2image when poppler is not installed: blank A4 pages at 150 dpi."""
+    from PIL import Image
+    page_count = count_pdf_pages(pdf_file)
+    first_page, last_page = first_page or 1, min(last_page or page_count, page_count)
+    return [Image.new("RGB", (1240, 1754), color="white") for _ in range(first_page, last_page + 1)]
+
+
+def fake_convert_from_path(pdf_path, **kwargs):
+    with open(pdf_path, "rb") as pdf_file:
+        return fake_convert_from_bytes(pdf_file.read(), **kwargs)
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q):
+        return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)], 2)
+
+    return {
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "mean": round(sum(ordered) / len(ordered), 2),
+        "max": round(ordered[-1], 2),
+    }
+
+
+class StageRssSampler:
+    """Tracks the highest RSS observed at the end of each stage's spans."""
+    def __init__(self):
+        self.peaks = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, name, duration):
+        rss = current_rss_mb()
+        with self._lock:
+            self.peaks[name] = max(self.peaks.get(name, 0.0), rss)
+
+
+def build_pipeline(args):
+    """Import the app with fake backends (or cassette replay) wired into the OCR and LLM instances."""
+    if args.cassette:
+        os.environ["PROVIDER_RECORD_MODE"] = "replay"
+        os.environ["PROVIDER_CASSETTE"] = args.cassette
+        os.environ["PROVIDER_REPLAY_LATENCY_SCALE"] = str(args.latency_scale)
+    os.environ["OCR_TYPE"] = "textract"
+    os.environ["LLM_TYPE"] = args.llm
+    os.environ.setdefault("AWS_DEFAULT_REGION", "eu-west-3")
+    os.environ.setdefault("BEDROCK_REGIONS", ",".join(f"fake-region-{i}" for i in range(args.regions)))
+    # Measure the cold pipeline: the same PDFs are sent repeatedly and would otherwise hit the caches
+    os.environ.setdefault("ANSWER_CACHE_MAX_DOCUMENTS", "0")
+    os.environ.setdefault("OCR_PAGE_CACHE", "false")
+
+    from app import api, tracing
+
+    backend_options = {"throttle_rate": args.throttle_rate, "error_rate": args.error_rate, "jitter": args.jitter}
+    latency = dict(DEFAULT_LATENCY, **args.latency)
+    scale = args.latency_scale
+    fakes = {}
+
+    if args.ocr == "textract":
+        if not args.cassette:  # Otherwise the S3 and Textract clients replay the cassette
+            fakes["s3"] = api.ocr_instance.s3_client = FakeS3(latency=latency["s3"] * scale, seed=args.seed, **backend_options)
+            fakes["textract"] = api.ocr_instance.textract_client = FakeTextract(
+                latency=latency["textract"] * scale, seed=args.seed + 1, **backend_options)
+        if args.fake_render:
+            import app.uploads as uploads_module
+            uploads_module.convert_from_bytes = fake_convert_from_bytes
+            uploads_module.convert_from_path = fake_convert_from_path
+            # Render pool workers are separate processes and would not see the fake renderer
+            api.ocr_instance.render_pool = None
+    else:
+        from app.ocr_google import GoogleOCR
+        from app.text_compaction import build_compactor
+        from app.page_cache import build_page_cache
+        google_ocr = GoogleOCR.__new__(GoogleOCR)
+        google_ocr.compactor = build_compactor()
+        google_ocr.page_cache = build_page_cache()
+        google_ocr.render_pool = None  # Pages are only rendered for the page cache, in-process here
+        google_ocr.max_tiff_bytes = 15 * 1024 * 1024
+        if args.cassette:
+            from google.cloud import documentai_v1 as documentai
+            from app.cassettes import ProtoCodec, recorded_client
+            google_ocr.documentai_client = recorded_client('documentai', documentai.DocumentProcessorServiceClient,
+                                                           ('process_document',), codec=ProtoCodec(documentai.ProcessResponse))
+        else:
+            fakes["documentai"] = google_ocr.documentai_client = FakeDocumentAI(
+                latency=latency["documentai"] * scale, seed=args.seed + 2, **backend_options)
+        api.ocr_instance = google_ocr
+
+    for i, region in enumerate([] if args.cassette else api.llm_instance.bedrock_client.regions):
+        fakes[f"bedrock:{region.region_name}"] = region.client = FakeBedrock(
+            latency=latency["bedrock"] * scale, seed=args.seed + 10 + i, **backend_options)
+
+    sampler = StageRssSampler()
+    tracing.add_span_listener(sampler)
+    return api.app, fakes, sampler
+
+
+def run_scenario(flask_app, sampler, name, pdf_bytes, concurrency, total_requests):
+    """Send total_requests requests with at most `concurrency` in flight and summarize them."""
+    latencies = []
+    stage_timings = {}
+    status_codes = {}
+    lock = threading.Lock()
+    sampler.peaks.clear()
+    questions = json.dumps(QUESTIONS)
+
+    def one_request(_):
+        client = flask_app.test_client()
+        data = {"file": (io.BytesIO(pdf_bytes), f"{name}.pdf"), "questions": questions, "timings": "true"}
+        start = time.perf_counter()
+        response = client.post("/process-pdf", data=data, content_type="multipart/form-data")
+        elapsed = (time.perf_counter() - start) * 1000
+        payload = response.get_json(silent=True) or {}
+        with lock:
+            latencies.append(elapsed)
+            status_codes[response.status_code] = status_codes.get(response.status_code, 0) + 1
+            for stage, ms in payload.get("timings", {}).get("stages_ms", {}).items():
+                stage_timings.setdefault(stage, []).append(ms)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one_request, range(total_requests)))
+    wall_time = time.perf_counter() - start
+
+    return {
+        "name": name,
+        "pages": count_pdf_pages(pdf_bytes),
+        "size_bytes": len(pdf_bytes),
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "status_codes": {str(code): count for code, count in sorted(status_codes.items())},
+        "wall_time_s": round(wall_time, 3),
+        "throughput_rps": round(total_requests / wall_time, 3) if wall_time else None,
+        "latency_ms": percentiles(latencies),
+        "stages": {
+            stage: dict(percentiles(values), peak_rss_mb=round(sampler.peaks.get(stage, 0.0), 1))
+            for stage, values in sorted(stage_timings.items())
+        },
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def compare(baseline, results):
+    """Print p50/p95/throughput deltas of matching scenarios against a previous run."""
+    previous = {(s["name"], s["concurrency"]): s for s in baseline.get("scenarios", [])}
+    for scenario in results["scenarios"]:
+        before = previous.get((scenario["name"], scenario["concurrency"]))
+        if not before:
+            continue
+        deltas = []
+        for label, old, new in (
+            ("p50", before["latency_ms"].get("p50"), scenario["latency_ms"].get("p50")),
+            ("p95", before["latency_ms"].get("p95"), scenario["latency_ms"].get("p95")),
+            ("rps", before["throughput_rps"], scenario["throughput_rps"]),
+        ):
+            if old:
+                deltas.append(f"{label} {old} -> {new} ({(new - old) / old * 100:+.1f}%)")
+        print(f"{scenario['name']} c={scenario['concurrency']}: " + ", ".join(deltas), file=sys.stderr)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_latency(value):
+    service, _, seconds = value.partition("=")
+    if service not in DEFAULT_LATENCY or not seconds:
+        raise argparse.ArgumentTypeError(f"Expected SERVICE=SECONDS with SERVICE in {sorted(DEFAULT_LATENCY)}")
+    return service, float(seconds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ocr", choices=["textract", "google"], default="textract")
+    parser.add_argument("--llm", choices=["claude", "mistral"], default="claude")
+    parser.add_argument("--pdf", nargs="*", default=["TC.pdf", "1.pdf"], help="PDF files to send (relative to the repo root)")
+    parser.add_argument("--pages", nargs="*", type=int, default=[1, 5, 20], help="Page counts of synthetic PDFs")
+    parser.add_argument("--concurrency", nargs="*", type=int, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=20, help="Requests per scenario")
+    parser.add_argument("--latency", action="append", type=parse_latency, default=[],
+                        help="Mean backend latency, e.g. bedrock=2.0 (services: s3, textract, bedrock, documentai)")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiply every backend latency")
+    parser.add_argument("--cassette", help="Replay provider calls from this recording instead of the fake backends")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--regions", type=int, default=2, help="Number of fake Bedrock regions")
+    parser.add_argument("--fake-render", action="store_true", help="Replace pdf2image (e.g. when poppler is missing)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+    parser.add_argument("--baseline", help="Previous results file to compare against")
+    args = parser.parse_args(argv)
+    args.latency = dict(args.latency)
+
+    random.seed(args.seed)
+    flask_app, fakes, sampler = build_pipeline(args)
+    # Per-request INFO logs would dominate the measurements
+    logging.getLogger().setLevel(logging.WARNING)
+
+    documents = [(os.path.splitext(os.path.basename(path))[0], open(os.path.join(ROOT, path), "rb").read())
+                 for path in args.pdf]
+    documents += [(f"synthetic_{pages}p", synthetic_pdf(pages, args.seed)) for pages in args.pages]
+
+    scenarios = []
+    for name, pdf_bytes in documents:
+        for concurrency in args.concurrency:
+            scenarios.append(run_scenario(flask_app, sampler, name, pdf_bytes, concurrency, args.requests))
+            print(f"{name} c={concurrency}: p50={scenarios[-1]['latency_ms'].get('p50')}ms "
+                  f"rps={scenarios[-1]['throughput_rps']}", file=sys.stderr)
+
+    results = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "backends": {name: fake.stats() for name, fake in fakes.items()},
+        "scenarios": scenarios,
+    }
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            compare(json.load(baseline_file), results)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import hashlib
+from app.answer_cache import AnswerCache
+
+
+def test_answers_are_cached_per_model_and_field():
+    """
+    Test that answers are returned only for the same document, model and field.
+    """
+    cache = AnswerCache(max_documents=10, ttl=0)
+    doc_hash = hashlib.sha256(b"%PDF-1.4 fake").hexdigest()
+    cache.store_document(doc_hash, "Extracted text", 97.5)
+    cache.store_answers(doc_hash, "claude", {"CertificateAuditor": "Control Union", "shipments": []})
+
+    assert cache.get_document(doc_hash) == ("Extracted text", 97.5)
+    assert cache.get_answers(doc_hash, "claude", ["CertificateAuditor", "shipments", "products"]) == {
+        "CertificateAuditor": "Control Union", "shipments": []}
+    assert cache.get_answers(doc_hash, "mistral", ["CertificateAuditor"]) == {}
+    assert cache.get_answers(hashlib.sha256(b"other").hexdigest(), "claude", ["CertificateAuditor"]) == {}
+
+
+def test_answers_require_cached_document():
+    """
+    Test that answers for an unknown document are not stored.
+    """
+    cache = AnswerCache(max_documents=10, ttl=0)
+    cache.store_answers("unknown", "claude", {"CertificateAuditor": "x"})
+
+    assert cache.get_answers("unknown", "claude", ["CertificateAuditor"]) == {}
+
+
+def test_least_recently_used_document_is_evicted():
+    """
+    Test the LRU bound on cached documents.
+    """
+    cache = AnswerCache(max_documents=2, ttl=0)
+    cache.store_document("a", "text a", 90.0)
+    cache.store_document("b", "text b", 90.0)
+    cache.get_document("a")
+    cache.store_document("c", "text c", 90.0)
+
+    assert cache.get_document("b") is None
+    assert cache.get_document("a") is not None
+    assert cache.get_document("c") is not None
+
+
+def test_expired_document_is_dropped():
+    """
+    Test that entries older than the TTL are ignored.
+    """
+    cache = AnswerCache(max_documents=2, ttl=60)
+    cache.store_document("a", "text a", 90.0)
+    cache._entries["a"]["created_at"] -= 120
+
+    assert cache.get_document("a") is None
@@ -1,9 +1,11 @@
 import pytest
-from app.api import app
+from app.api import app, answer_cache
+from app.deadlines import DeadlineExceeded
 
 @pytest.fixture
 def client():
     app.config['TESTING'] = True
+    answer_cache.clear()
     with app.test_client() as client:
         yield client
 
@@ -22,3 +24,132 @@ def test_process_pdf_success(client, mocker):
     json_response = response.get_json()
     assert json_response["llm_response"] == {"key": "value"}
     assert json_response["ocr_confidence_score"] == 0.95
+
+def test_process_pdf_timings(client, mocker):
+    mocker.patch("app.api.OCR.extract_text_from_pdf", return_value=("Sample text", 0.95))
+    mocker.patch("app.api.LLM.query_claude", return_value={"name": "ACME"})
+
+    data = {
+        "questions": '[{"field_name": "name", "question": "What is the name?"}]',
+        "timings": "true",
+    }
+    with open("1.pdf", "rb") as pdf_file:
+        data["file"] = pdf_file
+        response = client.post("/process-pdf", data=data, content_type="multipart/form-data")
+
+    assert response.status_code == 200
+    assert "ocr;dur=" in response.headers["Server-Timing"]
+    assert "llm;dur=" in response.headers["Server-Timing"]
+    timings = response.get_json()["timings"]
+    assert set(timings["stages_ms"]) == {"ocr", "pre_extract", "llm"}
+    assert timings["total_ms"] >= 0
+
+def test_metrics_endpoint(client, mocker):
+    mocker.patch("app.api.OCR.extract_text_from_pdf", return_value=("Sample text", 0.95))
+    mocker.patch("app.api.LLM.query_claude", return_value={"name": "ACME"})
+
+    data = {"questions": '[{"field_name": "name", "question": "What is the name?"}]'}
+    with open("1.pdf", "rb") as pdf_file:
+        data["file"] = pdf_file
+        client.post("/process-pdf", data=data, content_type="multipart/form-data")
+
+    response = client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    body = response.get_data(as_text=True)
+    assert 'pdf_requests_total{status="200"}' in body
+    assert 'pipeline_stage_duration_seconds_count{stage="ocr"}' in body
+
+def test_process_pdf_reuses_cached_fields(client, mocker):
+    mock_ocr = mocker.patch("app.api.OCR.extract_text_from_pdf", return_value=("Sample text", 0.95))
+    mock_llm = mocker.patch("app.api.LLM.query_claude", side_effect=[{"name": "ACME"}, {"date": "2024-01-01"}, {}])
+
+    def post(questions):
+        with open("1.pdf", "rb") as pdf_file:
+            data = {"questions": questions, "file": pdf_file}
+            return client.post("/process-pdf", data=data, content_type="multipart/form-data").get_json()
+
+    first = post('[{"field_name": "name", "question": "name"}]')
+    second = post('[{"field_name": "name", "question": "name"}, {"field_name": "date", "question": "date"}]')
+
+    assert first["field_sources"] == {"name": "llm"}
+    assert second["name"] == "ACME" and second["date"] == "2024-01-01"
+    assert second["field_sources"] == {"name": "cache", "date": "llm"}
+    assert second["ocr_confidence_score"] == 0.95
+
+    # The document is OCR'd once and the follow-up only asks for the new field
+    assert mock_ocr.call_count == 1
+    assert [q["field_name"] for q in mock_llm.call_args.args[1]] == ["date"]
+
+    # A field the LLM did not return is reported as missing rather than answered
+    third = post('[{"field_name": "name", "question": "name"}, {"field_name": "seller", "question": "seller"}]')
+    assert third["field_sources"] == {"name": "cache", "seller": "missing"}
+    assert "seller" not in third
+
+def test_process_pdf_skips_llm_when_rules_answer_everything(client, mocker):
+    mocker.patch("app.api.OCR.extract_text_from_pdf", return_value=("Certificate Issue Date: 15.03.2024", 0.95))
+    mock_llm = mocker.patch("app.api.LLM.query_claude")
+
+    data = {"questions": '[{"field_name": "CertificateIssueDate", "question": "CertificateIssueDate"}]'}
+    with open("1.pdf", "rb") as pdf_file:
+        data["file"] = pdf_file
+        response = client.post("/process-pdf", data=data, content_type="multipart/form-data")
+
+    json_response = response.get_json()
+    assert response.status_code == 200
+    assert json_response["CertificateIssueDate"] == "2024-03-15"
+    assert json_response["field_sources"] == {"CertificateIssueDate": "rules"}
+    mock_llm.assert_not_called()
+
+def test_process_pdf_page_selection(client, mocker):
+    mock_ocr = mocker.patch("app.api.OCR.extract_text_from_pdf", return_value=("Sample text", 0.95))
+    mocker.patch("app.api.LLM.query_claude", return_value={"name": "ACME"})
+    mocker.patch("app.uploads.page_count", return_value=3)
+
+    def post(pages):
+        with open("1.pdf", "rb") as pdf_file:
+            data = {"questions": '[{"field_name": "name", "question": "name"}]', "file": pdf_file, "pages": pages}
+            return client.post("/process-pdf", data=data, content_type="multipart/form-data")
+
+    response = post("2-3")
+    invalid = post("3-1")
+    out_of_range = [post("5"), post("1-4")]
+
+    assert response.status_code == 200
+    assert mock_ocr.call_args.kwargs["pages"] == [2, 3]
+    assert invalid.status_code == 400
+    assert invalid.get_json()["error_code"] == 109
+    assert [r.status_code for r in out_of_range] == [400, 400]
+    assert all(r.get_json()["error_code"] == 109 for r in out_of_range)
+    assert mock_ocr.call_count == 1
+
+    # A different page selection of the same document is OCR'd separately
+    post("1")
+    assert mock_ocr.call_count == 2
+
+def test_process_pdf_rejects_reserved_field_names(client, mocker):
+    mock_ocr = mocker.patch("app.api.OCR.extract_text_from_pdf")
+
+    data = {"questions": '[{"field_name": "name", "question": "name"}, {"field_name": "timings", "question": "time"}]'}
+    with open("1.pdf", "rb") as pdf_file:
+        data["file"] = pdf_file
+        response = client.post("/process-pdf", data=data, content_type="multipart/form-data")
+
+    assert response.status_code == 400
+    assert response.get_json()["error_code"] == 110
+    mock_ocr.assert_not_called()
+
+def test_process_pdf_deadline_exceeded(client, mocker):
+    mocker.patch("app.api.OCR.extract_text_from_pdf", side_effect=DeadlineExceeded("ocr.textract"))
+    mock_llm = mocker.patch("app.api.LLM.query_claude")
+
+    data = {"questions": '[{"field_name": "name", "question": "name"}]'}
+    with open("1.pdf", "rb") as pdf_file:
+        data["file"] = pdf_file
+        response = client.post("/process-pdf", data=data, content_type="multipart/form-data",
+                               headers={"X-Request-Timeout": "5"})
+
+    assert response.status_code == 504
+    assert response.get_json()["error_code"] == 108
+    mock_llm.assert_not_called()
@@ -0,0 +1,112 @@
+import pytest
+from unittest.mock import MagicMock
+from botocore.exceptions import ClientError, EndpointConnectionError
+from app.bedrock_pool import BedrockClientPool
+
+
+def _client_error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "InvokeModel")
+
+
+@pytest.fixture
+def pool():
+    """
+    Fixture to create a pool over two regions with mocked clients.
+    """
+    pool = BedrockClientPool(regions=["eu-west-3", "eu-central-1"], max_pool_connections=10, throttle_cooldown=30)
+    for stats in pool.regions:
+        stats.client = MagicMock()
+    return pool
+
+
+def test_pool_reads_regions_from_env(monkeypatch):
+    """
+    Test that regions come from BEDROCK_REGIONS and the client config is tuned.
+    """
+    monkeypatch.setenv("BEDROCK_REGIONS", "us-east-1, us-west-2")
+    monkeypatch.setenv("BEDROCK_MAX_POOL_CONNECTIONS", "25")
+    pool = BedrockClientPool()
+
+    assert [stats.region_name for stats in pool.regions] == ["us-east-1", "us-west-2"]
+    assert pool.region_name == "us-east-1"
+    assert pool.client_config.max_pool_connections == 25
+    assert pool.client_config.tcp_keepalive is True
+
+
+def test_invoke_model_prefers_faster_region(pool):
+    """
+    Test that calls go to the region with the lowest recent latency.
+    """
+    slow, fast = pool.regions
+    slow.latency, fast.latency = 5.0, 1.0
+
+    pool.invoke_model(modelId="model", body="{}")
+
+    fast.client.invoke_model.assert_called_once_with(modelId="model", body="{}")
+    slow.client.invoke_model.assert_not_called()
+    assert fast.calls == 1 and fast.in_flight == 0
+
+
+def test_invoke_model_fails_over_on_throttling(pool):
+    """
+    Test that a throttled region is cooled down and the call fails over.
+    """
+    first, second = pool.regions
+    first.client.invoke_model.side_effect = _client_error("ThrottlingException")
+    second.client.invoke_model.return_value = {"body": "ok"}
+
+    assert pool.invoke_model(modelId="model") == {"body": "ok"}
+    assert first.throttles == 1
+
+    # The throttled region is now ranked last even though it has no latency history
+    pool.invoke_model(modelId="model")
+    assert first.client.invoke_model.call_count == 1
+    assert second.client.invoke_model.call_count == 2
+
+
+def test_invoke_model_raises_when_all_regions_throttled(pool):
+    """
+    Test that the last throttling error is raised once every region has been tried.
+    """
+    for stats in pool.regions:
+        stats.client.invoke_model.side_effect = _client_error("ThrottlingException")
+
+    with pytest.raises(ClientError):
+        pool.invoke_model(modelId="model")
+
+
+def test_invoke_model_does_not_fail_over_on_other_errors(pool):
+    """
+    Test that non-throttling errors are raised without trying other regions.
+    """
+    first, second = pool.regions
+    first.client.invoke_model.side_effect = _client_error("ValidationException")
+
+    with pytest.raises(ClientError):
+        pool.invoke_model(modelId="model")
+    second.client.invoke_model.assert_not_called()
+    assert pool.stats()[0]["errors"] == 1
+
+
+def test_single_region_keeps_botocore_retries():
+    """
+    Test that botocore retries are only disabled when the pool can fail over to another region.
+    """
+    single = BedrockClientPool(regions=["eu-west-3"])
+    multi = BedrockClientPool(regions=["eu-west-3", "eu-central-1"])
+
+    assert single.client_config.retries == {"total_max_attempts": 3, "mode": "standard"}
+    assert multi.client_config.retries == {"total_max_attempts": 1, "mode": "standard"}
+
+
+def test_invoke_model_fails_over_on_connection_errors(pool):
+    """
+    Test that a connection failure in one region is retried in the next one.
+    """
+    first, second = pool.regions
+    first.latency, second.latency = 1.0, 2.0
+    first.client.invoke_model.side_effect = EndpointConnectionError(endpoint_url="https://bedrock")
+    second.client.invoke_model.return_value = {"body": "ok"}
+
+    assert pool.invoke_model(modelId="model", body="{}") == {"body": "ok"}
+    assert first.errors == 1 and first.in_flight == 0
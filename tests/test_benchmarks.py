@@ -0,0 +1,48 @@
+import json
+import pytest
+from botocore.exceptions import ClientError
+from benchmarks.fakes import FakeBedrock, FakeTextract
+from benchmarks.run_benchmark import percentiles, count_pdf_pages, synthetic_pdf
+
+
+def test_fake_bedrock_answers_tool_call():
+    """
+    Test that the fake Bedrock backend answers a forced tool call with the requested fields.
+    """
+    body = json.dumps({
+        "messages": [{"role": "user", "content": "text"}],
+        "tools": [{"name": "record_answers", "input_schema": {"properties": {"CertificateAuditor": {}}}}],
+    })
+    response = json.loads(FakeBedrock().invoke_model(modelId="anthropic.claude", body=body)["body"].read())
+
+    assert response["content"][0]["input"] == {"CertificateAuditor": "fake answer"}
+    assert response["usage"]["input_tokens"] > 0
+
+
+def test_fake_backend_injects_throttling():
+    """
+    Test that a fake backend raises ThrottlingException at the configured rate.
+    """
+    textract = FakeTextract(throttle_rate=1.0)
+
+    with pytest.raises(ClientError) as error:
+        textract.analyze_document(Document={"S3Object": {"Bucket": "b", "Name": "pdf_image_1.png"}})
+    assert error.value.response["Error"]["Code"] == "ThrottlingException"
+    assert textract.stats() == {"calls": 1, "throttled": 1, "failed": 0}
+
+
+def test_synthetic_pdf_page_count():
+    """
+    Test that synthetic PDFs have the requested number of pages.
+    """
+    assert count_pdf_pages(synthetic_pdf(3)) == 3
+
+
+def test_percentiles():
+    """
+    Test the latency summary.
+    """
+    summary = percentiles(list(range(1, 101)))
+    assert summary["p50"] == 51
+    assert summary["p99"] == 100
+    assert summary["max"] == 100
@@ -0,0 +1,150 @@
+import io
+import os
+import json
+import httpx
+import pytest
+from unittest.mock import MagicMock
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+from app.s3_and_ocr_textract import TextractOCR
+from app.cassettes import Cassette, CassetteMiss, RecordedClient, RecordingTransport, Boto3Codec, build_cassette, recorded_client
+
+
+def _body(data):
+    return StreamingBody(io.BytesIO(data), len(data))
+
+
+def test_bedrock_call_is_recorded_and_replayed_with_scaled_latency(tmp_path, mocker):
+    """
+    Test that a recorded invoke_model response (body and headers) is served back on replay,
+    after the recorded latency times the scale, and that unknown calls miss.
+    """
+    path = str(tmp_path / "calls.jsonl.gz")
+    client = MagicMock()
+    client.invoke_model.return_value = {
+        "body": _body(b'{"content": []}'),
+        "ResponseMetadata": {"HTTPHeaders": {"x-amzn-bedrock-input-token-count": "12"}},
+    }
+    mocker.patch("app.cassettes.time.perf_counter", side_effect=[10.0, 12.5])
+    recorder = Cassette(path, "record")
+    response = RecordedClient("bedrock-runtime", client, ["invoke_model"], Boto3Codec(), recorder) \
+        .invoke_model(modelId="model", body="{}")
+    recorder.close()
+    assert response["body"].read() == b'{"content": []}'
+
+    mock_sleep = mocker.patch("app.cassettes.time.sleep")
+    replay = RecordedClient("bedrock-runtime", None, ["invoke_model"], Boto3Codec(), Cassette(path, "replay", 0.5))
+    replayed = replay.invoke_model(modelId="model", body="{}")
+
+    assert replayed["body"].read() == b'{"content": []}'
+    assert replayed["ResponseMetadata"]["HTTPHeaders"]["x-amzn-bedrock-input-token-count"] == "12"
+    mock_sleep.assert_called_once_with(1.25)
+    with pytest.raises(CassetteMiss):
+        replay.invoke_model(modelId="model", body='{"other": 1}')
+
+
+def test_textract_calls_are_matched_by_uploaded_content(tmp_path):
+    """
+    Test that Textract calls on per-request S3 keys replay the response recorded for the same page image.
+    """
+    path = str(tmp_path / "calls.jsonl.gz")
+    pages = {b"page-a": "A", b"page-b": "B"}
+
+    def run(cassette, textract, s3, contents):
+        ocr = TextractOCR.__new__(TextractOCR)
+        ocr.s3_bucket = "bucket"
+        ocr.textract_client = RecordedClient("textract", textract, ["analyze_document"], Boto3Codec(), cassette)
+        ocr.s3_client = RecordedClient("s3", s3, ["upload_file"], Boto3Codec(), cassette)
+        images = []
+        for i, content in enumerate(contents):
+            image = tmp_path / f"page_{i + 1}.png"
+            image.write_bytes(content)
+            images.append(str(image))
+        return [page[0][0] for page in ocr.analyze_pages(ocr.upload_images_to_s3(images))]
+
+    real_textract = MagicMock()
+    real_textract.analyze_document.side_effect = [{"Blocks": [{"BlockType": "LINE", "Text": text, "Confidence": 99}]}
+                                                  for text in pages.values()]
+    recorder = Cassette(path, "record")
+    assert run(recorder, real_textract, MagicMock(), list(pages)) == ["A", "B"]
+    recorder.close()
+
+    replay = Cassette(path, "replay", latency_scale=0)
+    assert run(replay, None, None, [b"page-b", b"page-a"]) == ["B", "A"]
+
+
+def test_client_errors_are_replayed(tmp_path):
+    """
+    Test that a recorded ClientError (e.g. throttling) is raised again on replay.
+    """
+    path = str(tmp_path / "calls.jsonl.gz")
+    client = MagicMock()
+    client.invoke_model.side_effect = ClientError({"Error": {"Code": "ThrottlingException", "Message": "slow down"}},
+                                                  "InvokeModel")
+    recorder = Cassette(path, "record")
+    with pytest.raises(ClientError):
+        RecordedClient("bedrock-runtime", client, ["invoke_model"], Boto3Codec(), recorder).invoke_model(modelId="m")
+    recorder.close()
+
+    replay = Cassette(path, "replay", latency_scale=0)
+    with pytest.raises(ClientError) as error:
+        RecordedClient("bedrock-runtime", None, ["invoke_model"], Boto3Codec(), replay).invoke_model(modelId="m")
+    assert error.value.response["Error"]["Code"] == "ThrottlingException"
+
+
+def test_http_exchanges_are_recorded_and_replayed(tmp_path):
+    """
+    Test that OpenAI HTTP exchanges are matched by JSON body regardless of key order or headers.
+    """
+    path = str(tmp_path / "calls.jsonl.gz")
+    upstream = httpx.MockTransport(lambda request: httpx.Response(200, json={"id": "chatcmpl-1"}))
+    recorder = Cassette(path, "record")
+    with httpx.Client(transport=RecordingTransport(recorder, transport=upstream)) as client:
+        client.post("https://api.openai.com/v1/chat/completions", json={"model": "gpt-4o", "temperature": 0.5},
+                    headers={"Authorization": "Bearer real-key"})
+    recorder.close()
+
+    replay = Cassette(path, "replay", latency_scale=0)
+    with httpx.Client(transport=RecordingTransport(replay)) as client:
+        response = client.post("https://api.openai.com/v1/chat/completions",
+                               content=json.dumps({"temperature": 0.5, "model": "gpt-4o"}),
+                               headers={"Authorization": "Bearer dummy"})
+    assert response.status_code == 200
+    assert response.json() == {"id": "chatcmpl-1"}
+
+
+def test_recorded_client_is_plain_when_recording_is_off(monkeypatch):
+    """
+    Test that clients are returned unwrapped when PROVIDER_RECORD_MODE is off.
+    """
+    monkeypatch.delenv("PROVIDER_RECORD_MODE", raising=False)
+    client = object()
+    assert recorded_client("s3", lambda: client, ["upload_file"]) is client
+
+
+def test_tracked_objects_are_bounded(tmp_path, mocker):
+    """
+    Test that only the most recent uploads are remembered for fingerprinting.
+    """
+    mocker.patch("app.cassettes.MAX_TRACKED_OBJECTS", 2)
+    cassette = Cassette(str(tmp_path / "calls.jsonl.gz"), "record")
+    for key in ("a", "b", "c"):
+        cassette.remember_object("bucket", key, key * 64)
+    cassette.close()
+
+    assert cassette.object_content("bucket", "a") is None
+    assert cassette.object_content("bucket", "c") == "c" * 64
+
+
+def test_default_cassette_is_per_process(monkeypatch, tmp_path):
+    """
+    Test that, without PROVIDER_CASSETTE, each recording process writes its own file.
+    """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("PROVIDER_RECORD_MODE", "record")
+    monkeypatch.delenv("PROVIDER_CASSETTE", raising=False)
+    cassette = build_cassette()
+    cassette.close()
+
+    assert cassette.path == os.path.join("cassettes", f"providers_{os.getpid()}.jsonl.gz")
+
@@ -0,0 +1,27 @@
+import pytest
+from app.deadlines import Deadline, DeadlineExceeded, request_deadline
+
+
+def test_request_deadline_from_header_and_config():
+    """
+    Test that the X-Request-Timeout header sets the deadline, capped by the configured timeout.
+    """
+    assert request_deadline({}, default_timeout=0) is None
+    assert request_deadline({"X-Request-Timeout": "30"}, default_timeout=0).timeout == 30
+    assert request_deadline({"X-Request-Timeout": "300"}, default_timeout=60).timeout == 60
+    assert request_deadline({"X-Request-Timeout": "soon"}, default_timeout=60).timeout == 60
+
+
+def test_deadline_check():
+    """
+    Test the remaining budget and that an expired deadline raises with the stage name.
+    """
+    deadline = Deadline(10)
+    assert deadline.allows(5) and not deadline.allows(20)
+    deadline.check("ocr")
+
+    with pytest.raises(DeadlineExceeded, match="during llm"):
+        Deadline(0).check("llm")
+
+    # Not swallowed by the stages' `except Exception` handlers
+    assert not issubclass(DeadlineExceeded, Exception)
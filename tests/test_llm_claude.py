@@ -1,5 +1,7 @@
+import json
 import pytest
 from app.llm_claude import ClaudeBedrockAPI
+from app.deadlines import Deadline, DeadlineExceeded
 
 @pytest.fixture
 def claude_instance():
@@ -107,3 +109,35 @@ def test_query_claude_retries(mocker, claude_instance):
 
     # Verify retry attempts
     assert mock_bedrock_client.call_count == 3
+
+def test_query_claude_tool_use(mocker, claude_instance):
+    """
+    Test query_claude requests a forced tool call and reads the answers from the tool input.
+    """
+    mock_bedrock_client = mocker.patch.object(claude_instance.bedrock_client, "invoke_model")
+    mock_bedrock_client.return_value = {
+        'body': mocker.Mock(read=lambda: b'{"content": [{"type": "tool_use", "name": "record_answers", "input": {"name": "ACME"}}]}')
+    }
+
+    questions = [{"field_name": "name", "question": "What is the name?"}]
+    response = claude_instance.query_claude("Sample text", questions)
+
+    assert response == {"name": "ACME"}
+    request_body = json.loads(mock_bedrock_client.call_args.kwargs["body"])
+    assert request_body["tool_choice"] == {"type": "tool", "name": "record_answers"}
+    assert request_body["tools"][0]["input_schema"]["required"] == ["name"]
+
+def test_query_claude_skips_retry_past_deadline(mocker, claude_instance):
+    """
+    Test that query_claude does not sleep and retry when the retry cannot finish before the deadline.
+    """
+    mock_bedrock_client = mocker.patch.object(claude_instance.bedrock_client, "invoke_model")
+    mock_bedrock_client.side_effect = Exception("Simulated Bedrock failure")
+    mock_sleep = mocker.patch("app.llm_claude.time.sleep")
+
+    questions = [{"field_name": "name", "question": "What is the name?"}]
+    with pytest.raises(DeadlineExceeded):
+        claude_instance.query_claude("Sample text", questions, retry_delay=2, deadline=Deadline(1))
+
+    assert mock_bedrock_client.call_count == 1
+    mock_sleep.assert_not_called()
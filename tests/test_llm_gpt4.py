@@ -1,6 +1,8 @@
+import time
 import pytest
 from unittest.mock import MagicMock, patch
 from app.llm_gpt4 import GPT4LLM
+from app.deadlines import Deadline, DeadlineExceeded
 
 @pytest.fixture
 def gpt4_instance():
@@ -74,3 +76,37 @@ def test_query_gpt4_error(mocker, gpt4_instance):
 
     # Assert the result is None due to error
     assert result is None
+
+
+def test_query_gpt4_reuses_chain_for_same_questions(mocker, gpt4_instance):
+    """
+    Test that the prompt template and chain are built once per question set.
+    """
+    mock_prompt_template = mocker.patch("app.llm_gpt4.ChatPromptTemplate.from_template")
+    mock_chain = MagicMock()
+    mock_chain.invoke.return_value = {"name": "Transaction Certificate"}
+    mock_prompt_template.return_value.__or__.return_value.__or__.return_value = mock_chain
+    questions = [{"field_name": "name", "question": "What is the certificate name?"}]
+
+    gpt4_instance.query_gpt4("First document", questions)
+    gpt4_instance.query_gpt4("Second document", questions)
+
+    assert mock_prompt_template.call_count == 1
+    assert mock_chain.invoke.call_args.args[0]["extracted_text"] == "Second document"
+
+
+def test_query_gpt4_applies_request_deadline(mocker, gpt4_instance):
+    """
+    Test that the API call gets the remaining time as timeout and that an overrun is reported.
+    """
+    mock_prompt_template = mocker.patch("app.llm_gpt4.ChatPromptTemplate.from_template")
+    mock_chain = MagicMock()
+    mock_chain.invoke.side_effect = lambda input_data: time.sleep(0.1) or {"name": "late"}
+    mock_prompt_template.return_value.__or__.return_value.__or__.return_value = mock_chain
+    questions = [{"field_name": "name", "question": "What is the certificate name?"}]
+
+    with pytest.raises(DeadlineExceeded):
+        gpt4_instance.query_gpt4("Document", questions, deadline=Deadline(0.05))
+
+    bound_model = mock_prompt_template.return_value.__or__.call_args.args[0]
+    assert 0 < bound_model.kwargs["timeout"] <= 0.05
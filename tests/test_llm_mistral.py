@@ -13,3 +13,7 @@ def test_clean_and_validate_json_invalid(mistral_instance):
     invalid_json = '{"key": "value",}'
     cleaned_json = mistral_instance._remove_trailing_commas(invalid_json)
     assert mistral_instance._clean_and_validate_json(cleaned_json) == {"key": "value"}
+
+def test_clean_and_validate_json_truncated(mistral_instance):
+    truncated_json = 'Answer: {"key": "value", "shipments": [{"ShipmentNumber": 1'
+    assert mistral_instance._clean_and_validate_json(truncated_json) == {"key": "value"}  # The unfinished list is dropped
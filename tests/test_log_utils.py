@@ -0,0 +1,59 @@
+import json
+import logging
+from app import log_utils
+from app.log_utils import Preview, PayloadSink, log_payload
+
+
+def test_preview_truncates_long_text():
+    """
+    Test that previews are capped and report how much was cut.
+    """
+    assert str(Preview("a" * 20, limit=5)) == "aaaaa... [15 more chars]"
+    assert str(Preview("short", limit=50)) == "short"
+    assert str(Preview({"key": "value"}, limit=50)) == "{'key': 'value'}"
+
+
+def test_preview_is_lazy():
+    """
+    Test that the payload is not converted to a string when the level is disabled.
+    """
+    class Exploding:
+        def __str__(self):
+            raise AssertionError("formatted eagerly")
+
+    quiet_logger = logging.getLogger("tests.quiet")
+    quiet_logger.setLevel(logging.WARNING)
+    log_payload(quiet_logger, "Payload", Exploding())
+
+
+def test_payload_sink_rate_limit(tmp_path):
+    """
+    Test that the sink writes full payloads until its per-minute budget is spent.
+    """
+    sink_path = tmp_path / "payloads.jsonl"
+    sink = PayloadSink(path=str(sink_path), max_per_minute=2)
+
+    assert sink.write("app.llm_claude", "Claude Full Response", {"content": "x" * 1000})
+    assert sink.write("app.llm_claude", "Claude Full Response", "second")
+    assert not sink.write("app.llm_claude", "Claude Full Response", "third")
+
+    records = [json.loads(line) for line in sink_path.read_text().splitlines()]
+    assert len(records) == 2
+    assert records[0]["payload"] == {"content": "x" * 1000}
+    assert sink.dropped == 1
+
+
+def test_log_payload_samples_to_sink(tmp_path, monkeypatch, caplog):
+    """
+    Test that the log line is a preview while the sampled sink gets the full payload.
+    """
+    sink_path = tmp_path / "payloads.jsonl"
+    monkeypatch.setattr(log_utils, "payload_sink", PayloadSink(path=str(sink_path), max_per_minute=10))
+    monkeypatch.setenv("LOG_PAYLOAD_SAMPLE_RATE", "1")
+    monkeypatch.setenv("LOG_PREVIEW_CHARS", "10")
+
+    with caplog.at_level(logging.INFO):
+        log_payload(logging.getLogger("tests.payload"), "Extracted Text", "y" * 100)
+
+    assert "Extracted Text: yyyyyyyyyy... [90 more chars]" in caplog.text
+    assert json.loads(sink_path.read_text())["payload"] == "y" * 100
@@ -0,0 +1,100 @@
+import os
+import subprocess
+from app.metrics import MetricsRegistry, Counter, Gauge, Histogram
+
+
+def test_exposition_format():
+    """
+    Test that counters, gauges and histograms render in the Prometheus text format.
+    """
+    registry = MetricsRegistry()
+    tokens = Counter('llm_tokens_total', 'LLM tokens.', ['provider', 'direction'], registry=registry)
+    in_progress = Gauge('in_progress', 'In progress.', registry=registry)
+    latency = Histogram('stage_seconds', 'Stage latency.', ['stage'], buckets=(0.1, 1, float('inf')), registry=registry)
+
+    tokens.inc(100, provider='claude', direction='input')
+    tokens.inc(20, provider='claude', direction='input')
+    in_progress.inc()
+    latency.observe(0.05, stage='ocr')
+    latency.observe(0.5, stage='ocr')
+    latency.observe(3, stage='ocr')
+
+    text = registry.exposition()
+
+    assert '# TYPE llm_tokens_total counter' in text
+    assert 'llm_tokens_total{provider="claude",direction="input"} 120' in text
+    assert 'in_progress 1' in text
+    assert 'stage_seconds_bucket{stage="ocr",le="0.1"} 1' in text
+    assert 'stage_seconds_bucket{stage="ocr",le="1"} 2' in text
+    assert 'stage_seconds_bucket{stage="ocr",le="+Inf"} 3' in text
+    assert 'stage_seconds_sum{stage="ocr"} 3.55' in text
+    assert 'stage_seconds_count{stage="ocr"} 3' in text
+
+
+def test_multiprocess_snapshots_are_merged(tmp_path):
+    """
+    Test that snapshots written by several workers are summed on collection.
+    """
+    workers = []
+    for _ in range(2):
+        registry = MetricsRegistry(multiproc_dir=str(tmp_path))
+        counter = Counter('requests_total', 'Requests.', ['status'], registry=registry)
+        histogram = Histogram('latency_seconds', 'Latency.', buckets=(1, float('inf')), registry=registry)
+        counter.inc(status=200)
+        histogram.observe(0.5)
+        workers.append(registry)
+
+    # Simulate two live worker processes writing distinct snapshot files
+    processes = [subprocess.Popen(["sleep", "30"]) for _ in workers]
+    try:
+        for registry, process in zip(workers, processes):
+            registry.maybe_flush(force=True)
+            os.rename(registry._snapshot_path(), tmp_path / f"metrics_{process.pid}_worker.json")
+
+        merged = MetricsRegistry(multiproc_dir=str(tmp_path)).collect()
+    finally:
+        for process in processes:
+            process.kill()
+            process.wait()
+
+    assert merged['requests_total']['samples'] == [[['200'], 2]]
+    assert merged['latency_seconds']['samples'][0][1][-1] == 2
+
+
+def test_dead_worker_snapshots_are_retired(tmp_path):
+    """
+    Test that a dead worker's counters are kept in the tombstone while its gauges are dropped.
+    """
+    dead = MetricsRegistry(multiproc_dir=str(tmp_path))
+    Counter('requests_total', 'Requests.', registry=dead).inc(3)
+    Gauge('in_progress', 'In progress.', registry=dead).inc(5)
+    dead.maybe_flush(force=True)
+    process = subprocess.Popen(["true"])
+    process.wait()
+    os.rename(dead._snapshot_path(), tmp_path / f"metrics_{process.pid}_old.json")
+
+    live = MetricsRegistry(multiproc_dir=str(tmp_path))
+    Counter('requests_total', 'Requests.', registry=live).inc(1)
+    Gauge('in_progress', 'In progress.', registry=live).inc(1)
+
+    for _ in range(2):  # Retired counters are not counted twice
+        merged = live.collect()
+        assert merged['requests_total']['samples'] == [[[], 4]]
+        assert merged['in_progress']['samples'] == [[[], 1]]
+    assert not (tmp_path / f"metrics_{process.pid}_old.json").exists()
+    assert (tmp_path / "dead_metrics.json").exists()
+
+
+def test_labels_are_validated():
+    """
+    Test that using the wrong label names is rejected.
+    """
+    registry = MetricsRegistry()
+    counter = Counter('errors_total', 'Errors.', ['error_code'], registry=registry)
+
+    try:
+        counter.inc(status=500)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Expected ValueError for unknown label")
@@ -1,4 +1,7 @@
+import io
+import gzip
 import pytest
+from PIL import Image
 from unittest.mock import patch, MagicMock
 from app.ocr_google import GoogleOCR
 
@@ -37,7 +40,7 @@ def test_extract_text_from_pdf(google_ocr_instance, mocker):
     # Set up the mock response for `process_document`
     mock_response = MagicMock()
     mock_response.document.text = "Extracted text"
-    mock_response.document.entities = [MagicMock(confidence=0.9)]
+    mock_response.document.entities = [MagicMock(confidence=0.9, page_anchor=MagicMock(page_refs=[MagicMock(page=0)]))]
     mock_response.document.pages = [MagicMock(blocks=[MagicMock(layout=MagicMock(confidence=0.9))])]
     mock_client.process_document.return_value = mock_response
 
@@ -47,3 +50,148 @@ def test_extract_text_from_pdf(google_ocr_instance, mocker):
     # Assertions
     assert text == "Extracted text"
     assert confidence == 0.9
+
+def test_extract_text_from_pdf_unanchored_entities(google_ocr_instance, mocker):
+    """
+    Test that entities without page anchors still give the document's confidence when nothing is cached.
+    """
+    google_ocr_instance.page_cache = None
+    mock_client = mocker.patch.object(google_ocr_instance, "documentai_client")
+    document = MagicMock(text="Extracted text", entities=[MagicMock(confidence=0.9, page_anchor=MagicMock(page_refs=[]))])
+    document.pages = [MagicMock(lines=[], blocks=[MagicMock(layout=MagicMock(confidence=0.5))])]
+    mock_client.process_document.return_value = MagicMock(document=document)
+
+    _, confidence = google_ocr_instance.extract_text_from_pdf(b"pdf-data")
+
+    assert confidence == 0.9
+
+def test_page_confidences_count_each_entity_once():
+    """
+    Test that an entity spanning pages counts on its first page, and pages without entities fall back to blocks.
+    """
+    document = MagicMock(entities=[MagicMock(confidence=0.8, page_anchor=MagicMock(
+        page_refs=[MagicMock(page=1), MagicMock(page=0)]))])
+    document.pages = [MagicMock(blocks=[MagicMock(layout=MagicMock(confidence=0.6))]) for _ in range(2)]
+
+    assert GoogleOCR._page_confidences(document, 0) == [0.8]
+    assert GoogleOCR._page_confidences(document, 1) == [0.6]
+
+def test_extract_text_from_pdf_compacts_lines(google_ocr_instance, mocker):
+    mock_client = mocker.patch.object(google_ocr_instance, "documentai_client")
+
+    def line(start, end, confidence):
+        segment = MagicMock(start_index=start, end_index=end)
+        return MagicMock(layout=MagicMock(confidence=confidence, text_anchor=MagicMock(text_segments=[segment])))
+
+    document = MagicMock()
+    document.text = "Header\nIssue Date: 12.03.2024\nHeader\nSeller: ACME\n"
+    document.entities = []
+    document.pages = [
+        MagicMock(lines=[line(0, 6, 0.99), line(7, 29, 0.98)], blocks=[MagicMock(layout=MagicMock(confidence=0.9))]),
+        MagicMock(lines=[line(30, 36, 0.99), line(37, 49, 0.97)], blocks=[MagicMock(layout=MagicMock(confidence=0.9))]),
+    ]
+    mock_client.process_document.return_value = MagicMock(document=document)
+
+    text, confidence = google_ocr_instance.extract_text_from_pdf(b"pdf-data")
+
+    assert text == "Header Issue Date: 12.03.2024 Seller: ACME"
+    assert confidence == 0.9
+
+def test_extract_text_from_pdf_selected_pages(google_ocr_instance, mocker, tmp_path):
+    mock_client = mocker.patch.object(google_ocr_instance, "documentai_client")
+
+    def line(start, end):
+        segment = MagicMock(start_index=start, end_index=end)
+        return MagicMock(layout=MagicMock(confidence=0.99, text_anchor=MagicMock(text_segments=[segment])))
+
+    document = MagicMock()
+    document.text = "Cover page\nIssue Date: 12.03.2024\nAnnex\n"
+    document.entities = []
+    document.pages = [
+        MagicMock(lines=[line(0, 10)], blocks=[MagicMock(layout=MagicMock(confidence=0.5))]),
+        MagicMock(lines=[line(11, 33)], blocks=[MagicMock(layout=MagicMock(confidence=0.9))]),
+        MagicMock(lines=[line(34, 39)], blocks=[MagicMock(layout=MagicMock(confidence=0.5))]),
+    ]
+    mock_client.process_document.return_value = MagicMock(document=document)
+    pdf_path = tmp_path / "upload.pdf"
+    pdf_path.write_bytes(b"pdf-data")
+
+    text, confidence = google_ocr_instance.extract_text_from_pdf(pdf_path, pages=[2])
+
+    assert text == "Issue Date: 12.03.2024"
+    assert confidence == 0.9
+    assert mock_client.process_document.call_args.kwargs["request"].raw_document.content == b"pdf-data"
+
+def test_extract_text_from_pdf_reuses_cached_pages(google_ocr_instance, mocker):
+    mock_client = mocker.patch.object(google_ocr_instance, "documentai_client")
+    google_ocr_instance.render_pool = None  # Render in-process so pdf2image can be mocked
+    original = [Image.new("RGB", (4, 4), "white"), Image.new("RGB", (4, 4), "black")]
+    revised = [Image.new("RGB", (4, 4), "white"), Image.new("RGB", (4, 4), "red")]
+    mocker.patch("app.render_pool.render_pages", side_effect=[original, revised])
+
+    def document(*texts):
+        text, pages = "", []
+        for page_text in texts:
+            segment = MagicMock(start_index=len(text), end_index=len(text) + len(page_text))
+            line = MagicMock(layout=MagicMock(confidence=0.9, text_anchor=MagicMock(text_segments=[segment])))
+            pages.append(MagicMock(lines=[line], blocks=[MagicMock(layout=MagicMock(confidence=0.9))]))
+            text += page_text + "\n"
+        return MagicMock(document=MagicMock(text=text, pages=pages, entities=[]))
+
+    mock_client.process_document.side_effect = [document("Issue Date: 12.03.2024", "Shipment 1"),
+                                                document("Shipment 2")]
+
+    google_ocr_instance.extract_text_from_pdf(b"original")
+    # A cold cache sends the original PDF, not the rendered pages
+    assert mock_client.process_document.call_args.kwargs["request"].raw_document.mime_type == "application/pdf"
+    text, confidence = google_ocr_instance.extract_text_from_pdf(b"revised")
+
+    request = mock_client.process_document.call_args.kwargs["request"]
+    assert request.raw_document.mime_type == "image/tiff"
+    assert Image.open(io.BytesIO(request.raw_document.content)).n_frames == 1
+    assert text == "Issue Date: 12.03.2024 Shipment 2"
+    assert confidence == 0.9
+
+
+def test_extract_text_from_pdf_sends_pdf_when_tiff_is_too_large(google_ocr_instance, mocker):
+    mock_client = mocker.patch.object(google_ocr_instance, "documentai_client")
+    google_ocr_instance.render_pool = None
+    google_ocr_instance.max_tiff_bytes = 0
+    mocker.patch("app.render_pool.render_pages", side_effect=[
+        [Image.new("RGB", (4, 4), "white"), Image.new("RGB", (4, 4), "black")],
+        [Image.new("RGB", (4, 4), "white"), Image.new("RGB", (4, 4), "red")]])
+
+    def document(*texts):
+        text, pages = "", []
+        for page_text in texts:
+            segment = MagicMock(start_index=len(text), end_index=len(text) + len(page_text))
+            line = MagicMock(layout=MagicMock(confidence=0.9, text_anchor=MagicMock(text_segments=[segment])))
+            pages.append(MagicMock(lines=[line], blocks=[MagicMock(layout=MagicMock(confidence=0.9))]))
+            text += page_text + "\n"
+        return MagicMock(document=MagicMock(text=text, pages=pages, entities=[]))
+
+    mock_client.process_document.side_effect = [document("Issue Date: 12.03.2024", "Shipment 1"),
+                                                document("Issue Date: 12.03.2024", "Shipment 2")]
+
+    google_ocr_instance.extract_text_from_pdf(b"original")
+    text, _ = google_ocr_instance.extract_text_from_pdf(b"revised")
+
+    assert mock_client.process_document.call_args.kwargs["request"].raw_document.content == b"revised"
+    assert text == "Issue Date: 12.03.2024 Shipment 2"
+
+def test_init_without_credentials_when_replaying(monkeypatch, mocker, tmp_path):
+    """
+    Test that GoogleOCR needs no credentials when Document AI calls are replayed from a cassette.
+    """
+    cassette_path = tmp_path / "providers.jsonl.gz"
+    with gzip.open(cassette_path, "wt"):
+        pass
+    monkeypatch.delenv("GOOGLE_APPLICATION_CREDENTIALS_JSON", raising=False)
+    monkeypatch.setenv("PROVIDER_RECORD_MODE", "replay")
+    monkeypatch.setenv("PROVIDER_CASSETTE", str(cassette_path))
+    mocker.patch("app.cassettes._cassette", None)
+
+    ocr = GoogleOCR()
+
+    assert ocr.documentai_client._client is None
+
@@ -0,0 +1,31 @@
+from PIL import Image
+from app.page_cache import PageCache, page_hash
+
+
+def test_page_hash_depends_on_content(tmp_path):
+    """
+    Test that identical renders hash alike, whether in memory or rendered to disk.
+    """
+    white, black = Image.new("RGB", (8, 8), "white"), Image.new("RGB", (8, 8), "black")
+    white.save(tmp_path / "page.ppm")
+
+    assert page_hash(white) == page_hash(Image.new("RGB", (8, 8), "white"))
+    assert page_hash(white) != page_hash(black)
+    assert page_hash(Image.open(tmp_path / "page.ppm")) == page_hash(Image.open(tmp_path / "page.ppm"))
+
+
+def test_lookup_returns_cached_entries_and_changed_pages():
+    """
+    Test that lookups report which pages need OCR and evict the least recently used page.
+    """
+    cache = PageCache(max_pages=2, ttl=0)
+    cache.put("a", [("Page A", 99.0)], [99.0])
+    cache.put("b", [("Page B", 98.0)], [98.0])
+
+    entries, changed = cache.lookup(["a", "c", "b"])
+    assert entries == [([("Page A", 99.0)], [99.0]), None, ([("Page B", 98.0)], [98.0])]
+    assert changed == [1]
+
+    cache.put("c", [], [])
+    assert cache.get("a") is None
+    assert cache.get("c") == ([], [])
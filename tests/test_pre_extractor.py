@@ -0,0 +1,92 @@
+import json
+import pytest
+from app.pre_extractor import RuleExtractor, normalize_date
+
+TEXT = (
+    "Transaction Certificate (TC) Certificate Number: CU-1234-TC "
+    "Certificate Issue Date: 15.03.2024 Invoice Issue Date: 16.03.2024 Valid from 1st March 2024 Valid until: February 28, 2025 "
+    "Shipment Date: 02.02.2024"
+)
+
+QUESTIONS = [
+    {"field_name": "CertificateIssueDate", "question": "Who is the CertificateIssueDate"},
+    {"field_name": "CertificateValidityStartDate", "question": "Who is the CertificateValidityStartDate"},
+    {"field_name": "CertificateValidityEndDate", "question": "Who is the CertificateValidityEndDate"},
+    {"field_name": "CertificateNumber", "question": "Who is the CertificateNumber"},
+    {"field_name": "CertificateAuditor", "question": "Who is the CertificateAuditor"},
+]
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2024-03-12", "2024-03-12"),
+    ("15.03.2024", "2024-03-15"),
+    ("15/03/24", "2024-03-15"),
+    ("03/25/2024", "2024-03-25"),
+    ("03.03.2024", "2024-03-03"),
+    ("03.04.2024", None),
+    ("12/03/24", None),
+    ("12 March 2024", "2024-03-12"),
+    ("1st Mar. 2024", "2024-03-01"),
+    ("March 12, 2024", "2024-03-12"),
+    ("31.02.2024", None),
+    ("12 Smarch 2024", None),
+])
+def test_normalize_date(value, expected):
+    """
+    Test normalization of common certificate date formats to YYYY-MM-DD.
+    """
+    assert normalize_date(value) == expected
+
+
+def test_extract_answers_confident_fields():
+    """
+    Test that label/value fields are extracted and unknown fields are left to the LLM.
+    """
+    answers = RuleExtractor(rules=None).extract(TEXT, QUESTIONS)
+
+    assert answers == {
+        "CertificateIssueDate": "2024-03-15",
+        "CertificateValidityStartDate": "2024-03-01",
+        "CertificateValidityEndDate": "2025-02-28",
+        "CertificateNumber": "CU-1234-TC",
+    }
+
+
+def test_conflicting_values_are_not_answered():
+    """
+    Test that a field with two different values is considered ambiguous.
+    """
+    text = "Issue Date: 15.03.2024 ... Issue Date: 16.03.2024"
+    assert RuleExtractor().extract_field("CertificateIssueDate", text) is None
+    assert RuleExtractor().extract_field("CertificateIssueDate", "Issue Date: 15.03.2024 Issue date 2024-03-15") == "2024-03-15"
+
+
+def test_ambiguous_and_qualified_values_are_not_answered():
+    """
+    Test that day/month-ambiguous dates and labels qualified by another word are left to the LLM.
+    """
+    assert RuleExtractor().extract_field("CertificateIssueDate", "Issue Date: 03.04.2024") is None
+    assert RuleExtractor().extract_field("CertificateIssueDate", "Invoice Issue Date: 15.03.2024") is None
+    assert RuleExtractor().extract_field("CertificateNumber", "Scope Certificate Number: CU-SC-1") is None
+
+
+def test_value_rule_without_capture_group_is_rejected():
+    """
+    Test that a custom value pattern must capture the value.
+    """
+    with pytest.raises(ValueError):
+        RuleExtractor(rules={"PoNumber": {"labels": [r"po\s+number"], "value": r"PO-\d+"}})
+
+
+def test_rules_file_extends_defaults(tmp_path, monkeypatch):
+    """
+    Test that PRE_EXTRACTOR_RULES adds per-field patterns.
+    """
+    rules_path = tmp_path / "rules.json"
+    rules_path.write_text(json.dumps({"ScopeCertificateNumber": {"labels": [r"SC\s+number"], "type": "identifier"}}))
+    monkeypatch.setenv("PRE_EXTRACTOR_RULES", str(rules_path))
+
+    extractor = RuleExtractor()
+
+    assert extractor.extract_field("ScopeCertificateNumber", "SC number: CU-SC-998877") == "CU-SC-998877"
+    assert "CertificateIssueDate" in extractor.patterns
@@ -0,0 +1,65 @@
+from app.prompt_builder import PLACEHOLDER, TRUNCATION_NOTICE, PromptBuilder, TokenCounter
+
+QUESTIONS = [{"field_name": "CertificateNumber", "question": "What is the certificate number?"}]
+
+
+def _render(calls):
+    def render(questions):
+        calls.append(questions)
+        return f"Header\n{PLACEHOLDER}\nQuestions: {questions[0]['question']}"
+    return render
+
+
+def test_compiled_prompt_is_reused_for_the_same_questions():
+    """
+    Test that the template is rendered once per question set and the document is spliced in.
+    """
+    calls = []
+    builder = PromptBuilder("anthropic.claude-3-5-sonnet", _render(calls), max_input_tokens=1000)
+
+    prompt, tokens = builder.build("CU 123456 issued 2024-03-12", QUESTIONS)
+    builder.build("another document", [dict(QUESTIONS[0])])
+
+    assert len(calls) == 1
+    assert prompt == "Header\nCU 123456 issued 2024-03-12\nQuestions: What is the certificate number?"
+    assert tokens == builder.counter.count("Header\n") + builder.counter.count(
+        "\nQuestions: What is the certificate number?") + builder.counter.count("CU 123456 issued 2024-03-12")
+
+
+def test_document_is_trimmed_to_the_input_budget():
+    """
+    Test that an oversized document is cut (keeping its beginning) so the prompt fits the budget.
+    """
+    builder = PromptBuilder("mistral.mistral-large", _render([]), max_input_tokens=200)
+    document = " ".join(f"line {i} of the certificate" for i in range(500))
+
+    prompt, tokens = builder.build(document, QUESTIONS, reserved_tokens=20)
+
+    assert tokens + 20 <= 200
+    assert prompt.startswith("Header\nline 0 of the certificate")
+    assert TRUNCATION_NOTICE in prompt
+
+
+def test_document_within_budget_is_untouched():
+    """
+    Test that a document that fits is passed through without a truncation notice.
+    """
+    builder = PromptBuilder("gpt-4o", _render([]), max_input_tokens=1000)
+
+    text, _, _ = builder.fit("short document", QUESTIONS)
+
+    assert text == "short document"
+
+
+def test_token_counter_calibration():
+    """
+    Test that measured token counts move the calibration factor, ignoring small prompts.
+    """
+    counter = TokenCounter("gpt-4o")
+    assert counter.count_raw("Certificate number: 123456") == 6
+
+    counter.calibrate(100, 300)
+    assert counter.calibration == 1.0
+
+    counter.calibrate(4000, 5000)
+    assert counter.calibration == 1.05
@@ -0,0 +1,40 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from app.render_pool import RenderPool
+
+
+def _write_page(path, fmt, page):
+    with open(path, "wb") as page_file:
+        page_file.write(f"page{page}".encode())
+
+
+def test_render_splits_pages_into_tasks_and_keeps_order(mocker, tmp_path):
+    """
+    Test that pages are rendered in tasks of pages_per_task pages and returned as PNG paths in page order.
+    """
+    mocker.patch("app.render_pool.page_count", return_value=5)
+    mock_render = mocker.patch("app.render_pool.render_pages", side_effect=lambda source, pages, output_folder: [
+        mocker.MagicMock(save=lambda path, fmt, page=page: _write_page(path, fmt, page)) for page in pages])
+    pool = RenderPool(workers=2, max_tasks_per_child=0, pages_per_task=2, prewarm=False)
+    pool._executor = ThreadPoolExecutor(max_workers=2)  # Share the mocks with the tasks
+
+    paths = pool.render(b"%PDF", str(tmp_path))
+    assert [os.path.basename(path) for path in paths] == [f"page_0000{page}.png" for page in range(1, 6)]
+    assert [open(path, "rb").read() for path in paths] == [b"page1", b"page2", b"page3", b"page4", b"page5"]
+    assert sorted(call.kwargs["pages"] for call in mock_render.call_args_list) == [[1, 2], [3, 4], [5]]
+    assert pool._tasks(b"%PDF", [2, 3, 4, 9]) == [(2, 3), (4, 4), (9, 9)]
+    pool.shutdown()
+
+
+def test_prewarm_starts_recycled_spawn_workers():
+    """
+    Test that pre-warming starts every worker process of a spawn pool with a task limit.
+    """
+    pool = RenderPool(workers=2, max_tasks_per_child=5, prewarm=True)
+    try:
+        executor = pool._executor
+        assert len(executor._processes) == 2
+        assert executor._max_tasks_per_child == 5
+        assert executor._mp_context.get_start_method() == "spawn"
+    finally:
+        pool.shutdown()
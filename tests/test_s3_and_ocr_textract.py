@@ -1,5 +1,7 @@
+import os
 import pytest
-from unittest.mock import MagicMock
+from unittest.mock import ANY, MagicMock
+from PIL import Image
 from app.s3_and_ocr_textract import TextractOCR
 
 
@@ -8,7 +10,9 @@ def textract_instance():
     """
     Fixture to create an instance of TextractOCR with a mocked region.
     """
-    return TextractOCR(region_name='eu-west-1')
+    instance = TextractOCR(region_name='eu-west-1')
+    instance.render_pool = None  # Render in-process so pdf2image can be mocked
+    return instance
 
 
 def test_convert_pdf_to_images(textract_instance, mocker):
@@ -16,7 +20,7 @@ def test_convert_pdf_to_images(textract_instance, mocker):
     Test convert_pdf_to_images to ensure it processes PDF files correctly.
     """
     # Mock the pdf2image convert_from_bytes method
-    mock_convert = mocker.patch("app.s3_and_ocr_textract.convert_from_bytes", return_value=["image1", "image2"])
+    mock_convert = mocker.patch("app.uploads.convert_from_bytes", return_value=["image1", "image2"])
 
     pdf_file = b"fake-pdf-content"
     images = textract_instance.convert_pdf_to_images(pdf_file)
@@ -41,7 +45,22 @@ def test_upload_images_to_s3(textract_instance, mocker):
     # Check that upload_file was called for each image
     assert mock_s3_client.call_count == len(images)
     assert len(uploaded_paths) == len(images)
-    assert all(path.startswith("pdf_image_") for path in uploaded_paths)
+    assert all("/pdf_image_" in path for path in uploaded_paths)
+    # Each call gets its own key prefix so concurrent requests never overwrite each other's pages
+    assert textract_instance.upload_images_to_s3([mock_image])[0].split("/")[0] != uploaded_paths[0].split("/")[0]
+
+
+def test_upload_images_to_s3_from_png_files(textract_instance, mocker, tmp_path):
+    """
+    Test that rendered PNG files are uploaded from disk as they are.
+    """
+    mock_s3_client = mocker.patch.object(textract_instance.s3_client, "upload_file")
+    page = tmp_path / "page_00001.png"
+    page.write_bytes(b"png")
+
+    uploaded_paths = textract_instance.upload_images_to_s3([page])
+
+    mock_s3_client.assert_called_once_with(Filename=str(page), Bucket=textract_instance.s3_bucket, Key=uploaded_paths[0])
 
 
 def test_extract_text_and_confidence(textract_instance, mocker):
@@ -66,23 +85,68 @@ def test_extract_text_and_confidence(textract_instance, mocker):
     assert text == "Test text Another line"
     assert confidence == 98.5  # Average of 99.0 and 98.0
 
+    mock_textract_client.side_effect = RuntimeError("textract down")
+    assert textract_instance.extract_text_and_confidence(image_paths) == (None, 0)  # Same as extract_text_from_pdf
+
 
 def test_extract_text_from_pdf(textract_instance, mocker):
     """
     Test extract_text_from_pdf to ensure the complete process works correctly.
     """
     # Mock individual methods
-    mock_convert = mocker.patch.object(textract_instance, "convert_pdf_to_images", return_value=["image1", "image2"])
+    images = [Image.new("RGB", (4, 4), "white"), Image.new("RGB", (4, 4), "black")]
+    mock_convert = mocker.patch("app.render_pool.render_pages", return_value=images)
     mock_upload = mocker.patch.object(textract_instance, "upload_images_to_s3", return_value=["s3://bucket/image1", "s3://bucket/image2"])
-    mock_extract = mocker.patch.object(textract_instance, "extract_text_and_confidence", return_value=("Extracted text", 90.0))
+    mock_analyze = mocker.patch.object(textract_instance, "analyze_pages", return_value=[
+        [("Extracted", 90.0)], [("text", 90.0)]])
 
     pdf_file = b"fake-pdf-content"
     text, confidence = textract_instance.extract_text_from_pdf(pdf_file)
 
     # Ensure methods were called in sequence
-    mock_convert.assert_called_once_with(pdf_file)
-    mock_upload.assert_called_once_with(["image1", "image2"])
-    mock_extract.assert_called_once_with(["s3://bucket/image1", "s3://bucket/image2"])
+    mock_convert.assert_called_once_with(pdf_file, pages=None, output_folder=ANY)
+    uploaded = mock_upload.call_args.args[0]
+    assert [os.path.basename(path) for path in uploaded] == ["page_00001.png", "page_00002.png"]
+    assert not os.path.exists(uploaded[0])  # The per-request scratch directory is removed
+    mock_analyze.assert_called_once_with(["s3://bucket/image1", "s3://bucket/image2"], deadline=None)
 
     assert text == "Extracted text"
     assert confidence == 90.0
+
+
+def test_extract_text_from_pdf_reuses_cached_pages(textract_instance, mocker):
+    """
+    Test that a revised document only sends its changed page to S3 and Textract, keeping page order.
+    """
+    original = [Image.new("RGB", (4, 4), "white"), Image.new("RGB", (4, 4), "black")]
+    revised = [Image.new("RGB", (4, 4), "white"), Image.new("RGB", (4, 4), "red")]
+    mocker.patch("app.render_pool.render_pages", side_effect=[original, revised])
+    mock_upload = mocker.patch.object(textract_instance, "upload_images_to_s3",
+                                      side_effect=[["page1.png", "page2.png"], ["page1.png"]])
+    mocker.patch.object(textract_instance, "analyze_pages", side_effect=[
+        [[("Issue Date: 12.03.2024", 99.0)], [("Shipment 1", 97.0)]],
+        [[("Shipment 2", 95.0)]],
+    ])
+
+    textract_instance.extract_text_from_pdf(b"original")
+    text, confidence = textract_instance.extract_text_from_pdf(b"revised")
+
+    assert [os.path.basename(path) for path in mock_upload.call_args.args[0]] == ["page_00002.png"]
+    assert text == "Issue Date: 12.03.2024 Shipment 2"
+    assert confidence == 97.0
+
+
+def test_convert_pdf_to_images_selected_pages(textract_instance, mocker, tmp_path):
+    """
+    Test that only the selected pages of a spooled upload are rendered, one call per contiguous run.
+    """
+    mock_convert = mocker.patch("app.uploads.convert_from_path", side_effect=[["p1", "p2"], ["p5"]])
+    pdf_path = tmp_path / "upload.pdf"
+    pdf_path.write_bytes(b"fake-pdf-content")
+
+    images = textract_instance.convert_pdf_to_images(pdf_path, pages=[1, 2, 5])
+
+    assert images == ["p1", "p2", "p5"]
+    assert mock_convert.call_args_list[0].kwargs == {"first_page": 1, "last_page": 2}
+    assert mock_convert.call_args_list[1].kwargs == {"first_page": 5, "last_page": 5}
+    assert mock_convert.call_args.args == (str(pdf_path),)
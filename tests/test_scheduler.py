@@ -0,0 +1,92 @@
+import time
+import threading
+import pytest
+from app.deadlines import Deadline, DeadlineExceeded
+from app.scheduler import FairScheduler, PipelineScheduler
+
+
+def _wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def _queued(scheduler):
+    return sum(stats["queued"] for stats in scheduler.stats().values())
+
+
+def test_interactive_first_and_round_robin_between_clients():
+    """
+    Test that a contended slot goes to the interactive class first and alternates between bulk clients.
+    """
+    scheduler = FairScheduler('ocr', 1, weights={'interactive': 4, 'bulk': 1}, max_shares={'bulk': 1.0})
+    scheduler.acquire('bulk', 'holder')
+    order = []
+
+    def worker(priority, client, name):
+        with scheduler.slot(priority, client):
+            order.append(name)
+
+    threads = []
+    for i, (priority, client, name) in enumerate([('bulk', 'A', 'a1'), ('bulk', 'A', 'a2'),
+                                                  ('bulk', 'B', 'b1'), ('interactive', 'C', 'i1')]):
+        threads.append(threading.Thread(target=worker, args=(priority, client, name)))
+        threads[-1].start()
+        _wait_until(lambda: _queued(scheduler) == i + 1)
+
+    scheduler.release('bulk')
+    for thread in threads:
+        thread.join(timeout=2)
+
+    assert order == ['i1', 'a1', 'b1', 'a2']
+    stats = scheduler.stats()
+    assert stats['bulk']['admitted'] == 4 and stats['interactive']['admitted'] == 1
+    assert stats['bulk']['queued'] == 0 and stats['bulk']['in_flight'] == 0
+    assert stats['bulk']['max_wait_ms'] >= stats['interactive']['max_wait_ms']
+
+
+def test_bulk_share_leaves_headroom_for_interactive():
+    """
+    Test that bulk requests cannot take more than their share of slots while interactive ones are admitted.
+    """
+    scheduler = FairScheduler('llm', 4, max_shares={'interactive': 1.0, 'bulk': 0.5})
+    scheduler.acquire('bulk', 'batch')
+    scheduler.acquire('bulk', 'batch')
+
+    blocked = threading.Thread(target=scheduler.acquire, args=('bulk', 'batch'))
+    blocked.start()
+    _wait_until(lambda: scheduler.stats()['bulk']['queued'] == 1)
+
+    assert scheduler.acquire('interactive', 'reviewer') < 0.5
+    assert scheduler.stats()['bulk']['in_flight'] == 2
+
+    scheduler.release('bulk')
+    blocked.join(timeout=2)
+    assert scheduler.stats()['bulk'] == dict(scheduler.stats()['bulk'], queued=0, in_flight=2)
+
+
+def test_classify_request():
+    """
+    Test priority and client resolution from headers, form values and the remote address.
+    """
+    scheduler = PipelineScheduler(ocr_concurrency=1, llm_concurrency=1, default_priority='interactive')
+
+    assert scheduler.classify({'X-Priority': 'Bulk', 'X-API-Key': 'key-1'}, {}) == ('bulk', 'key-1')
+    assert scheduler.classify({'X-Client-Id': 'backfill'}, {'priority': 'bulk'}) == ('bulk', 'backfill')
+    assert scheduler.classify({'X-Priority': 'urgent'}, {}, '10.0.0.1') == ('interactive', '10.0.0.1')
+
+
+def test_waiter_leaves_queue_when_deadline_passes():
+    """
+    Test that a queued request gives up at its deadline without taking a slot.
+    """
+    scheduler = FairScheduler('llm', 1)
+    scheduler.acquire('bulk', 'batch')
+
+    with pytest.raises(DeadlineExceeded, match="llm queue"):
+        scheduler.acquire('interactive', 'reviewer', deadline=Deadline(0.05))
+
+    assert scheduler.stats()['interactive']['queued'] == 0
+    scheduler.release('bulk')
+    assert scheduler.stats()['bulk']['in_flight'] == 0 and scheduler.stats()['interactive']['in_flight'] == 0
@@ -0,0 +1,55 @@
+import pytest
+from app.structured_output import build_answer_schema, build_claude_tool, build_openai_response_format, repair_json
+
+QUESTIONS = [
+    {"field_name": "CertificateAuditor", "question": "Who is the CertificateAuditor"},
+    {"field_name": "shipments", "question": "Who is the shipments", "type": "array"},
+]
+
+def test_build_answer_schema():
+    """
+    Test that every question becomes a required property of the schema.
+    """
+    schema = build_answer_schema(QUESTIONS)
+
+    assert schema["required"] == ["CertificateAuditor", "shipments"]
+    assert schema["properties"]["CertificateAuditor"] == {"description": "Who is the CertificateAuditor"}
+    assert schema["properties"]["shipments"]["type"] == ["array", "null"]
+
+def test_provider_formats_share_schema():
+    """
+    Test that the Claude tool and OpenAI response format wrap the same schema.
+    """
+    tool = build_claude_tool(QUESTIONS)
+    response_format = build_openai_response_format(QUESTIONS)
+
+    assert tool["input_schema"] == response_format["json_schema"]["schema"]
+    assert response_format["type"] == "json_schema"
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"key": "value"}', {"key": "value"}),
+    ('Here you go:\n```json\n{"key": "value",}\n```\nThanks', {"key": "value"}),
+    ("{'key': None, 'ok': True} trailing prose", {"key": None, "ok": True}),
+    ('{"key": NULL, // comment\n "list": [1, 2,]}', {"key": None, "list": [1, 2]}),
+    ('{"key": "value", "shipments": [{"ShipmentNumber": 1, "Date": "2024-', {"key": "value"}),
+    ('{"a": [1, 2', {}),
+    ('{"a": [1, 2], "b": "done"', {"a": [1, 2], "b": "done"}),
+    ('{"key": "value", "Weight": 10', {"key": "value"}),
+    ('{"key": "value", "dangling', {"key": "value"}),
+    ('{key: "v", other_key: [1]}', {"key": "v", "other_key": [1]}),
+    ('{nom: "Élodie"}', {"nom": "Élodie"}),
+    ('{"a": é}', None),
+    ('{"name": "ok", nom: Élodie}', None),
+])
+def test_repair_json(text, expected):
+    """
+    Test that repair_json salvages common malformed model outputs.
+    """
+    assert repair_json(text) == expected
+
+def test_repair_json_no_object():
+    """
+    Test that repair_json returns None when there is no JSON object.
+    """
+    assert repair_json("I could not find the answers.") is None
+    assert repair_json("") is None
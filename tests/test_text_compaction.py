@@ -0,0 +1,84 @@
+from app.text_compaction import TextCompactor
+
+
+def _compactor(**kwargs):
+    options = dict(min_confidence=40, repeat_ratio=0.6, edge_lines=2, boilerplate_patterns=None)
+    options.update(kwargs)
+    return TextCompactor(**options)
+
+
+def test_repeated_headers_and_footers_are_kept_once():
+    """
+    Test that header/footer lines repeated on every page survive only on the first page.
+    """
+    pages = [
+        [("GOTS Transaction Certificate", 99), ("Shipment 1: 100 kg", 98), ("Control Union Certifications", 99)],
+        [("GOTS Transaction Certificate", 99), ("Shipment 2: 200 kg", 98), ("Control Union Certifications", 99)],
+        [("GOTS Transaction Certificate", 99), ("Shipment 3: 300 kg", 98), ("Control Union Certifications", 99)],
+    ]
+
+    text, stats = _compactor().compact(pages)
+
+    assert text == ("GOTS Transaction Certificate Shipment 1: 100 kg Control Union Certifications "
+                    "Shipment 2: 200 kg Shipment 3: 300 kg")
+    assert stats["repeated"] == 4
+    assert stats["chars_saved"] > 0
+    assert stats["tokens_saved"] == stats["chars_saved"] // 4
+
+
+def test_noise_low_confidence_and_page_numbers_are_dropped():
+    """
+    Test whitespace collapsing and removal of garbage, low-confidence and page-number lines.
+    """
+    pages = [[
+        ("Certificate   Issue Date:\t12.03.2024", 97.0),
+        ("|||  --- ~~", 60.0),
+        ("x7#kq", 12.0),
+        ("Page 1 of 2", 99.0),
+        ("Seller: ACME Textiles", None),
+    ]]
+
+    text, stats = _compactor().compact(pages)
+
+    assert text == "Certificate Issue Date: 12.03.2024 Seller: ACME Textiles"
+    assert (stats["noise"], stats["low_confidence"], stats["boilerplate"]) == (1, 1, 1)
+
+
+def test_repeated_body_lines_are_kept():
+    """
+    Test that identical lines in the middle of pages (e.g. table rows) are not stripped.
+    """
+    pages = [
+        [("Header", 99), ("Row A", 99), ("Cotton 100 kg", 99), ("Row B", 99), ("Footer", 99)],
+        [("Header", 99), ("Row C", 99), ("Cotton 100 kg", 99), ("Row D", 99), ("Footer", 99)],
+    ]
+
+    text, _ = _compactor(edge_lines=1).compact(pages)
+
+    assert text.count("Cotton 100 kg") == 2
+    assert text.count("Header") == 1 and text.count("Footer") == 1
+
+
+def test_repeated_edge_lines_are_kept_in_the_body():
+    """
+    Test that a repeated header line is only stripped within the edge window, not where it appears in the body.
+    """
+    pages = [
+        [("ACME Textiles", 99), ("Seller:", 99), ("ACME Textiles", 99), ("Row A", 99), ("Footer", 99)],
+        [("ACME Textiles", 99), ("Row B", 99), ("Footer", 99)],
+    ]
+
+    text, stats = _compactor(edge_lines=1).compact(pages)
+
+    assert text == "ACME Textiles Seller: ACME Textiles Row A Footer Row B"
+    assert stats["repeated"] == 2
+
+
+def test_compact_text_collapses_whitespace():
+    """
+    Test the whitespace-only fallback.
+    """
+    text, stats = _compactor().compact_text("Extracted \n\n  text ")
+
+    assert text == "Extracted text"
+    assert stats["chars_saved"] == 5
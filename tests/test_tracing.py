@@ -0,0 +1,44 @@
+from app import tracing
+
+
+def test_span_records_on_active_trace():
+    """
+    Test that spans and counters are collected on the active trace and summed per stage.
+    """
+    with tracing.trace_request("req-1") as trace:
+        with tracing.span("llm.claude"):
+            pass
+        with tracing.span("llm.claude"):
+            pass
+        tracing.add_count("llm.input_tokens", 120)
+        tracing.add_count("llm.input_tokens", 30)
+
+    assert tracing.current_trace() is None
+    assert list(trace.stage_durations()) == ["llm.claude"]
+    assert len(trace.spans) == 2
+    assert trace.counters == {"llm.input_tokens": 150}
+
+    record = trace.to_log_record(status=200)
+    assert record["request_id"] == "req-1"
+    assert record["status"] == 200
+    assert record["counters"] == {"llm.input_tokens": 150}
+
+
+def test_span_without_trace_is_noop():
+    """
+    Test that instrumentation outside a request does nothing.
+    """
+    with tracing.span("ocr.render"):
+        tracing.add_count("ocr.pages", 2)
+    assert tracing.current_trace() is None
+
+
+def test_server_timing_header():
+    """
+    Test the Server-Timing header format.
+    """
+    with tracing.trace_request() as trace:
+        trace.add_span("ocr", 0.25)
+        header = trace.server_timing_header()
+
+    assert header.startswith("ocr;dur=250.0, total;dur=")
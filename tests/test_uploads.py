@@ -0,0 +1,41 @@
+import io
+import os
+import hashlib
+import pytest
+from app.uploads import SpooledUpload, page_runs, parse_pages, read_pdf
+
+
+def test_parse_pages():
+    """
+    Test that page selections are parsed into sorted, de-duplicated page numbers.
+    """
+    assert parse_pages("3, 1-2,2") == [1, 2, 3]
+    assert parse_pages("") is None
+    assert parse_pages(None) is None
+    for invalid in ("0", "3-1", "a-b", "1,,2"):
+        with pytest.raises(ValueError):
+            parse_pages(invalid)
+    with pytest.raises(ValueError):
+        parse_pages("1-1000", max_pages=500)
+
+
+def test_page_runs():
+    """
+    Test that pages are grouped into contiguous runs for the renderer.
+    """
+    assert page_runs([1, 2, 3, 5, 7, 8]) == [(1, 3), (5, 5), (7, 8)]
+
+
+def test_spooled_upload_is_chunked_hashed_and_removed(tmp_path):
+    """
+    Test that the upload is copied to the spool directory in chunks, hashed, and deleted on close.
+    """
+    content = b"%PDF-1.4 " + os.urandom(10000)
+
+    with SpooledUpload(io.BytesIO(content), spool_dir=str(tmp_path), chunk_size=4096) as upload:
+        assert os.path.dirname(upload.path) == str(tmp_path)
+        assert upload.size == len(content)
+        assert upload.sha256 == hashlib.sha256(content).hexdigest()
+        assert read_pdf(upload) == content
+
+    assert not os.path.exists(upload.path)